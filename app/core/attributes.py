@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 from typing import Dict
-from .config import USE_OPENAI, oai_client
+from .llm import llm
+from .llm_cache import llm_cache
+from .singleflight import SingleFlight
 
 # Кэш «один раз на запуск» для базовых статов каждого класса
 _BASE_STATS_CACHE: Dict[str, Dict[str, int]] = {}
+# Одновременные одинаковые запросы к LLM склеиваются в один
+_FLIGHTS = SingleFlight()
+# Удачные ответы LLM живут на диске между рестартами (версию поднимать при смене разбора)
+_BASE_DISK = llm_cache.namespace("base_stats", version="1")
+_LEVELUP_DISK = llm_cache.namespace("levelup", version="1")
 
 # Фолбэк-базы (если ChatGPT недоступен)
 FALLBACK_BASE = {
@@ -35,14 +42,19 @@ def _safe_int(v, default=0):
 async def get_base_stats_for_class(class_key: str) -> Dict[str, int]:
     """
     Возвращает базовые статы для класса. Если ещё не генерировали — просим ChatGPT один раз
-    (и кэшируем на процесс), иначе берём из кэша. При недоступности — FALLBACK_BASE.
+    (и кэшируем на процесс и на диск), иначе берём из кэша. При недоступности — FALLBACK_BASE.
     Правила: сумма 16–20, логичная специализация (маг=инт, лучник=ловк, мечник=сила и т.д.).
     Формат строго: JSON {"str":X,"dex":Y,"int":Z,"end":W}
     """
     if class_key in _BASE_STATS_CACHE:
         return _BASE_STATS_CACHE[class_key]
+    return await _FLIGHTS.do(("base", class_key), lambda: _generate_base_stats(class_key))
 
-    if not USE_OPENAI or oai_client is None:
+async def _generate_base_stats(class_key: str) -> Dict[str, int]:
+    if class_key in _BASE_STATS_CACHE:
+        return _BASE_STATS_CACHE[class_key]
+
+    if not llm.enabled:
         _BASE_STATS_CACHE[class_key] = FALLBACK_BASE.get(class_key, {"str": 4, "dex": 4, "int": 4, "end": 4})
         return _BASE_STATS_CACHE[class_key]
 
@@ -52,17 +64,21 @@ async def get_base_stats_for_class(class_key: str) -> Dict[str, int]:
         "Приоритеты: мечник=str, маг=int, вор=dex, послушник=int/end, лучник=dex, торговец=сбалансирован.\n"
         "Верни ТОЛЬКО JSON вида: {\"str\":X,\"dex\":Y,\"int\":Z,\"end\":W}"
     )
+    messages = [
+        {"role": "system", "content": "Ты — балансировщик RPG-атрибутов."},
+        {"role": "user", "content": f"Класс: {class_key}\n{prompt}"}
+    ]
+    params = {"temperature": 0.4, "max_tokens": 60}
+    stored = _BASE_DISK.get(llm.model, messages, params)
+    if stored is not None:
+        _BASE_STATS_CACHE[class_key] = stored
+        return stored
+
+    text = await llm.chat(messages, **params, purpose="attributes.base_stats")
+    if text is None:
+        # шлюз перегружен или API недоступен — фолбэк без кэширования, следующий игрок спросит снова
+        return FALLBACK_BASE.get(class_key, {"str": 4, "dex": 4, "int": 4, "end": 4})
     try:
-        resp = await oai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0.4,
-            max_tokens=60,
-            messages=[
-                {"role": "system", "content": "Ты — балансировщик RPG-атрибутов."},
-                {"role": "user", "content": f"Класс: {class_key}\n{prompt}"}
-            ],
-        )
-        text = resp.choices[0].message.content.strip()
         import json, re
         json_text = text
         if "{" not in text:
@@ -77,6 +93,7 @@ async def get_base_stats_for_class(class_key: str) -> Dict[str, int]:
             "end": _safe_int(data.get("end"), 4),
         }
         _BASE_STATS_CACHE[class_key] = stats
+        _BASE_DISK.put(llm.model, messages, params, stats)
         return stats
     except Exception:
         _BASE_STATS_CACHE[class_key] = FALLBACK_BASE.get(class_key, {"str": 4, "dex": 4, "int": 4, "end": 4})
@@ -88,9 +105,16 @@ async def get_levelup_increase(class_key: str, current: Dict[str, int], new_leve
     Если ChatGPT недоступен — используем FALLBACK_PER_LEVEL.
     Формат: {"str":+a,"dex":+b,"int":+c,"end":+d}
     """
-    if not USE_OPENAI or oai_client is None:
+    if not llm.enabled:
         return FALLBACK_PER_LEVEL.get(class_key, {"str": 1, "dex": 1, "int": 1, "end": 1})
 
+    # промпт зависит только от класса и текущих статов — одинаковые запросы склеиваем
+    # .get: неполный current не должен ронять вызов — внутри генерации он уйдёт в фолбэк
+    key = ("levelup", class_key) + tuple(current.get(k, 0) for k in ("str", "dex", "int", "end"))
+    inc = await _FLIGHTS.do(key, lambda: _generate_levelup_increase(class_key, current))
+    return dict(inc)
+
+async def _generate_levelup_increase(class_key: str, current: Dict[str, int]) -> Dict[str, int]:
     try:
         prompt = (
             "Дай приращение характеристик для апа на +1 уровень (3–4 очка суммарно), JSON.\n"
@@ -98,28 +122,32 @@ async def get_levelup_increase(class_key: str, current: Dict[str, int], new_leve
             "Формат: {\"str\":X,\"dex\":Y,\"int\":Z,\"end\":W} — только числа, только этот JSON."
         )
         cur_txt = f'{{"str":{current["str"]},"dex":{current["dex"]},"int":{current["int"]},"end":{current["end"]}}}'
-        resp = await oai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0.5,
-            max_tokens=60,
-            messages=[
-                {"role": "system", "content": "Ты — балансировщик RPG-атрибутов."},
-                {"role": "user", "content": f"Класс: {class_key}\nТекущие: {cur_txt}\n{prompt}"}
-            ],
-        )
+        messages = [
+            {"role": "system", "content": "Ты — балансировщик RPG-атрибутов."},
+            {"role": "user", "content": f"Класс: {class_key}\nТекущие: {cur_txt}\n{prompt}"}
+        ]
+        params = {"temperature": 0.5, "max_tokens": 60}
+        stored = _LEVELUP_DISK.get(llm.model, messages, params)
+        if stored is not None:
+            return stored
+
+        text = await llm.chat(messages, **params, purpose="attributes.levelup")
+        if text is None:
+            return FALLBACK_PER_LEVEL.get(class_key, {"str": 1, "dex": 1, "int": 1, "end": 1})
         import json, re
-        text = resp.choices[0].message.content.strip()
         json_text = text
         if "{" not in text:
             m = re.search(r'(\{.*\})', text, re.S)
             if m:
                 json_text = m.group(1)
         data = json.loads(json_text)
-        return {
+        inc = {
             "str": _safe_int(data.get("str")),
             "dex": _safe_int(data.get("dex")),
             "int": _safe_int(data.get("int")),
             "end": _safe_int(data.get("end")),
         }
+        _LEVELUP_DISK.put(llm.model, messages, params, inc)
+        return inc
     except Exception:
         return FALLBACK_PER_LEVEL.get(class_key, {"str": 1, "dex": 1, "int": 1, "end": 1})
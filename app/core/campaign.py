@@ -127,3 +127,10 @@ def arrival_text(hero_name: str, gender: str, campaign_id: str | None) -> str:
     verb = "подошла" if fem else "подошёл"
     city = data["arrival_city"]
     return f"🏘️ <b>{city}</b>\n\n{hero_name} {verb} {data['arrival_suffix_text']}"
+
+def campaign_texts() -> list[str]:
+    """Все художественные тексты кампаний (корпус для процедурного рассказчика)."""
+    out: list[str] = []
+    for data in _CAMPAIGNS.values():
+        out.extend(data[k] for k in ("brief", "epic", "arrival_suffix_text") if data.get(k))
+    return out
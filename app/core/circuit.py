@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# app/core/circuit.py
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Предохранитель вокруг внешнего сервиса (LLM через прокси).
+
+    closed    — вызовы идут, исходы последних window вызовов копятся в окне; если доля
+                ошибок >= failure_rate (при хотя бы min_calls исходах) — размыкаемся.
+    open      — allow() сразу False: фича отдаёт статичный текст за микросекунды, а не
+                ждёт таймаут клиента. Через open_for секунд — полуоткрытое состояние.
+    half_open — пропускаем не больше probes пробных вызовов: успех замыкает цепь,
+                ошибка снова размыкает, и каждое повторное размыкание подряд удваивает
+                паузу (до max_open_for).
+    """
+
+    def __init__(self, name: str, window: int = 20, failure_rate: float = 0.5, min_calls: int = 5,
+                 open_for: float = 30.0, max_open_for: float = 300.0, probes: int = 1):
+        self.name = name
+        self.failure_rate = float(failure_rate)
+        self.min_calls = max(1, int(min_calls))
+        self.base_open_for = float(open_for)
+        self.max_open_for = max(float(max_open_for), self.base_open_for)
+        self.probes = max(1, int(probes))
+
+        self.state = CLOSED
+        self._window: Deque[bool] = deque(maxlen=max(1, int(window)))   # True — ошибка
+        self._open_for = self.base_open_for
+        self._opened_at = 0.0
+        self._probing = 0
+
+        self.rejected = 0
+        self.opened = 0
+        self.successes = 0
+        self.failures = 0
+
+    # ---------- состояния ----------
+
+    def _set(self, state: str, reason: str) -> None:
+        if state == self.state:
+            return
+        log.warning("circuit %s: %s -> %s (%s)", self.name, self.state, state, reason)
+        self.state = state
+
+    def _trip(self, reason: str) -> None:
+        if self.state == HALF_OPEN:
+            self._open_for = min(self._open_for * 2, self.max_open_for)
+        self._opened_at = time.monotonic()
+        self._probing = 0
+        self.opened += 1
+        self._set(OPEN, reason)
+
+    def failure_ratio(self) -> float:
+        return sum(self._window) / len(self._window) if self._window else 0.0
+
+    # ---------- API ----------
+
+    def allow(self) -> bool:
+        """Можно ли делать вызов. В half_open занимает пробный слот — его освободит record_*/abandon."""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self._open_for:
+                self.rejected += 1
+                return False
+            self._set(HALF_OPEN, f"after {self._open_for:g}s")
+        if self.state == HALF_OPEN:
+            if self._probing >= self.probes:
+                self.rejected += 1
+                return False
+            self._probing += 1
+        return True
+
+    def record_success(self) -> None:
+        self.successes += 1
+        if self.state == HALF_OPEN:
+            self._window.clear()
+            self._open_for = self.base_open_for
+            self._probing = 0
+            self._set(CLOSED, "probe succeeded")
+            return
+        self._window.append(False)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self._trip("probe failed")
+            return
+        if self.state == OPEN:
+            return                      # запоздалый ответ на вызов до размыкания
+        self._window.append(True)
+        if len(self._window) >= self.min_calls and self.failure_ratio() >= self.failure_rate:
+            self._trip(f"failure rate {self.failure_ratio():.0%}")
+
+    def abandon(self) -> None:
+        """Разрешённый вызов так и не состоялся (например, не дождался очереди)."""
+        if self.state == HALF_OPEN and self._probing > 0:
+            self._probing -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_ratio(), 3),
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "open_for": self._open_for,
+        }
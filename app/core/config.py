@@ -7,12 +7,112 @@ LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "").strip()
 
 USE_OPENAI = os.environ.get("OAI_ENABLED", "0").lower() in ("1", "true", "yes", "y")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "").strip()
+# OpenAI-совместимый сервер вместо api.openai.com (например, tools/llm_stub.py для замеров)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "").strip() or None
 oai_client = None
 if USE_OPENAI:
     try:
         from openai import AsyncOpenAI
-        OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "").strip()
         if OPENAI_API_KEY:
-            oai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+            # max_retries=0: повторы, паузы и учёт 429/5xx — в шлюзе (app/core/llm.py), а не в SDK
+            oai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
     except Exception:
         oai_client = None
+
+# Прокси для OpenAI: OPENAI_PROXY и/или файл со списком (например, proxies.txt; строка
+# "direct" — без прокси). Если задано — запросы идут через пул с проверкой и ранжированием
+OPENAI_PROXY = os.environ.get("OPENAI_PROXY", "").strip()
+OPENAI_PROXIES_FILE = os.environ.get("OPENAI_PROXIES_FILE", "").strip()
+PROXY_PROBE_INTERVAL = float(os.environ.get("PROXY_PROBE_INTERVAL", "300"))
+PROXY_PROBE_TIMEOUT = float(os.environ.get("PROXY_PROBE_TIMEOUT", "8"))
+# Все прокси выбыли — внеплановая проверка не чаще раза в столько секунд
+PROXY_REPROBE_INTERVAL = float(os.environ.get("PROXY_REPROBE_INTERVAL", "10"))
+
+# Шлюз LLM: одновременных запросов, лимиты в минуту (0 — без лимита) и сколько секунд
+# запрос может простоять в очереди, прежде чем фича подставит статичный текст
+LLM_MAX_INFLIGHT = int(os.environ.get("LLM_MAX_INFLIGHT", "8"))
+LLM_RPM = float(os.environ.get("LLM_RPM", "300"))
+LLM_TPM = float(os.environ.get("LLM_TPM", "150000"))
+LLM_DEADLINE_INTERACTIVE = float(os.environ.get("LLM_DEADLINE_INTERACTIVE", "4.0"))
+LLM_DEADLINE_BACKGROUND = float(os.environ.get("LLM_DEADLINE_BACKGROUND", "60.0"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "15.0"))            # на один вызов API
+# Предохранитель LLM: окно исходов, доля ошибок для размыкания, минимум исходов,
+# пауза до пробного вызова (удваивается при неудачных пробах до максимума)
+CIRCUIT_WINDOW = int(os.environ.get("CIRCUIT_WINDOW", "20"))
+CIRCUIT_FAILURE_RATE = float(os.environ.get("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.environ.get("CIRCUIT_MAX_OPEN_SECONDS", "300"))
+# Сколько секунд ждать прозу от LLM, чтобы дорисовать уже отправленное сообщение
+PROGRESSIVE_DEADLINE = float(os.environ.get("PROGRESSIVE_DEADLINE", "8.0"))
+# Потоковая проза: не чаще одной правки сообщения в столько секунд
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Учёт расхода LLM: цена в $ за 1M токенов (по умолчанию gpt-4o-mini), сводка раз в N секунд
+LLM_PRICE_INPUT = float(os.environ.get("LLM_PRICE_INPUT", "0.15"))
+LLM_PRICE_OUTPUT = float(os.environ.get("LLM_PRICE_OUTPUT", "0.60"))
+USAGE_DUMP_INTERVAL = float(os.environ.get("USAGE_DUMP_INTERVAL", "300"))   # 0 — только при остановке
+USAGE_DUMP_PATH = os.environ.get("USAGE_DUMP_PATH", os.path.join("saves", "llm_usage.json"))  # "" — только в лог
+USAGE_MAX_PLAYERS = int(os.environ.get("USAGE_MAX_PLAYERS", "10000"))
+
+# Сюжетная память игрока в промптах подземелья (токены по локальной оценке; 0 — выключить)
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", "160"))     # весь блок памяти
+MEMORY_RECENT_TOKENS = int(os.environ.get("MEMORY_RECENT_TOKENS", "90"))    # свежие вехи до свёртки
+MEMORY_SUMMARY_TOKENS = int(os.environ.get("MEMORY_SUMMARY_TOKENS", "60"))  # сводка прошлого
+MEMORY_PREMISE_TOKENS = int(os.environ.get("MEMORY_PREMISE_TOKENS", "30"))  # завязка кампании
+MEMORY_BEAT_TOKENS = int(os.environ.get("MEMORY_BEAT_TOKENS", "24"))        # одна веха
+
+# Постоянный кэш результатов LLM (статы классов, приросты за уровень); версия сбрасывает всё
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join("saves", "llm_cache.db"))
+LLM_CACHE_VERSION = os.environ.get("LLM_CACHE_VERSION", "1").strip()
+
+# Хранилище игроков: "sqlite" (по умолчанию, переживает рестарт) или "memory"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite").strip().lower()
+STORAGE_PATH = os.environ.get("STORAGE_PATH", os.path.join("saves", "players.db"))
+# Как часто (сек) сбрасывать накопленные save_player одной транзакцией
+STORAGE_FLUSH_INTERVAL = float(os.environ.get("STORAGE_FLUSH_INTERVAL", "2.0"))
+# Сжатие документа игрока zlib: с какого размера (байт) и каким уровнем (0 — без сжатия).
+# Уровень 1 почти так же жмёт, как максимальный; цена — см. app/core/persistence.py
+SAVE_COMPRESS_FROM = int(os.environ.get("SAVE_COMPRESS_FROM", "128"))
+SAVE_COMPRESS_LEVEL = max(0, min(9, int(os.environ.get("SAVE_COMPRESS_LEVEL", "1"))))
+# Бюджет горячего кэша игроков (остальные лениво читаются с диска)
+PLAYER_CACHE_MAX_ENTRIES = int(os.environ.get("PLAYER_CACHE_MAX_ENTRIES", "5000"))
+PLAYER_CACHE_MAX_BYTES = int(os.environ.get("PLAYER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Сколько живёт закрепление игрока в кэше (брошенное создание/забег отпускаются сами)
+PLAYER_PIN_TTL = float(os.environ.get("PLAYER_PIN_TTL", str(24 * 3600)))
+
+# FSM (создание персонажа и т.п.): "sqlite" переживает деплой, "memory" — как раньше
+FSM_BACKEND = os.environ.get("FSM_BACKEND", "sqlite").strip().lower()
+FSM_STORAGE_PATH = os.environ.get("FSM_STORAGE_PATH", os.path.join("saves", "fsm.db"))
+FSM_TTL = float(os.environ.get("FSM_TTL", str(24 * 3600)))              # брошенный сценарий живёт сутки
+FSM_SWEEP_INTERVAL = float(os.environ.get("FSM_SWEEP_INTERVAL", "600"))
+
+# Временное состояние экранов выбора (рынок/таверна): срок жизни записи и общий лимит
+SCRATCH_TTL = float(os.environ.get("SCRATCH_TTL", "900"))
+SCRATCH_MAX_ENTRIES = int(os.environ.get("SCRATCH_MAX_ENTRIES", "20000"))
+
+# Кэш описаний подземелья от LLM: ключей, срок жизни пула (сек), вариантов текста на ключ
+NARRATION_CACHE_KEYS = int(os.environ.get("NARRATION_CACHE_KEYS", "2000"))
+NARRATION_CACHE_TTL = float(os.environ.get("NARRATION_CACHE_TTL", str(6 * 3600)))
+NARRATION_CACHE_VARIANTS = int(os.environ.get("NARRATION_CACHE_VARIANTS", "4"))
+
+# Реплики NPC (трактирщик) генерируются заранее в фоне: размер пула и порог дозаполнения
+LINE_POOL_SIZE = int(os.environ.get("LINE_POOL_SIZE", "8"))
+LINE_POOL_LOW_WATER = int(os.environ.get("LINE_POOL_LOW_WATER", "3"))
+
+# Апдейты одного игрока обрабатываются по очереди: число полос замков
+USER_LOCK_STRIPES = int(os.environ.get("USER_LOCK_STRIPES", "1024"))
+
+# Режим получения апдейтов: "polling" (getUpdates) или "webhook" (aiohttp-сервер)
+BOT_MODE = os.environ.get("BOT_MODE", "polling").strip().lower()
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", os.environ.get("PORT", "8080")))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "").strip()
+# Публичный адрес (https://bot.example.com) — если задан, вебхук регистрируется у Telegram на старте
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", "").strip()
+WEBHOOK_CONCURRENCY = int(os.environ.get("WEBHOOK_CONCURRENCY", "64"))
+
+# Шардирование по user_id на N воркер-процессов (0/1 — один процесс, как раньше)
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", "0"))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# app/core/fsm_storage.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+
+def _key_str(key: StorageKey) -> str:
+    parts = [
+        str(key.bot_id), str(key.chat_id), str(key.user_id),
+        str(getattr(key, "thread_id", None) or ""),
+        str(getattr(key, "business_connection_id", None) or ""),
+        key.destiny,
+    ]
+    return ":".join(parts)
+
+
+class SqliteFSMStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в SQLite (WAL): состояние создания персонажа переживает деплой.
+
+    У каждого ключа свой срок жизни: любая запись продлевает его на ttl секунд.
+    Просроченное при чтении считается пустым, а фоновая чистка раз в sweep_interval
+    удаляет брошенные сценарии с диска — таблица не растёт бесконечно.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, sweep_interval: float = 600):
+        self.path = path
+        self.ttl = float(ttl)
+        self.sweep_interval = float(sweep_interval)
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            " key TEXT PRIMARY KEY,"
+            " state TEXT,"
+            " data TEXT NOT NULL DEFAULT '{}',"
+            " expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fsm_expires ON fsm(expires_at)")
+        self._sweeper: Optional[asyncio.Task] = None
+        self.expired = 0
+
+    # ---------- BaseStorage ----------
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        self._ensure_sweeper()
+        await asyncio.to_thread(self._upsert, _key_str(key), "state", value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await asyncio.to_thread(self._read, _key_str(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._ensure_sweeper()
+        await asyncio.to_thread(self._upsert, _key_str(key), "data", json.dumps(data, ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await asyncio.to_thread(self._read, _key_str(key))
+        return json.loads(row[1]) if row else {}
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        with self._lock:
+            self._conn.close()
+
+    # ---------- внутреннее ----------
+
+    def _upsert(self, k: str, column: str, value: Optional[str]) -> None:
+        """Одна транзакция (один fsync); вызывается в потоке через asyncio.to_thread."""
+        now = time.time()
+        other, empty = ("data", "'{}'") if column == "state" else ("state", "NULL")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # просроченный хвост второй колонки не должен «воскреснуть» вместе с новой записью
+                self._conn.execute(
+                    f"INSERT INTO fsm(key, {column}, expires_at) VALUES(?,?,?) "
+                    f"ON CONFLICT(key) DO UPDATE SET {column}=excluded.{column}, "
+                    f"{other}=CASE WHEN fsm.expires_at < ? THEN {empty} ELSE fsm.{other} END, "
+                    f"expires_at=excluded.expires_at",
+                    (k, value, now + self.ttl, now),
+                )
+                # пустой ключ (ни состояния, ни данных) не держим
+                self._conn.execute("DELETE FROM fsm WHERE key=? AND state IS NULL AND data='{}'", (k,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _read(self, k: str):
+        """В потоке (asyncio.to_thread): замок общий с писателем, который держит его до COMMIT."""
+        with self._lock:
+            row = self._conn.execute("SELECT state, data, expires_at FROM fsm WHERE key=?", (k,)).fetchone()
+        if row is None or row[2] < time.time():
+            return None
+        return row
+
+    def sweep(self) -> int:
+        """Удалить просроченные ключи. Возвращает, сколько удалено."""
+        with self._lock:
+            n = self._conn.execute("DELETE FROM fsm WHERE expires_at < ?", (time.time(),)).rowcount
+        self.expired += n
+        return n
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._sweeper = loop.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            try:
+                n = await asyncio.to_thread(self.sweep)
+                if n:
+                    log.info("FSM storage: expired %d abandoned keys", n)
+            except Exception:
+                log.exception("FSM storage sweep failed")
+            await asyncio.sleep(self.sweep_interval)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            live = self._conn.execute("SELECT COUNT(*) FROM fsm").fetchone()[0]
+        return {"keys": live, "expired": self.expired}
+
+
+def make_fsm_storage() -> BaseStorage:
+    """FSM-хранилище по config.FSM_BACKEND: "sqlite" (по умолчанию) или "memory"."""
+    if config.FSM_BACKEND == "memory":
+        return MemoryStorage()
+    return SqliteFSMStorage(config.FSM_STORAGE_PATH, ttl=config.FSM_TTL,
+                            sweep_interval=config.FSM_SWEEP_INTERVAL)
@@ -116,3 +116,7 @@ def sample_random_items(k: int, class_key: Optional[str] = None, exclude_names:
         pool = [x for x in pool if (x.get("name") not in exclude_names)]
     k = max(0, min(k, len(pool)))
     return random.sample(pool, k=k) if k else []
+
+def lore_descriptions() -> List[str]:
+    """Описания предметов из items_lore.txt (корпус для процедурного рассказчика)."""
+    return [x["desc"] for x in _load_lore() if x.get("desc")]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# app/core/journal.py
+"""
+Журнал мутаций игрока: маленькие записи вместо перезаписи всего документа.
+
+Запись — dict с полем "op":
+  {"op": "gold", "d": -8}                     — изменение золота
+  {"op": "inv",  "k": "Зелье лечения", "d": 1} — изменение количества предмета (0 → удалить ключ)
+  {"op": "hp",   "v": 12}                      — новое значение HP
+  {"op": "eq",   "k": "weapon", "v": "Меч"}   — слот экипировки
+  {"op": "set",  "f": "level", "v": 2}        — любое другое поле целиком
+  {"op": "del",  "f": "shop_items"}           — поле исчезло из документа
+"""
+from __future__ import annotations
+
+import copy
+from typing import Any, Dict, Iterable, List
+
+Record = Dict[str, Any]
+
+
+def _is_int(v: Any) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def diff_docs(old: Dict[str, Any], new: Dict[str, Any]) -> List[Record]:
+    """Минимальный набор записей, превращающий old в new."""
+    recs: List[Record] = []
+    for f, nv in new.items():
+        if f not in old:
+            recs.append({"op": "set", "f": f, "v": nv})
+            continue
+        ov = old[f]
+        if ov == nv:
+            continue
+        if f == "gold" and _is_int(ov) and _is_int(nv):
+            recs.append({"op": "gold", "d": nv - ov})
+        elif f == "hp":
+            recs.append({"op": "hp", "v": nv})
+        elif f == "inventory" and isinstance(ov, dict) and isinstance(nv, dict):
+            for k in ov.keys() | nv.keys():
+                d = nv.get(k, 0) - ov.get(k, 0)
+                if d or (k in ov) != (k in nv):
+                    recs.append({"op": "inv", "k": k, "d": d})
+        elif f == "equipment" and isinstance(ov, dict) and isinstance(nv, dict):
+            for k in ov.keys() | nv.keys():
+                if ov.get(k) != nv.get(k) or (k in ov) != (k in nv):
+                    recs.append({"op": "eq", "k": k, "v": nv.get(k)})
+        else:
+            recs.append({"op": "set", "f": f, "v": nv})
+    for f in old.keys() - new.keys():
+        recs.append({"op": "del", "f": f})
+    return recs
+
+
+def apply_records(doc: Dict[str, Any], recs: Iterable[Record]) -> Dict[str, Any]:
+    """Проиграть записи поверх документа (документ меняется на месте и возвращается)."""
+    for r in recs:
+        op = r.get("op")
+        if op == "gold":
+            doc["gold"] = int(doc.get("gold", 0)) + int(r["d"])
+        elif op == "hp":
+            doc["hp"] = r["v"]
+        elif op == "inv":
+            inv = doc.setdefault("inventory", {})
+            cnt = int(inv.get(r["k"], 0)) + int(r["d"])
+            if cnt > 0:
+                inv[r["k"]] = cnt
+            else:
+                inv.pop(r["k"], None)
+        elif op == "eq":
+            doc.setdefault("equipment", {})[r["k"]] = r["v"]
+        elif op == "set":
+            doc[r["f"]] = copy.deepcopy(r["v"])
+        elif op == "del":
+            doc.pop(r["f"], None)
+    return doc
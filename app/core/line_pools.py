@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# app/core/line_pools.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Union
+
+from . import config
+from .usage import bind_player
+
+log = logging.getLogger(__name__)
+
+# Генератор одной реплики: текст или None (LLM выключен / ошибка)
+Generate = Callable[[], Awaitable[Optional[str]]]
+# Запасная реплика на пустой пул: строка или функция, которая её сочиняет (без сети)
+Fallback = Union[str, Callable[[], str]]
+
+
+class LinePool:
+    """
+    Пул заранее сгенерированных реплик одного типа.
+
+    pop() никогда не ждёт сеть: отдаёт готовую реплику или, если пул пуст, fallback
+    (строку или результат вызова — например, процедурного рассказчика). Когда в пуле
+    остаётся меньше low_water реплик, в фоне запускается одна задача дозаполнения до size.
+    Если генератор вернул None — следующая попытка не раньше чем через retry_after
+    секунд (чтобы выключенный LLM не крутил задачу впустую).
+    """
+
+    def __init__(self, name: str, generate: Generate, fallback: Fallback,
+                 size: int = 8, low_water: int = 3, retry_after: float = 30.0):
+        self.name = name
+        self.fallback = fallback
+        self.size = max(1, int(size))
+        self.low_water = min(max(0, int(low_water)), self.size)
+        self.retry_after = float(retry_after)
+        self._generate = generate
+        self._lines: Deque[str] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+
+        self.served = 0
+        self.fallbacks = 0
+        self.generated = 0
+        self.failures = 0
+
+    def pop(self) -> str:
+        if self._lines:
+            line = self._lines.popleft()
+            self.served += 1
+        else:
+            line = self.fallback() if callable(self.fallback) else self.fallback
+            self.fallbacks += 1
+        self.refill()
+        return line
+
+    def refill(self) -> None:
+        """Запустить фоновое дозаполнение, если пул ниже low_water (нужен работающий event loop)."""
+        if len(self._lines) >= max(1, self.low_water):
+            return
+        if self._task is not None and not self._task.done():
+            return
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._fill(), name=f"line-pool:{self.name}")
+
+    async def _fill(self) -> None:
+        # пул общий: расход не записываем на игрока, чей pop() запустил дозаливку
+        bind_player(None)
+        while len(self._lines) < self.size:
+            try:
+                text = await self._generate()
+            except Exception:
+                log.exception("line pool %s: generator failed", self.name)
+                text = None
+            if not text:
+                self.failures += 1
+                self._retry_at = time.monotonic() + self.retry_after
+                return
+            self._lines.append(text)
+            self.generated += 1
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "ready": len(self._lines),
+            "served": self.served,
+            "fallbacks": self.fallbacks,
+            "generated": self.generated,
+            "failures": self.failures,
+        }
+
+
+class LinePools:
+    """Реестр пулов по типу реплики: register() при импорте фичи, pop(name) в хендлерах."""
+
+    def __init__(self, size: int = 8, low_water: int = 3):
+        self.size = size
+        self.low_water = low_water
+        self._pools: Dict[str, LinePool] = {}
+
+    def register(self, name: str, generate: Generate, fallback: Fallback) -> LinePool:
+        pool = LinePool(name, generate, fallback, size=self.size, low_water=self.low_water)
+        self._pools[name] = pool
+        return pool
+
+    def pop(self, name: str) -> str:
+        return self._pools[name].pop()
+
+    def prime(self) -> None:
+        """Начать наполнение всех пулов (вызывать из работающего event loop)."""
+        for pool in self._pools.values():
+            pool.refill()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: pool.stats() for name, pool in self._pools.items()}
+
+
+# Общий реестр реплик NPC
+line_pools = LinePools(size=config.LINE_POOL_SIZE, low_water=config.LINE_POOL_LOW_WATER)
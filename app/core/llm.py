@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+# app/core/llm.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from . import config
+from .circuit import CircuitBreaker
+from .proxy_pool import ProxyPool, load_proxies
+from .tokens import count_tokens
+from .usage import UsageMeter, llm_usage
+
+log = logging.getLogger(__name__)
+
+# Полосы приоритета: чем меньше число, тем раньше обслуживается
+INTERACTIVE = 0      # игрок ждёт ответ прямо сейчас (описания подземелья, статы)
+BACKGROUND = 1       # фоновое наполнение пулов реплик
+
+_LANES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class TokenBucket:
+    """Ведро токенов: rate единиц в минуту, ёмкость — минутный запас. rate<=0 — без лимита."""
+
+    def __init__(self, per_minute: float):
+        self.rate = float(per_minute) / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def delay(self, amount: float) -> float:
+        """Через сколько секунд в ведре будет amount (0 — уже есть)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        if self.rate > 0:
+            self.tokens -= amount      # может уйти в минус после поправки по факту
+
+    def give_back(self, amount: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def _is_rate_limit(e: BaseException) -> bool:
+    try:
+        from openai import RateLimitError
+    except ImportError:         # без openai клиента нет, а значит и 429
+        return False
+    return isinstance(e, RateLimitError)
+
+
+class _Waiter:
+    __slots__ = ("future", "lane", "tokens", "enqueued")
+
+    def __init__(self, future: asyncio.Future, lane: int, tokens: int):
+        self.future = future
+        self.lane = lane
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+
+
+class LLMGateway:
+    """
+    Единая точка вызова LLM: не больше max_inflight запросов одновременно, лимиты
+    RPM/TPM через ведро токенов и очередь с приоритетами (интерактивные вперёд фоновых).
+
+    Если запрос простоял в очереди дольше своего дедлайна, chat() возвращает None —
+    вызывающий подставляет статичный текст, игрок не ждёт. Ошибки API тоже дают None.
+    Пока предохранитель разомкнут (API/прокси лежат), None возвращается сразу, без очереди.
+    Токены, задержка и стоимость каждого вызова пишутся в usage по purpose и игроку.
+    """
+
+    def __init__(self, client: Any, max_inflight: int = 8, rpm: float = 0, tpm: float = 0,
+                 interactive_deadline: float = 4.0, background_deadline: float = 60.0,
+                 model: str = "gpt-4o-mini", timeout: float = 15.0,
+                 breaker: Optional[CircuitBreaker] = None, usage: Optional[UsageMeter] = None):
+        self.client = client
+        self.model = model
+        self.timeout = float(timeout)
+        self.breaker = breaker or CircuitBreaker("llm")
+        self.usage = usage or UsageMeter(0, 0, dump_interval=0)
+        self.max_inflight = max(1, int(max_inflight))
+        self.deadlines = {INTERACTIVE: float(interactive_deadline), BACKGROUND: float(background_deadline)}
+        self._rpm = TokenBucket(rpm)
+        self._tpm = TokenBucket(tpm)
+        self._heap: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # метрики
+        self.requests = {lane: 0 for lane in _LANES}
+        self.expired = {lane: 0 for lane in _LANES}       # не дождались очереди -> фолбэк
+        self.wait_total = {lane: 0.0 for lane in _LANES}
+        self.wait_max = {lane: 0.0 for lane in _LANES}
+        self.admitted = {lane: 0 for lane in _LANES}
+        self.errors = 0
+        self.rate_limited = 0
+        self.short_circuited = 0
+        self.tokens_used = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.client is not None
+
+    def start(self) -> None:
+        """Фоновые задачи клиента (проверка прокси) — вызывать из работающего event loop."""
+        start = getattr(self.client, "start", None)
+        if start is not None:
+            start()
+
+    async def close(self) -> None:
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+    # ---------- очередь ----------
+
+    @staticmethod
+    def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+        # локальная оценка промпта (app/core/tokens.py) + бюджет ответа
+        return sum(count_tokens(m.get("content") or "") for m in messages) + int(max_tokens)
+
+    def _pump(self) -> None:
+        self._timer = None
+        while self._heap and self._inflight < self.max_inflight:
+            _, _, w = self._heap[0]
+            if w.future.done():                 # ушёл по дедлайну
+                heapq.heappop(self._heap)
+                continue
+            wait = max(self._rpm.delay(1), self._tpm.delay(w.tokens))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            heapq.heappop(self._heap)
+            self._rpm.take(1)
+            self._tpm.take(w.tokens)
+            self._inflight += 1
+            w.future.set_result(None)
+
+    def _release(self) -> None:
+        self._inflight -= 1
+        if self._timer is None:
+            self._pump()
+
+    async def _admit(self, lane: int, tokens: int, deadline: float) -> bool:
+        w = _Waiter(asyncio.get_running_loop().create_future(), lane, tokens)
+        heapq.heappush(self._heap, (lane, next(self._seq), w))
+        if self._timer is None:
+            self._pump()
+        try:
+            await asyncio.wait_for(w.future, deadline)
+        except asyncio.TimeoutError:
+            if w.future.done() and not w.future.cancelled():
+                self._release()                 # слот выдали в момент таймаута
+            self.expired[lane] += 1
+            return False
+        except asyncio.CancelledError:
+            if w.future.done() and not w.future.cancelled():
+                self._release()
+            raise
+        waited = time.monotonic() - w.enqueued
+        self.admitted[lane] += 1
+        self.wait_total[lane] += waited
+        self.wait_max[lane] = max(self.wait_max[lane], waited)
+        return True
+
+    def _enter(self, priority: int) -> bool:
+        self.requests[priority] += 1
+        if self.breaker.allow():
+            return True
+        self.short_circuited += 1
+        return False
+
+    def _failed(self, e: BaseException) -> None:
+        if _is_rate_limit(e):
+            self.rate_limited += 1
+        else:
+            self.errors += 1
+        self.breaker.record_failure()
+        log.debug("LLM call failed: %r", e)
+
+    def _account(self, purpose: str, messages: List[Dict[str, str]], completion_chars: int,
+                 usage: Any, latency: float, ok: bool = True) -> int:
+        """Записать вызов в учёт расхода; вернуть израсходованные токены (0 — неизвестно)."""
+        prompt = getattr(usage, "prompt_tokens", None)
+        completion = getattr(usage, "completion_tokens", None)
+        estimated = prompt is None or completion is None
+        if estimated:
+            if ok or completion_chars:
+                # API не прислал usage (прокси/совместимый сервер) — та же локальная оценка, что и для TPM
+                prompt = sum(count_tokens(m.get("content") or "") for m in messages)
+                completion = completion_chars // 3
+            else:
+                prompt = completion = 0
+        self.usage.record(purpose, prompt, completion, latency, ok=ok, estimated=estimated)
+        return prompt + completion
+
+    # ---------- API ----------
+
+    async def chat(self, messages: List[Dict[str, str]], *, temperature: float = 0.9,
+                   max_tokens: int = 180, priority: int = INTERACTIVE,
+                   deadline: Optional[float] = None, model: Optional[str] = None,
+                   purpose: str = "other") -> Optional[str]:
+        """
+        Текст ответа или None (LLM выключен, очередь не успела к дедлайну, ошибка API).
+        purpose — назначение вызова для учёта расхода ("dungeon.search", "tavern.greet", ...).
+        """
+        if self.client is None:
+            return None
+        if not self._enter(priority):
+            self.usage.dropped(purpose)
+            return None
+        est = self.estimate_tokens(messages, max_tokens)
+        if not await self._admit(priority, est, self.deadlines[priority] if deadline is None else deadline):
+            self.breaker.abandon()
+            self.usage.dropped(purpose)
+            return None
+        t0 = time.monotonic()
+        try:
+            resp = await asyncio.wait_for(self.client.chat.completions.create(
+                model=model or self.model, temperature=temperature, max_tokens=max_tokens,
+                messages=messages,
+            ), self.timeout)
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            self._tpm.give_back(est)            # ответа нет — резерв TPM не израсходован
+            raise
+        except Exception as e:
+            self._failed(e)
+            self.usage.record(purpose, 0, 0, time.monotonic() - t0, ok=False)
+            self._tpm.give_back(est)            # иначе серия ошибок высушит ведро для живых вызовов
+            return None
+        finally:
+            self._release()
+        self.breaker.record_success()
+
+        text = (resp.choices[0].message.content or "").strip()
+        used = self._account(purpose, messages, len(text), getattr(resp, "usage", None),
+                             time.monotonic() - t0) or est
+        self.tokens_used += used
+        # поправка ведра TPM по фактическому расходу
+        if used < est:
+            self._tpm.give_back(est - used)
+        else:
+            self._tpm.take(used - est)
+        return text or None
+
+    async def stream(self, messages: List[Dict[str, str]], *, temperature: float = 0.9,
+                     max_tokens: int = 180, priority: int = INTERACTIVE,
+                     deadline: Optional[float] = None, model: Optional[str] = None,
+                     purpose: str = "other") -> AsyncIterator[str]:
+        """
+        Потоковый ответ: кусочки текста по мере генерации. Пустой поток — то же, что None
+        у chat(): LLM выключен, очередь не успела к дедлайну или ошибка до первого токена.
+        Слот шлюза держится, пока поток не дочитан или не закрыт (aclose()).
+        """
+        if self.client is None:
+            return
+        if not self._enter(priority):
+            self.usage.dropped(purpose)
+            return
+        est = self.estimate_tokens(messages, max_tokens)
+        if not await self._admit(priority, est, self.deadlines[priority] if deadline is None else deadline):
+            self.breaker.abandon()
+            self.usage.dropped(purpose)
+            return
+        usage = None
+        chars = 0
+        ok = True
+        t0 = time.monotonic()
+        try:
+            try:
+                resp = await asyncio.wait_for(self.client.chat.completions.create(
+                    model=model or self.model, temperature=temperature, max_tokens=max_tokens,
+                    messages=messages, stream=True, stream_options={"include_usage": True},
+                ), self.timeout)
+                # соединение и первые заголовки есть — сервис жив
+                self.breaker.record_success()
+                async for chunk in resp:
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        chars += len(delta)
+                        yield delta
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                ok = False
+                self._failed(e)
+        finally:
+            self._release()
+            used = self._account(purpose, messages, chars, usage, time.monotonic() - t0, ok)
+            if not used and not ok:
+                self._tpm.give_back(est)        # ошибка до первого токена — резерв возвращаем
+            else:
+                used = used or est
+                self.tokens_used += used
+                if used < est:
+                    self._tpm.give_back(est - used)
+                else:
+                    self._tpm.take(used - est)
+
+    def stats(self) -> Dict[str, Any]:
+        queued = {name: 0 for name in _LANES.values()}
+        for lane, _, w in self._heap:
+            if not w.future.done():
+                queued[_LANES[lane]] += 1
+        out: Dict[str, Any] = {
+            "inflight": self._inflight,
+            "queued": queued,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "short_circuited": self.short_circuited,
+            "tokens_used": self.tokens_used,
+            "circuit": self.breaker.stats(),
+            "proxies": self.client.stats() if isinstance(self.client, ProxyPool) else None,
+        }
+        for lane, name in _LANES.items():
+            n = self.admitted[lane]
+            out[name] = {
+                "requests": self.requests[lane],
+                "expired": self.expired[lane],
+                "wait_avg_ms": round(self.wait_total[lane] / n * 1000, 2) if n else 0.0,
+                "wait_max_ms": round(self.wait_max[lane] * 1000, 2),
+            }
+        return out
+
+
+class _Prefetch:
+    """Поток, который читается в фоне с момента создания (см. prefetch)."""
+
+    def __init__(self, source: AsyncIterator[str]):
+        self._queue: "asyncio.Queue[Tuple[Optional[str], Optional[BaseException]]]" = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for item in source:
+                self._queue.put_nowait((item, None))
+            self._queue.put_nowait((None, StopAsyncIteration()))
+        except Exception as e:
+            self._queue.put_nowait((None, e))
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def __aiter__(self) -> "_Prefetch":
+        return self
+
+    async def __anext__(self) -> str:
+        item, exc = await self._queue.get()
+        if exc is not None:
+            raise exc
+        return item
+
+    async def aclose(self) -> None:
+        if not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+def prefetch(source: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Начать читать поток сразу, не дожидаясь потребителя: несколько независимых
+    генераций хода уходят в LLM параллельно, пока хендлер ещё отправляет сообщения.
+    aclose() бросает поток и освобождает слот шлюза.
+    """
+    return _Prefetch(source)
+
+
+def _make_client() -> Any:
+    """Клиент OpenAI: пул прокси, если они настроены, иначе прямой config.oai_client."""
+    if config.oai_client is None:
+        return None
+    proxies = load_proxies(config.OPENAI_PROXIES_FILE, config.OPENAI_PROXY)
+    if not proxies:
+        return config.oai_client
+    try:
+        return ProxyPool(proxies, api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL,
+                         probe_timeout=config.PROXY_PROBE_TIMEOUT,
+                         probe_interval=config.PROXY_PROBE_INTERVAL,
+                         reprobe_interval=config.PROXY_REPROBE_INTERVAL,
+                         request_timeout=config.LLM_TIMEOUT,
+                         max_connections=max(config.LLM_MAX_INFLIGHT, 4))
+    except Exception:
+        log.exception("proxy pool init failed, using direct client")
+        return config.oai_client
+
+
+# Общий шлюз для всех фич
+llm = LLMGateway(
+    _make_client(),
+    max_inflight=config.LLM_MAX_INFLIGHT,
+    rpm=config.LLM_RPM,
+    tpm=config.LLM_TPM,
+    interactive_deadline=config.LLM_DEADLINE_INTERACTIVE,
+    background_deadline=config.LLM_DEADLINE_BACKGROUND,
+    timeout=config.LLM_TIMEOUT,
+    usage=llm_usage,
+    breaker=CircuitBreaker(
+        "llm",
+        window=config.CIRCUIT_WINDOW,
+        failure_rate=config.CIRCUIT_FAILURE_RATE,
+        min_calls=config.CIRCUIT_MIN_CALLS,
+        open_for=config.CIRCUIT_OPEN_SECONDS,
+        max_open_for=config.CIRCUIT_MAX_OPEN_SECONDS,
+    ),
+)
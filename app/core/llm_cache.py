@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# app/core/llm_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+
+class LLMResultCache:
+    """
+    Постоянный кэш результатов LLM с «детерминированным смыслом» (статы классов,
+    приросты за уровень) в SQLite: переживает деплой, первый игрок после рестарта не ждёт.
+
+    Ключ — sha256 от модели, сообщений, параметров вызова и версии. Версия складывается
+    из общей (config.LLM_CACHE_VERSION — сбросить всё) и версии пространства имён
+    (поднять, когда меняется разбор ответа); строки прежних версий удаляются при первом
+    обращении к пространству. Файл общий для всех процессов (шард-воркеров): WAL.
+    """
+
+    def __init__(self, path: str, version: str = "1"):
+        self.path = path
+        self.version = str(version)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._purged: set = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " ns TEXT NOT NULL,"
+                " version TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_ns ON llm_cache(ns, version)")
+            self._conn = conn
+        return self._conn
+
+    def _version(self, ns_version: str) -> str:
+        return f"{self.version}.{ns_version}"
+
+    @staticmethod
+    def make_key(ns: str, version: str, model: str, messages: List[Dict[str, str]],
+                 params: Dict[str, Any]) -> str:
+        blob = json.dumps([ns, version, model, messages, params], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _purge(self, ns: str, version: str) -> None:
+        if ns in self._purged:
+            return
+        self._purged.add(ns)
+        cur = self._db().execute("DELETE FROM llm_cache WHERE ns = ? AND version != ?", (ns, version))
+        if cur.rowcount:
+            log.info("llm cache %s: dropped %d entries of old versions", ns, cur.rowcount)
+
+    def get(self, ns: str, ns_version: str, model: str, messages: List[Dict[str, str]],
+            params: Dict[str, Any]) -> Optional[Any]:
+        version = self._version(ns_version)
+        key = self.make_key(ns, version, model, messages, params)
+        try:
+            with self._lock:
+                self._purge(ns, version)
+                row = self._db().execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            log.exception("llm cache read failed")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, ns: str, ns_version: str, model: str, messages: List[Dict[str, str]],
+            params: Dict[str, Any], value: Any) -> None:
+        version = self._version(ns_version)
+        key = self.make_key(ns, version, model, messages, params)
+        try:
+            with self._lock:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO llm_cache(key, ns, version, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, ns, version, json.dumps(value, ensure_ascii=False), time.time()),
+                )
+            self.writes += 1
+        except sqlite3.Error:
+            log.exception("llm cache write failed")
+
+    def namespace(self, ns: str, version: str = "1") -> "LLMCacheNamespace":
+        return LLMCacheNamespace(self, ns, str(version))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+
+class LLMCacheNamespace:
+    """Кэш одного вида результатов (например, "base_stats") со своей версией."""
+
+    def __init__(self, cache: LLMResultCache, ns: str, version: str):
+        self.cache = cache
+        self.ns = ns
+        self.version = version
+
+    def get(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> Optional[Any]:
+        return self.cache.get(self.ns, self.version, model, messages, params)
+
+    def put(self, model: str, messages: List[Dict[str, str]], params: Dict[str, Any], value: Any) -> None:
+        self.cache.put(self.ns, self.version, model, messages, params, value)
+
+
+# Общий экземпляр (файл открывается при первом обращении)
+llm_cache = LLMResultCache(config.LLM_CACHE_PATH, version=config.LLM_CACHE_VERSION)
@@ -1,8 +1,84 @@
 # -*- coding: utf-8 -*-
+import sys
 from dataclasses import dataclass, field
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
 
-@dataclass
+# Общие неизменяемые описания умений: у тысяч игроков одно и то же {emoji,title,type},
+# держим один экземпляр на комбинацию вместо копии у каждого
+_ABILITY_META: Dict[Tuple[str, str, str], Mapping[str, str]] = {}
+
+def ability_meta_entry(title: str, emoji: str = "", type: str = "active") -> Mapping[str, str]:
+    key = (title, emoji, type)
+    entry = _ABILITY_META.get(key)
+    if entry is None:
+        entry = MappingProxyType({"emoji": sys.intern(emoji), "title": sys.intern(title), "type": sys.intern(type)})
+        _ABILITY_META[key] = entry
+    return entry
+
+def _share_meta(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        sys.intern(k): ability_meta_entry(v.get("title", k), v.get("emoji", ""), v.get("type", "active"))
+        if isinstance(v, Mapping) else v
+        for k, v in meta.items()
+    }
+
+# Поля, которые не сохраняем на диск (живут только до рестарта)
+TRANSIENT = {"transient": True}
+
+class TrackedDict(dict):
+    """dict, помнящий, какие ключи меняли с последнего сброса (p.inventory["Зелье"] += 1)."""
+    __slots__ = ("changed",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changed: Optional[Set[Any]] = None
+
+    def _touch(self, key) -> None:
+        if self.changed is None:
+            self.changed = set()
+        self.changed.add(key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._touch(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._touch(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._touch(key)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._touch(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._touch(key)
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in self:
+            self._touch(key)
+        super().clear()
+
+# dict-поля, где отслеживаем изменённые ключи, а не только присваивание поля целиком
+_KEYED_FIELDS = frozenset({"inventory", "equipment", "abilities_known", "ability_charges"})
+_UNTRACKED = frozenset({"dng", "_dirty"})
+# повторяющиеся строки (класс/город/пол/эпос кампании) держим в одном экземпляре на процесс —
+# интернируются при любом присваивании, в __init__ и в хендлерах одинаково
+_INTERNED = frozenset({"gender", "class_key", "class_label", "city_name", "world_story", "campaign_id"})
+
+@dataclass(slots=True)
 class Player:
     user_id: int
     # базовые
@@ -27,6 +103,10 @@ class Player:
     # мир/локации
     city_name: str = "Златоград"
     world_story: str = ""
+    campaign_id: Optional[str] = None
+    dungeon_names: Optional[List[str]] = None
+    # сюжетная память для промптов (app/core/story_memory.py): {"summary", "recent", "rev"}
+    story: Optional[Dict[str, Any]] = None
 
     # инвентарь/экип
     inventory: Dict[str, int] = field(default_factory=dict)
@@ -34,5 +114,51 @@ class Player:
 
     # умения
     abilities_known: Dict[str, int] = field(default_factory=dict)     # имя -> уровень умения
-    ability_meta: Dict[str, Dict] = field(default_factory=dict)       # имя -> {emoji,title,type}
+    ability_meta: Dict[str, Mapping] = field(default_factory=dict)    # имя -> {emoji,title,type} (общий, read-only)
     ability_charges: Dict[str, int] = field(default_factory=dict)     # имя -> заряды
+
+    # витрина рынка (market.py)
+    shop_items: Optional[List[Dict]] = None
+    shop_dirty: bool = False
+
+    # текущий забег по подземелью (dungeon.RoomState)
+    dng: Optional[Any] = field(default=None, metadata=TRANSIENT)
+
+    # имена полей, присвоенных с последнего сброса в хранилище
+    _dirty: Set[str] = field(default_factory=set, init=False, repr=False, compare=False, metadata=TRANSIENT)
+
+    def __setattr__(self, name, value):
+        if name in _KEYED_FIELDS and type(value) is dict:
+            value = TrackedDict(value)
+        elif name in _INTERNED and type(value) is str:
+            value = sys.intern(value)
+        object.__setattr__(self, name, value)
+        if name not in _UNTRACKED:
+            try:
+                self._dirty.add(name)
+            except AttributeError:
+                pass  # ещё внутри __init__, _dirty не создан
+
+    def changes(self) -> Dict[str, Optional[Set[Any]]]:
+        """Что менялось с последнего clear_changes(): поле -> None (целиком) или набор ключей."""
+        out: Dict[str, Optional[Set[Any]]] = {name: None for name in self._dirty}
+        for name in _KEYED_FIELDS:
+            if name in out:
+                continue
+            changed = getattr(self, name).changed
+            if changed:
+                out[name] = set(changed)
+        return out
+
+    def has_changes(self) -> bool:
+        return bool(self._dirty) or any(getattr(self, n).changed for n in _KEYED_FIELDS)
+
+    def clear_changes(self) -> None:
+        self._dirty.clear()
+        for name in _KEYED_FIELDS:
+            getattr(self, name).changed = None
+
+    def __post_init__(self):
+        if self.ability_meta:
+            self.ability_meta = _share_meta(self.ability_meta)
+        self._dirty.clear()
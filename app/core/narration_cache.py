@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# app/core/narration_cache.py
+from __future__ import annotations
+
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import config
+from .singleflight import SingleFlight
+
+# fill(sys, usr, max_tokens) -> текст или None (LLM выключен / ошибка — не кэшируем)
+Fill = Callable[[str, str, int], Awaitable[Optional[str]]]
+
+_Key = Tuple[str, str, int]
+_WORD = re.compile(r"\w+")
+
+
+def _slot(name: str) -> str:
+    return f"⟦{name}⟧"
+
+
+class _Pool:
+    __slots__ = ("variants", "expires")
+
+    def __init__(self, expires: float):
+        self.variants: List[str] = []
+        self.expires = expires
+
+
+class NarrationCache:
+    """
+    Кэш описаний от LLM по «шаблону» промпта.
+
+    Промпты подземелья отличаются в основном именем игрока и названием подземелья:
+    перед поиском они заменяются на ⟦player⟧/⟦dungeon⟧, а в готовый текст из кэша
+    подставляются обратно. На ключ держим пул до variants вариантов: пока пул не полон,
+    каждый запрос идёт в LLM и пополняет его, дальше — случайный вариант без LLM.
+    Пулы живут ttl секунд с момента создания, всего ключей — не больше max_keys (LRU).
+
+    Ответ, в котором имя осталось в склонённой форме («Арвену»), в пул не попадает —
+    иначе чужое имя всплыло бы у другого игрока.
+    """
+
+    def __init__(self, max_keys: int = 2000, ttl: float = 6 * 3600, variants: int = 4):
+        self.max_keys = max(1, int(max_keys))
+        self.ttl = float(ttl)
+        self.variants = max(1, int(variants))
+        self._pools: "OrderedDict[_Key, _Pool]" = OrderedDict()
+        self._rng = random.Random()
+        self._flights = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.uncacheable = 0
+        self.expired = 0
+        self.evicted = 0
+
+    # ---------- шаблоны ----------
+
+    @staticmethod
+    def templatize(text: str, subs: Dict[str, str]) -> str:
+        # длинные значения первыми, чтобы «Арвен» не съел часть «Арвен Звёздная»
+        for name, value in sorted(subs.items(), key=lambda kv: -len(kv[1])):
+            if value:
+                text = text.replace(value, _slot(name))
+        return text
+
+    @staticmethod
+    def render(template: str, subs: Dict[str, str]) -> str:
+        for name, value in subs.items():
+            template = template.replace(_slot(name), value)
+        return template
+
+    @staticmethod
+    def _leaks(template: str, subs: Dict[str, str]) -> bool:
+        """Осталась ли в тексте склонённая форма подставляемых значений."""
+        low = template.lower()
+        for value in subs.values():
+            for word in _WORD.findall(value or ""):
+                if len(word) >= 4 and word[:max(4, len(word) - 2)].lower() in low:
+                    return True
+        return False
+
+    # ---------- API ----------
+
+    def _key(self, sys: str, usr: str, max_tokens: int, subs: Dict[str, str]) -> _Key:
+        return self.templatize(sys, subs), self.templatize(usr, subs), int(max_tokens)
+
+    def _hit(self, key: _Key, subs: Dict[str, str]) -> Optional[str]:
+        """Готовый вариант из полного пула или None (промах учитывается в метриках)."""
+        now = time.monotonic()
+        pool = self._pools.get(key)
+        if pool is not None and pool.expires <= now:
+            del self._pools[key]
+            self.expired += 1
+            pool = None
+        if pool is not None:
+            self._pools.move_to_end(key)
+            if len(pool.variants) >= self.variants:
+                self.hits += 1
+                return self.render(self._rng.choice(pool.variants), subs)
+        self.misses += 1
+        return None
+
+    def lookup(self, sys: str, usr: str, max_tokens: int = 180,
+               subs: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """Только поиск — для потоковой генерации, которая сама потом вызовет offer()."""
+        subs = {k: v for k, v in (subs or {}).items() if v}
+        return self._hit(self._key(sys, usr, max_tokens, subs), subs)
+
+    def offer(self, sys: str, usr: str, max_tokens: int, subs: Optional[Dict[str, str]], text: str) -> None:
+        """Положить в пул ответ, полученный в обход narrate() (например, потоком)."""
+        subs = {k: v for k, v in (subs or {}).items() if v}
+        if text:
+            self._store(self._key(sys, usr, max_tokens, subs), text, subs)
+
+    async def narrate(self, sys: str, usr: str, fill: Fill, max_tokens: int = 180,
+                      subs: Optional[Dict[str, str]] = None) -> Optional[str]:
+        subs = {k: v for k, v in (subs or {}).items() if v}
+        key = self._key(sys, usr, max_tokens, subs)
+        text = self._hit(key, subs)
+        if text is not None:
+            return text
+
+        # одновременные промахи по одному шаблону ждут один вызов LLM и получают его
+        # текст со своими именами; склонённое имя ведущего вызова чужим не отдаём
+        text, template, leader_subs = await self._flights.do(
+            key, lambda: self._fill(key, sys, usr, fill, max_tokens, subs))
+        if template is not None:
+            return self.render(template, subs)
+        if text and leader_subs != subs:
+            text = await fill(sys, usr, max_tokens)
+        return text
+
+    async def _fill(self, key: _Key, sys: str, usr: str, fill: Fill, max_tokens: int,
+                    subs: Dict[str, str]) -> Tuple[Optional[str], Optional[str], Dict[str, str]]:
+        text = await fill(sys, usr, max_tokens)
+        if not text:
+            return text, None, subs
+        return text, self._store(key, text, subs), subs
+
+    def _store(self, key: _Key, text: str, subs: Dict[str, str]) -> Optional[str]:
+        """Положить ответ в пул; вернуть его шаблон или None, если ответ не обобщается."""
+        template = self.templatize(text, subs)
+        if self._leaks(template, subs):
+            self.uncacheable += 1
+            return None
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = _Pool(time.monotonic() + self.ttl)
+            while len(self._pools) > self.max_keys:
+                self._pools.popitem(last=False)
+                self.evicted += 1
+        if len(pool.variants) < self.variants and template not in pool.variants:
+            pool.variants.append(template)
+            self.fills += 1
+        return template
+
+    def clear(self) -> None:
+        self._pools.clear()
+
+    def __len__(self) -> int:
+        return len(self._pools)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "keys": len(self._pools),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "fills": self.fills,
+            "uncacheable": self.uncacheable,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "coalesced": self._flights.coalesced,
+        }
+
+
+# Общий экземпляр для описаний подземелья
+narration_cache = NarrationCache(
+    max_keys=config.NARRATION_CACHE_KEYS,
+    ttl=config.NARRATION_CACHE_TTL,
+    variants=config.NARRATION_CACHE_VARIANTS,
+)
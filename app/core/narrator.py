@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+# app/core/narrator.py
+from __future__ import annotations
+
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# ---------- ГРАММАТИКА ----------
+# {slot} — подставить случайный вариант слота; {Slot} — то же с заглавной буквы.
+# {player}/{dungeon} берутся из subs; {markov} — фраза цепи Маркова по текстам кампаний и
+# описаниям предметов, {rumor} — только по текстам кампаний (слухи трактирщика); *_lc — со строчной.
+
+_SLOTS: Dict[str, List[str]] = {
+    "smell": ["сыростью", "старым воском", "ржавчиной", "плесенью", "холодным пеплом",
+              "мокрым камнем", "прогорклым маслом", "давно остывшим ладаном"],
+    "sound": ["где-то капает вода", "за стеной скребутся когти", "в темноте звякает цепь",
+              "сквозняк гудит в щелях", "под сводами шуршат крылья", "вдали осыпается щебень",
+              "что-то тихо вздыхает в глубине коридора"],
+    "light": ["свет факела дрожит", "тени ложатся косо", "огонёк свечи клонится вбок",
+              "по камню ползут рыжие отблески"],
+    "surface": ["на стенах, покрытых копотью", "на истёртых плитах пола", "на рёбрах низкого свода",
+                "на мокрой кладке"],
+    "detail": ["в углу лежат обломки старого щита", "на полу темнеет засохший след",
+               "у стены стоит опрокинутый сундук", "в нише белеют чьи-то кости",
+               "на камне выцарапаны полустёртые руны", "с потолка свисают корни, как седые волосы",
+               "у порога рассыпаны погасшие угли", "на крюке покачивается пустая клетка"],
+    "mood": ["Тишина кажется слишком внимательной.", "Кажется, за тобой кто-то наблюдает.",
+             "Здесь давно никто не смеялся.", "Каждый шаг звучит громче, чем хотелось бы.",
+             "Камень помнит больше, чем готов рассказать."],
+    "search_place": ["трещины в кладке", "углы, затянутые паутиной", "груду истлевшего тряпья",
+                     "холодные камни у стены", "щели между плитами", "остатки сгнившего ящика"],
+    "door": ["Дверь поддаётся с протяжным скрипом", "Низкая арка выводит в новый зал",
+             "Коридор сворачивает и расширяется", "За поворотом открывается ещё одна комната"],
+    "fire": ["скромный костёр", "огонь из сухих обломков", "крошечный костерок в каменном кругу"],
+    "rest": ["усталость понемногу отпускает плечи", "дыхание выравнивается",
+             "тепло возвращается в озябшие пальцы", "раны перестают ныть"],
+    "road": ["На полпути", "У старого межевого камня", "Там, где тропа ныряет в овраг",
+             "У поваленного дерева"],
+}
+
+_TEMPLATES: Dict[str, List[str]] = {
+    "dungeon": [
+        "{Light} {surface}; воздух пахнет {smell}. {Mood}",
+        "{Detail}, а {sound}. {Mood}",
+    ],
+    "dungeon.enter": [
+        "Своды смыкаются над головой, воздух пахнет {smell}, а {sound}. {Detail}. {markov}",
+        "{Light} {surface}. {Detail}, и {sound}. {Mood}",
+        "Холод подземелья пробирает до костей; {sound}. {Detail}. {Mood}",
+    ],
+    "dungeon.search": [
+        "{player} осматривает {search_place}, поднимая пыль веков.",
+        "{player} ощупывает {search_place}; {light}, а {sound}.",
+        "Пальцы скользят по камню: {player} проверяет {search_place}.",
+    ],
+    "dungeon.camp": [
+        "{player} разводит {fire}; {rest}, пока {sound}.",
+        "У стены теплится {fire}. {Rest}, хотя {sound}.",
+    ],
+    "dungeon.next": [
+        "{Door}. {Detail}. {markov}",
+        "{Door}; {light} {surface}. {Mood}",
+        "{Door}, и {sound}. {Detail}.",
+    ],
+    "dungeon.road.bandits": [
+        "{Road}, из-за камней выскакивают разбойники — приходится откупиться горстью монет.",
+        "{Road}, дорогу перегораживают люди с ножами; кошель становится легче, зато шкура цела.",
+    ],
+    "dungeon.road.blessing": [
+        "{Road}, седой отшельник касается твоего лба — по телу разливается тепло.",
+        "{Road}, у родника молится странница; её благословение снимает усталость.",
+    ],
+    "dungeon.road.merchants": [
+        "{Road}, бродячие торговцы делятся с тобой припасами и желают удачи.",
+        "{Road}, скрипит обоз; купец, не торгуясь, протягивает тебе подарок на дорогу.",
+    ],
+    "dungeon.road.trap": [
+        "{Road}, под ногой щёлкает старая ловушка — ты отделываешься царапинами.",
+        "{Road}, из травы взлетает ржавая петля; удар приходится вскользь, но больно.",
+    ],
+    "dungeon.road.omen": [
+        "Над входом беззвучно кружат вороны. Дурной знак — но пути назад уже нет.",
+        "Ветер вдруг стихает, и в тишине слышно, как {sound}. Дурное предзнаменование.",
+    ],
+    "tavern.greet": [
+        "Грейся у огня, путник. Говорят, {rumor_lc}",
+        "Садись ближе к очагу. Слыхал? {rumor}",
+        "Ночью по улицам лучше не шастать — {rumor_lc}",
+        "Раз уж занесло — грейся у огня и держи свечу под рукой.",
+    ],
+    "tavern.no_money": [
+        "Эх, дружище, без монет и постель не согреет.",
+        "В долг не сдаю, уж не обессудь — приходи с монетой.",
+        "Лавка у очага бесплатна, а кровать — нет. Возвращайся с деньгами.",
+    ],
+    "tavern.rest_success": [
+        "Лицо посвежело — значит, кровать честно отработала!",
+        "Вот теперь на человека похож. Дорога ждёт.",
+        "Выспался? Тогда и беда не страшна. Ступай, пока дорога сухая.",
+    ],
+}
+
+_DEFAULTS = {"player": "Путник", "dungeon": "подземелье"}
+
+_SLOT_RE = re.compile(r"\{(\w+)\}")
+_TAG_RE = re.compile(r"<[^>]+>")
+_SENT_END = (".", "!", "?", "…")
+_DASHES = ("—", "–", "-")
+
+
+class MarkovChain:
+    """Словесная цепь Маркова порядка order: учится на предложениях, генерирует одно предложение."""
+
+    def __init__(self, order: int = 2):
+        self.order = max(1, int(order))
+        self._next: Dict[Tuple[str, ...], List[str]] = defaultdict(list)
+        self._starts: List[Tuple[str, ...]] = []
+
+    def train(self, texts: List[str]) -> None:
+        for text in texts:
+            # строки — отдельно: заголовок кампании без точки не должен прилипать к тексту
+            for line in _TAG_RE.sub(" ", text).replace("«", "").replace("»", "").splitlines():
+                # эмодзи — не слова, тире — оставляем
+                words = [w for w in line.split() if w in _DASHES or any(ch.isalpha() for ch in w)]
+                sentence: List[str] = []
+                for w in words:
+                    sentence.append(w)
+                    if w.endswith(_SENT_END):
+                        self._add(sentence)
+                        sentence = []
+
+    def _add(self, words: List[str]) -> None:
+        if len(words) <= self.order:
+            return
+        self._starts.append(tuple(words[:self.order]))
+        for i in range(len(words) - self.order):
+            self._next[tuple(words[i:i + self.order])].append(words[i + self.order])
+
+    def sentence(self, rng: random.Random, min_words: int = 6, max_words: int = 22,
+                 attempts: int = 8) -> Optional[str]:
+        if not self._starts:
+            return None
+        for _ in range(attempts):
+            state = rng.choice(self._starts)
+            out = list(state)
+            while len(out) < max_words and not out[-1].endswith(_SENT_END):
+                options = self._next.get(tuple(out[-self.order:]))
+                if not options:
+                    break
+                out.append(rng.choice(options))
+            if min_words <= len(out) and out[-1].endswith(_SENT_END):
+                return " ".join(out)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._next)
+
+
+class Narrator:
+    """
+    Процедурный рассказчик: шаблонная грамматика + цепь Маркова по нашим же текстам
+    (кампании из app.core.campaign и описания предметов items_lore.txt). Без сети,
+    за микросекунды — фолбэк, когда LLM выключен, не успел или разомкнут предохранитель.
+
+    kind совпадает с purpose учёта LLM ("dungeon.search", "tavern.greet", ...): неизвестный
+    вид ищется по префиксу ("dungeon.road.xxx" -> "dungeon.road" -> "dungeon").
+    Цепь обучается лениво, при первом обращении.
+    """
+
+    def __init__(self, templates: Dict[str, List[str]], slots: Dict[str, List[str]],
+                 order: int = 2, seed: Optional[int] = None):
+        self.templates = templates
+        self.slots = slots
+        self._rng = random.Random(seed)
+        self._chain = MarkovChain(order)        # кампании + предметы: детали подземелий
+        self._rumors = MarkovChain(order)       # только кампании: слухи
+        self._trained = False
+
+        self.generated = 0
+        self.markov_used = 0
+        self.train_ms = 0.0
+
+    def _ensure_trained(self) -> None:
+        if self._trained:
+            return
+        self._trained = True
+        t0 = time.perf_counter()
+        try:
+            from .campaign import campaign_texts
+            from .items_lore_repo import lore_descriptions
+            self._rumors.train(campaign_texts())
+            self._chain.train(campaign_texts() + lore_descriptions())
+        except Exception:
+            log.exception("narrator: markov training failed, templates only")
+        self.train_ms = (time.perf_counter() - t0) * 1000
+        log.debug("narrator: markov chain %d states in %.1f ms", len(self._chain), self.train_ms)
+
+    def _templates_for(self, kind: str) -> List[str]:
+        key = kind
+        while key:
+            if key in self.templates:
+                return self.templates[key]
+            key = key.rpartition(".")[0]
+        return self.templates["dungeon"]
+
+    def _markov(self, chain: MarkovChain) -> str:
+        self._ensure_trained()
+        text = chain.sentence(self._rng)
+        if text:
+            self.markov_used += 1
+        return text or ""
+
+    def _expand(self, template: str, subs: Dict[str, str]) -> str:
+        def repl(m: "re.Match[str]") -> str:
+            name = m.group(1)
+            key = name.lower()
+            if key in ("markov", "rumor"):
+                return self._markov(self._chain if key == "markov" else self._rumors)
+            if key == "rumor_lc":
+                text = self._markov(self._rumors)
+                return text[:1].lower() + text[1:] if text else "в округе опять неспокойно."
+            if key in subs:
+                value = subs[key] or _DEFAULTS.get(key, "")
+            elif key in self.slots:
+                value = self._rng.choice(self.slots[key])
+            else:
+                value = _DEFAULTS.get(key, "")
+            return value[:1].upper() + value[1:] if name[:1].isupper() else value
+        text = _SLOT_RE.sub(repl, template)
+        return re.sub(r"\s{2,}", " ", text).strip()
+
+    def narrate(self, kind: str, subs: Optional[Dict[str, str]] = None) -> str:
+        """Короткий текст сцены kind; subs — имена (player, dungeon)."""
+        self.generated += 1
+        template = self._rng.choice(self._templates_for(kind))
+        return self._expand(template, dict(_DEFAULTS, **{k: v for k, v in (subs or {}).items() if v}))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "generated": self.generated,
+            "markov_used": self.markov_used,
+            "markov_states": len(self._chain),
+            "train_ms": round(self.train_ms, 2),
+        }
+
+
+# Общий рассказчик
+narrator = Narrator(_TEMPLATES, _SLOTS)
@@ -1,60 +1,129 @@
 # app/core/persistence.py
-import os, json
-from typing import Optional
+import os, json, struct, zlib
+from dataclasses import fields
+from typing import Any, Callable, Dict, Optional, Union
+from . import config
 from .models import Player
 from .stats import max_hp_for
 
 SAVES_DIR = "saves"
 
+# Сохраняемые поля игрока (dng и прочие transient — только до рестарта)
+_DOC_FIELDS = tuple(f.name for f in fields(Player) if not f.metadata.get("transient"))
+
+def field_to_doc(p: Player, name: str) -> Any:
+    """Значение одного поля в JSON-совместимом виде (копия для dict-полей)."""
+    v = getattr(p, name)
+    if name == "ability_meta":
+        return {k: dict(m) for k, m in v.items()}
+    if isinstance(v, dict):
+        return dict(v)
+    return v
+
+def is_doc_field(name: str) -> bool:
+    return name in _DOC_FIELDS
+
+def player_to_doc(p: Player) -> Dict[str, Any]:
+    """Игрок -> JSON-совместимый dict со всеми сохраняемыми полями."""
+    return {name: field_to_doc(p, name) for name in _DOC_FIELDS}
+
+def player_from_doc(d: Dict[str, Any]) -> Player:
+    """Обратное к player_to_doc: неизвестные ключи игнорируем, недостающие берём по умолчанию."""
+    return Player(**{k: v for k, v in d.items() if k in _DOC_FIELDS})
+
+# ---------- Формат сохранения ----------
+#
+# [4 байта MAGIC][1 байт версия схемы][1 байт флаги] + тело: компактный JSON (UTF-8),
+# при FLAG_ZLIB — сжатый zlib. Старые документы (голый JSON из save_to_disk, схема 1)
+# читаются как есть и поднимаются миграциями до SCHEMA_VERSION прямо при загрузке.
+#
+# zlib — размен CPU на байты. tools/bench_save_format.py против старого pretty-JSON:
+# документ в ~2.2x меньше, кодирование от ~1.0x до ~1.7x по времени (зависит от машины),
+# декодирование ~2x медленнее (десятки мкс на игрока). Порог и уровень
+# настраиваются (SAVE_COMPRESS_FROM / SAVE_COMPRESS_LEVEL); уровень 0 — не сжимать вовсе,
+# флаг в заголовке, так что сжатые и несжатые документы читаются одинаково.
+
+MAGIC = b"RGSV"
+SCHEMA_VERSION = 2
+FLAG_ZLIB = 0x01
+_HEADER = struct.Struct(">4sBB")
+_COMPRESS_FROM = config.SAVE_COMPRESS_FROM     # мелкие документы zlib только раздувает
+_COMPRESS_LEVEL = config.SAVE_COMPRESS_LEVEL
+
+_MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+
+def migration(from_version: int):
+    """Регистрирует апгрейд документа from_version -> from_version + 1."""
+    def deco(fn: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        _MIGRATIONS[from_version] = fn
+        return fn
+    return deco
+
+@migration(1)
+def _v1_to_v2(d: Dict[str, Any]) -> Dict[str, Any]:
+    # v1 (старый save_to_disk): опыт назывался xp, было поле location; статы и умения не сохранялись
+    if "xp" in d:
+        d["exp"] = d.pop("xp")
+    d.pop("location", None)
+    return d
+
+def migrate_doc(d: Dict[str, Any], version: int) -> Dict[str, Any]:
+    while version < SCHEMA_VERSION:
+        step = _MIGRATIONS.get(version)
+        if step is None:
+            raise ValueError(f"нет миграции схемы сохранения v{version} -> v{version + 1}")
+        d = step(d)
+        version += 1
+    return d
+
+def _guess_json_version(d: Dict[str, Any]) -> int:
+    return 1 if ("xp" in d or "location" in d) else SCHEMA_VERSION
+
+def encode_doc(doc: Dict[str, Any]) -> bytes:
+    body = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    flags = 0
+    if _COMPRESS_LEVEL > 0 and len(body) >= _COMPRESS_FROM:
+        body = zlib.compress(body, _COMPRESS_LEVEL)
+        flags |= FLAG_ZLIB
+    return _HEADER.pack(MAGIC, SCHEMA_VERSION, flags) + body
+
+def decode_doc(raw: Union[bytes, str]) -> Dict[str, Any]:
+    """Бинарный контейнер или старый JSON -> документ текущей схемы."""
+    if isinstance(raw, str):
+        d = json.loads(raw)
+        return migrate_doc(d, _guess_json_version(d))
+    if raw[:4] != MAGIC:
+        d = json.loads(raw.decode("utf-8"))
+        return migrate_doc(d, _guess_json_version(d))
+    _, version, flags = _HEADER.unpack_from(raw)
+    body = raw[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    return migrate_doc(json.loads(body.decode("utf-8")), version)
+
+# ---------- Файлы в saves/ ----------
+
 def ensure_dir():
     if not os.path.isdir(SAVES_DIR):
         os.makedirs(SAVES_DIR, exist_ok=True)
 
 def save_to_disk(p: Player) -> str:
     ensure_dir()
-    path = os.path.join(SAVES_DIR, f"{p.user_id}.json")
-    data = {
-        "user_id": p.user_id,
-        "gender": p.gender,
-        "name": p.name,
-        "class_key": p.class_key,
-        "class_label": p.class_label,
-        "level": p.level,
-        "xp": p.xp,
-        "gold": p.gold,
-        "hp": p.hp,
-        "max_hp": p.max_hp,
-        "equipment": p.equipment,
-        "inventory": p.inventory,
-        "location": p.location,
-        "city_name": p.city_name,
-    }
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    path = os.path.join(SAVES_DIR, f"{p.user_id}.sav")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode_doc(player_to_doc(p)))
+    os.replace(tmp, path)
     return path
 
 def load_from_disk(user_id: int) -> Optional[Player]:
-    path = os.path.join(SAVES_DIR, f"{user_id}.json")
+    path = os.path.join(SAVES_DIR, f"{user_id}.sav")
     if not os.path.isfile(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        d = json.load(f)
-    p = Player(
-        user_id=d["user_id"],
-        gender=d["gender"],
-        name=d["name"],
-        class_key=d["class_key"],
-        class_label=d["class_label"],
-        level=d.get("level", 1),
-        xp=d.get("xp", 0),
-        gold=d.get("gold", 0),
-        hp=d.get("hp", 0),
-        max_hp=d.get("max_hp", 0),
-        equipment=d.get("equipment", {"weapon": None, "armor": None}),
-        inventory=d.get("inventory", {}),
-        location=d.get("location", "city"),
-        city_name=d.get("city_name", "Безымянный город"),
-    )
+        path = os.path.join(SAVES_DIR, f"{user_id}.json")   # старый формат
+        if not os.path.isfile(path):
+            return None
+    with open(path, "rb") as f:
+        p = player_from_doc(decode_doc(f.read()))
     # sanity check
     if p.max_hp <= 0:
         p.max_hp = max_hp_for(p.level, p.class_key)
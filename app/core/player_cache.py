@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# app/core/player_cache.py
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from .models import Player
+
+# Оценка размера игрока, пока мы не видели его сериализованный документ
+DEFAULT_ENTRY_BYTES = 2048
+
+
+class PlayerCache:
+    """
+    Горячий LRU-кэш игроков с бюджетом по числу записей и по байтам.
+
+    Выселяются только «чистые» игроки (can_evict=True). Закреплённые через pin() (идёт
+    FSM-создание, забег в подземелье) не выселяются, пока не вызван unpin() или не истёк
+    pin_ttl — брошенный сценарий не держит игрока в памяти вечно. Размер записи —
+    длина её последнего сериализованного документа (обновляется через resize()).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int,
+                 can_evict: Optional[Callable[[int], bool]] = None,
+                 on_evict: Optional[Callable[[int], None]] = None,
+                 pin_ttl: float = 24 * 3600):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.pin_ttl = float(pin_ttl)
+        self._can_evict = can_evict or (lambda _uid: True)
+        self._on_evict = on_evict
+
+        self._entries: "OrderedDict[int, Player]" = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._bytes = 0
+        self._pins: Dict[int, float] = {}      # user_id -> момент, когда закрепление истекает
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int) -> Optional[Player]:
+        p = self._entries.get(user_id)
+        if p is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return p
+
+    def peek(self, user_id: int) -> Optional[Player]:
+        """Без учёта в LRU и счётчиках — для служебных нужд хранилища."""
+        return self._entries.get(user_id)
+
+    def put(self, user_id: int, p: Player, size: Optional[int] = None) -> None:
+        if user_id in self._entries:
+            self._entries.move_to_end(user_id)
+        self._entries[user_id] = p
+        if size is not None or user_id not in self._sizes:
+            self.resize(user_id, size if size is not None else DEFAULT_ENTRY_BYTES)
+        self.evict()
+
+    def resize(self, user_id: int, size: int) -> None:
+        if user_id not in self._entries:
+            return
+        self._bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+
+    # ---------- закрепление ----------
+
+    def pin(self, user_id: int) -> None:
+        """Закрепить (или продлить закрепление) на pin_ttl секунд."""
+        self._pins[user_id] = time.monotonic() + self.pin_ttl
+
+    def unpin(self, user_id: int) -> None:
+        if self._pins.pop(user_id, None) is not None:
+            self.evict()
+
+    def is_pinned(self, user_id: int) -> bool:
+        until = self._pins.get(user_id)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._pins[user_id]
+            return False
+        return True
+
+    # ---------- выселение ----------
+
+    def _over_budget(self) -> bool:
+        return len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+
+    def evict(self) -> int:
+        """Выселить самых давних чистых и незакреплённых, пока не уложимся в бюджет."""
+        if not self._over_budget():
+            return 0
+        evicted = 0
+        # берём самого давнего; невыселяемого переносим в MRU-конец, чтобы не сканировать
+        # его снова при каждом put — один проход не длиннее размера кэша
+        skipped = 0
+        while self._over_budget() and skipped < len(self._entries):
+            uid = next(iter(self._entries))
+            if self.is_pinned(uid) or not self._can_evict(uid):
+                self._entries.move_to_end(uid)
+                skipped += 1
+                continue
+            del self._entries[uid]
+            self._bytes -= self._sizes.pop(uid, 0)
+            if self._on_evict is not None:
+                self._on_evict(uid)
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        now = time.monotonic()
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "pinned": sum(1 for until in self._pins.values() if until > now),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
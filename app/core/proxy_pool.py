@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# app/core/proxy_pool.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+
+log = logging.getLogger(__name__)
+
+DIRECT = "direct"      # строка в proxies.txt: ходить без прокси
+
+
+def _failover_errors() -> Tuple[Type[BaseException], ...]:
+    """Ошибки, после которых пробуем следующий прокси (до сервиса не достучались)."""
+    import httpx
+    import openai
+    # APITimeoutError — подкласс APIConnectionError; TransportError покрывает ProxyError,
+    # ConnectError, таймауты и RemoteProtocolError httpx
+    return (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)
+
+
+def load_proxies(path: str, single: str = "") -> List[str]:
+    """Список прокси: OPENAI_PROXY (если задан) первым, затем строки файла без комментариев."""
+    out: List[str] = []
+    if single:
+        out.append(single.strip())
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#") and line not in out:
+                    out.append(line)
+    return out
+
+
+class ProxyPool:
+    """
+    Клиент OpenAI поверх пула прокси (совместим с client.chat.completions.create).
+
+    На каждый прокси — свой AsyncOpenAI с keep-alive пулом соединений httpx, так что
+    повторные запросы не платят за TCP/TLS/CONNECT. Все прокси проверяются параллельно
+    (лёгкий models.list) на старте и раз в probe_interval секунд; живые ранжируются по
+    задержке, запрос идёт через самый быстрый. Не достучались — прокси выбывает до
+    следующей проверки, запрос тут же повторяется через следующий.
+
+    Выбыли все — запрос сам запускает внеплановую проверку (не чаще раза в
+    reprobe_interval секунд, одну на всех ждущих), а если живых так и нет, пробует
+    прокси, упавший раньше остальных: короткий сбой не выключает LLM до планового тика.
+    """
+
+    def __init__(self, proxies: List[str], api_key: str, base_url: Optional[str] = None,
+                 probe_timeout: float = 8.0, probe_interval: float = 300.0,
+                 request_timeout: float = 60.0, max_connections: int = 20,
+                 reprobe_interval: float = 10.0):
+        self.proxies = list(proxies)
+        self.probe_timeout = float(probe_timeout)
+        self.probe_interval = float(probe_interval)
+        self.reprobe_interval = float(reprobe_interval)
+        self._clients: Dict[str, Any] = {}
+        self._latency: Dict[str, float] = {}
+        self._ranked: List[str] = []          # живые, от быстрого к медленному
+        self._errors: Dict[str, str] = {}
+        self._down_at: Dict[str, float] = {}   # когда прокси выбыл (monotonic)
+        self._task: Optional[asyncio.Task] = None
+        self._reprobe_task: Optional[asyncio.Task] = None
+        self._last_probe = -math.inf
+        self._probed = False
+        self._failover = _failover_errors()
+
+        from openai import AsyncOpenAI
+        import httpx
+
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections, keepalive_expiry=90.0)
+        for proxy in self.proxies:
+            try:
+                http = httpx.AsyncClient(proxy=None if proxy == DIRECT else proxy,
+                                         limits=limits, timeout=request_timeout)
+            except Exception as e:          # например, socks5 без httpx[socks]
+                log.warning("proxy %s skipped: %s", proxy, e)
+                self._errors[proxy] = str(e)
+                continue
+            self._clients[proxy] = AsyncOpenAI(api_key=api_key, base_url=base_url,
+                                               http_client=http, max_retries=0)
+        # до первой проверки — в порядке файла
+        self._ranked = list(self._clients)
+
+        self.requests = 0
+        self.failovers = 0
+        self.reprobes = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    # ---------- проверки ----------
+
+    async def _probe(self, proxy: str) -> Optional[float]:
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(self._clients[proxy].models.list(), self.probe_timeout)
+        except Exception as e:
+            self._errors[proxy] = f"{type(e).__name__}: {e}"
+            return None
+        self._errors.pop(proxy, None)
+        return time.monotonic() - t0
+
+    async def probe_all(self) -> Dict[str, Optional[float]]:
+        """Проверить все прокси одновременно и пересобрать рейтинг."""
+        self._last_probe = time.monotonic()
+        names = list(self._clients)
+        results = await asyncio.gather(*(self._probe(p) for p in names))
+        for proxy, latency in zip(names, results):
+            self._latency[proxy] = latency if latency is not None else math.inf
+            if latency is not None:
+                self._down_at.pop(proxy, None)
+        ranked = sorted((p for p in names if self._latency[p] < math.inf), key=self._latency.__getitem__)
+        if ranked != self._ranked:
+            log.info("proxy ranking: %s", ", ".join(f"{p} {self._latency[p] * 1000:.0f}ms" for p in ranked) or "no healthy proxies")
+        self._ranked = ranked
+        self._probed = True
+        return dict(zip(names, results))
+
+    async def _probe_loop(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception:
+                log.exception("proxy probe failed")
+            await asyncio.sleep(self.probe_interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._probe_loop(), name="proxy-probe")
+
+    async def _reprobe(self) -> None:
+        """Внеплановая проверка, когда живых не осталось; одна на всех ждущих запросов."""
+        if self._reprobe_task is None or self._reprobe_task.done():
+            if time.monotonic() - self._last_probe < self.reprobe_interval:
+                return
+            self.reprobes += 1
+            self._reprobe_task = asyncio.get_running_loop().create_task(self.probe_all(), name="proxy-reprobe")
+        try:
+            # shield: отмена одного запроса не должна обрывать проверку для остальных
+            await asyncio.shield(self._reprobe_task)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("proxy reprobe failed")
+
+    async def close(self) -> None:
+        for task in (self._task, self._reprobe_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        for client in self._clients.values():
+            await client.close()
+
+    # ---------- запросы ----------
+
+    def _mark_down(self, proxy: str, e: BaseException) -> None:
+        if proxy in self._ranked:
+            self._ranked.remove(proxy)
+        self._latency[proxy] = math.inf
+        self._down_at[proxy] = time.monotonic()
+        self._errors[proxy] = f"{type(e).__name__}: {e}"
+        log.warning("proxy %s failed (%s), %d left", proxy, type(e).__name__, len(self._ranked))
+
+    def _oldest_down(self, exclude: Set[str]) -> List[str]:
+        """Живых нет и после проверки — последний шанс: прокси, упавший раньше остальных."""
+        rest = [p for p in self._clients if p not in exclude]
+        return sorted(rest, key=lambda p: self._down_at.get(p, 0.0))[:1]
+
+    async def _create(self, **kwargs: Any) -> Any:
+        self.start()
+        self.requests += 1
+        last: Optional[BaseException] = None
+        tried: Set[str] = set()
+        # второй круг — если за первый выбыли все: внеплановая проверка и ещё попытка
+        for _ in range(2):
+            if not self._ranked:
+                await self._reprobe()
+            candidates = [p for p in self._ranked if p not in tried] or self._oldest_down(tried)
+            for proxy in candidates:
+                tried.add(proxy)
+                try:
+                    return await self._clients[proxy].chat.completions.create(**kwargs)
+                except self._failover as e:
+                    # прочие ошибки — ответ от API (400/429/500), прокси ни при чём: летят наверх
+                    self._mark_down(proxy, e)
+                    self.failovers += 1
+                    last = e
+        raise last or ConnectionError("no healthy proxies")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": [(p, round(self._latency.get(p, 0) * 1000)) for p in self._ranked],
+            "down": {p: err for p, err in self._errors.items() if p not in self._ranked},
+            "requests": self.requests,
+            "failovers": self.failovers,
+            "reprobes": self.reprobes,
+        }
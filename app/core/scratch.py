@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# app/core/scratch.py
+from __future__ import annotations
+
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from . import config
+
+_Key = Tuple[str, Hashable]
+
+
+class ScratchStore:
+    """
+    Временное состояние экранов (что показали игроку в списке выбора и т.п.).
+
+    У каждой записи свой TTL, у всего хранилища — общий лимит записей (при переполнении
+    уходят самые давно записанные). Просрочка — хэшированное «колесо» таймеров: запись
+    кладётся в слот своего тика истечения, каждая операция проворачивает колесо до текущего
+    тика и разбирает только наступившие слоты — O(1) амортизированно, без сканов.
+    """
+
+    def __init__(self, ttl: float = 900, max_entries: int = 10000, resolution: float = 1.0,
+                 max_ttl: Optional[float] = None):
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.resolution = float(resolution)
+        horizon = max(self.ttl, float(max_ttl or 0))
+        self._nslots = max(8, int(math.ceil(horizon / self.resolution)) + 1)
+        self._wheel: List[Set[_Key]] = [set() for _ in range(self._nslots)]
+        self._entries: "OrderedDict[_Key, Tuple[Any, int]]" = OrderedDict()   # key -> (value, тик истечения)
+        self._tick = self._now_tick()
+
+        self.sets = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _now_tick(self) -> int:
+        return int(time.monotonic() / self.resolution)
+
+    # ---------- колесо ----------
+
+    def _advance(self) -> None:
+        now = self._now_tick()
+        if now <= self._tick:
+            return
+        # за один оборот колеса встречаем каждый слот не больше раза
+        steps = min(now - self._tick, self._nslots)
+        for t in range(now - steps + 1, now + 1):
+            bucket = self._wheel[t % self._nslots]
+            if not bucket:
+                continue
+            keep: Set[_Key] = set()
+            for key in bucket:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue                      # удалили раньше
+                if entry[1] <= now:
+                    del self._entries[key]
+                    self.expired += 1
+                elif entry[1] % self._nslots == t % self._nslots:
+                    keep.add(key)                 # истекает через полный оборот
+            bucket.clear()
+            bucket.update(keep)
+        self._tick = now
+
+    # ---------- API ----------
+
+    def set(self, ns: str, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._advance()
+        k = (ns, key)
+        ttl_ticks = max(1, int(math.ceil((ttl if ttl is not None else self.ttl) / self.resolution)))
+        ttl_ticks = min(ttl_ticks, self._nslots - 1)
+        expire = self._tick + ttl_ticks
+        if k in self._entries:
+            self._entries.move_to_end(k)
+        self._entries[k] = (value, expire)
+        self._wheel[expire % self._nslots].add(k)
+        self.sets += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, ns: str, key: Hashable, default: Any = None) -> Any:
+        self._advance()
+        entry = self._entries.get((ns, key))
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[0]
+
+    def pop(self, ns: str, key: Hashable, default: Any = None) -> Any:
+        self._advance()
+        entry = self._entries.pop((ns, key), None)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[0]
+
+    def delete(self, ns: str, key: Hashable) -> None:
+        self._entries.pop((ns, key), None)
+
+    def namespace(self, ns: str, ttl: Optional[float] = None) -> "ScratchNamespace":
+        return ScratchNamespace(self, ns, ttl)
+
+    def __len__(self) -> int:
+        self._advance()
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self),
+            "sets": self.sets,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+class ScratchNamespace:
+    """Представление ScratchStore для одного сценария (например, "market.sale")."""
+
+    def __init__(self, store: ScratchStore, ns: str, ttl: Optional[float] = None):
+        self.store = store
+        self.ns = ns
+        self.ttl = ttl
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self.store.set(self.ns, key, value, self.ttl)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.store.get(self.ns, key, default)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self.store.pop(self.ns, key, default)
+
+    def delete(self, key: Hashable) -> None:
+        self.store.delete(self.ns, key)
+
+
+# Общий экземпляр для всех фич
+scratch = ScratchStore(ttl=config.SCRATCH_TTL, max_entries=config.SCRATCH_MAX_ENTRIES)
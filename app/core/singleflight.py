@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# app/core/singleflight.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых запросов: пока по ключу идёт вызов, остальные ждут его результат.
+
+    Пятьдесят игроков выбрали «мага» в одну секунду после рестарта — в LLM уходит один
+    запрос, все пятьдесят получают его ответ (или его исключение). Работа идёт отдельной
+    задачей: отмена одного из ждущих (игрок ушёл с экрана) не отменяет её для остальных.
+    После завершения ключ освобождается — кэширование результата остаётся за вызывающим.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0        # реально выполненных вызовов
+        self.coalesced = 0      # сколько вызовов присоединилось к уже идущему
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # если все ждущие отменились, исключение всё равно считаем полученным
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
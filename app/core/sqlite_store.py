@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+# app/core/sqlite_store.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .journal import apply_records, diff_docs
+from .models import Player
+from .persistence import (
+    decode_doc, encode_doc, field_to_doc, is_doc_field, player_to_doc, player_from_doc,
+)
+from .player_cache import PlayerCache
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class _Batch:
+    """Что уйдёт на диск одной транзакцией."""
+    snapshots: List[Tuple[int, bytes, float]] = field(default_factory=list) # (uid, encode_doc, ts)
+    records: List[Tuple[int, str, float]] = field(default_factory=list)     # (uid, rec, ts)
+    uids: Set[int] = field(default_factory=set)
+
+    def __bool__(self) -> bool:
+        return bool(self.uids)
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class SqlitePlayerStore:
+    """
+    Долговременное хранилище игроков в SQLite (WAL) с отложенной записью.
+
+    save() ничего не пишет на диск — только помечает игрока «грязным». Раз в
+    flush_interval секунд фоновая задача одной транзакцией сбрасывает всех грязных
+    игроков. Пять save_player подряд в одном хендлере = одна запись в одном коммите.
+    На остановке close() дописывает хвост синхронно.
+
+    Запись — не весь документ, а журнал мутаций (app.core.journal): «gold -8»,
+    «inventory Зелье +1». Что менялось, игрок знает сам (Player.changes(): поля и ключи
+    inventory/equipment), так что сравниваем только их; save() без изменений — no-op.
+    Документ целиком (снимок) пишется для новых игроков и когда
+    хвост журнала игрока перерастает compact_every — снимок заодно чистит его хвост.
+    Чтение и старт проигрывают снимок + хвост.
+
+    В памяти держим только горячий LRU-кэш (PlayerCache); промах читает игрока с диска.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0,
+                 cache_entries: int = 5000, cache_bytes: int = 64 * 1024 * 1024,
+                 compact_every: int = 64, pin_ttl: float = 24 * 3600):
+        self.path = path
+        self.flush_interval = max(0.05, float(flush_interval))
+        self.compact_every = max(1, int(compact_every))
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS players ("
+            " user_id INTEGER PRIMARY KEY,"
+            " doc BLOB NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id INTEGER NOT NULL,"
+            " rec TEXT NOT NULL,"
+            " ts REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS journal_user ON journal(user_id, seq)")
+
+        self._pending: Dict[int, Player] = {}   # ждут сброса на диск
+        self._inflight: Set[int] = set()        # уже сериализованы, но коммит ещё не завершён
+        self._base: Dict[int, Dict[str, Any]] = {}  # документ игрока, каким он лежит на диске
+        self._tail: Dict[int, int] = {}             # длина хвоста журнала после снимка
+        # загруженные/созданные объекты (identity важна хендлерам); грязных не выселяем
+        self.cache = PlayerCache(cache_entries, cache_bytes,
+                                 can_evict=self._is_clean, on_evict=self._forget, pin_ttl=pin_ttl)
+        self._task: Optional[asyncio.Task] = None
+
+        # метрики
+        self.saves = 0
+        self.saves_skipped = 0      # save_player без единой мутации
+        self.flushes = 0
+        self.snapshots_written = 0
+        self.records_written = 0
+        self.bytes_written = 0
+        self.bytes_changed = 0      # объём самих изменений (для write amplification)
+
+        self.recovered = self._recover()
+
+    # ---------- API хранилища ----------
+
+    def save(self, p: Player) -> None:
+        self.saves += 1
+        uid = p.user_id
+        if uid in self._base and uid not in self._pending and not p.has_changes():
+            self.saves_skipped += 1
+            self.cache.put(uid, p)
+            return
+        self._pending[uid] = p
+        self.cache.put(uid, p)
+
+    def get(self, user_id: int) -> Optional[Player]:
+        p = self.cache.get(user_id)
+        if p is not None:
+            return p
+        loaded = self._load(user_id)
+        if loaded is None:
+            return None
+        doc, tail, size = loaded
+        p = player_from_doc(doc)
+        self._base[user_id] = player_to_doc(p)
+        self._tail[user_id] = tail
+        self.cache.put(user_id, p, size)
+        return p
+
+    def has(self, user_id: int) -> bool:
+        if user_id in self.cache:
+            return True
+        with self._db_lock:
+            row = self._conn.execute("SELECT 1 FROM players WHERE user_id=?", (user_id,)).fetchone()
+        return row is not None
+
+    # ---------- фоновый сброс ----------
+
+    def start(self) -> None:
+        """Запустить периодический сброс в текущем event loop (если он есть)."""
+        if self._task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # без loop пишем только по flush()/close()
+        self._task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            batch = self._drain()
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write, batch)
+                except Exception:
+                    log.exception("sqlite flush failed, %d players returned to queue", len(batch.uids))
+                    self._requeue(batch)
+                finally:
+                    self._settle(batch)
+
+    def flush(self) -> int:
+        """Синхронно сбросить всё накопленное. Возвращает число затронутых игроков."""
+        batch = self._drain()
+        if batch:
+            try:
+                self._write(batch)
+            except Exception:
+                self._requeue(batch)
+                raise
+            finally:
+                self._settle(batch)
+        return len(batch.uids)
+
+    # ---------- закрепление в кэше ----------
+
+    def pin(self, user_id: int) -> None:
+        self.cache.pin(user_id)
+
+    def unpin(self, user_id: int) -> None:
+        self.cache.unpin(user_id)
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            self.flush()
+        finally:
+            with self._db_lock:
+                self._conn.close()
+
+    # ---------- внутреннее ----------
+
+    def _drain(self) -> _Batch:
+        # Сериализуем в потоке event loop — хендлеры не успеют поменять объект посреди json.dumps
+        batch = _Batch()
+        if not self._pending:
+            return batch
+        pending, self._pending = self._pending, {}
+        now = time.time()
+        for uid, p in pending.items():
+            base = self._base.get(uid)
+            if base is None:
+                # новый (или неизвестный диску) игрок — только полный снимок
+                doc = player_to_doc(p)
+                blob = encode_doc(doc)
+                batch.snapshots.append((uid, blob, now))
+                self.bytes_changed += len(blob)
+                self._tail[uid] = 0
+                self.cache.resize(uid, len(blob))
+                self._base[uid] = doc
+            else:
+                recs = self._delta(p, base)
+                if not recs:
+                    p.clear_changes()
+                    continue
+                texts = [_dumps(r) for r in recs]
+                self.bytes_changed += sum(len(t) for t in texts)
+                if self._tail.get(uid, 0) + len(recs) <= self.compact_every:
+                    batch.records.extend((uid, t, now) for t in texts)
+                    self._tail[uid] = self._tail.get(uid, 0) + len(recs)
+                else:
+                    blob = encode_doc(base)
+                    batch.snapshots.append((uid, blob, now))
+                    self._tail[uid] = 0
+                    self.cache.resize(uid, len(blob))
+            p.clear_changes()
+            batch.uids.add(uid)
+            self._inflight.add(uid)
+        return batch
+
+    @staticmethod
+    def _delta(p: Player, base: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Записи журнала только по изменённым полям/ключам; base доводится до текущего состояния."""
+        old: Dict[str, Any] = {}
+        new: Dict[str, Any] = {}
+        for name, keys in p.changes().items():
+            if not is_doc_field(name):
+                continue
+            value = field_to_doc(p, name)
+            prev = base.get(name)
+            if keys is not None and name in ("inventory", "equipment") and isinstance(prev, dict):
+                old[name] = {k: prev[k] for k in keys if k in prev}
+                new[name] = {k: value[k] for k in keys if k in value}
+            else:
+                if name in base:
+                    old[name] = prev
+                new[name] = value
+            base[name] = value
+        return diff_docs(old, new)
+
+    def _requeue(self, batch: _Batch) -> None:
+        for uid in batch.uids:
+            # что на диске — теперь неизвестно: следующий сброс запишет полный снимок
+            self._base.pop(uid, None)
+            p = self.cache.peek(uid)
+            if p is not None:
+                self._pending.setdefault(uid, p)
+
+    def _settle(self, batch: _Batch) -> None:
+        # записи на диске (или вернулись в очередь) — теперь кэш может выселять чистых
+        self._inflight.difference_update(batch.uids)
+        self.cache.evict()
+
+    def _is_clean(self, user_id: int) -> bool:
+        if user_id in self._pending or user_id in self._inflight:
+            return False
+        p = self.cache.peek(user_id)
+        # мутировали, но save_player ещё не звали — выселять рано
+        return p is None or not p.has_changes()
+
+    def _forget(self, user_id: int) -> None:
+        self._base.pop(user_id, None)
+        self._tail.pop(user_id, None)
+
+    def _write(self, batch: _Batch) -> None:
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                if batch.snapshots:
+                    self._conn.executemany(
+                        "INSERT INTO players(user_id, doc, updated_at) VALUES(?,?,?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET doc=excluded.doc, updated_at=excluded.updated_at",
+                        batch.snapshots,
+                    )
+                    # снимок поглощает весь прежний хвост журнала
+                    self._conn.executemany(
+                        "DELETE FROM journal WHERE user_id=?",
+                        [(uid,) for uid, _, _ in batch.snapshots],
+                    )
+                if batch.records:
+                    self._conn.executemany(
+                        "INSERT INTO journal(user_id, rec, ts) VALUES(?,?,?)", batch.records,
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.flushes += 1
+        self.snapshots_written += len(batch.snapshots)
+        self.records_written += len(batch.records)
+        self.bytes_written += sum(len(t) for _, t, _ in batch.snapshots)
+        self.bytes_written += sum(len(t) for _, t, _ in batch.records)
+
+    def _load(self, user_id: int) -> Optional[Tuple[Dict[str, Any], int, int]]:
+        """Снимок + хвост журнала -> (документ, длина хвоста, размер снимка)."""
+        with self._db_lock:
+            row = self._conn.execute("SELECT doc FROM players WHERE user_id=?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            tail = self._conn.execute(
+                "SELECT rec FROM journal WHERE user_id=? ORDER BY seq", (user_id,)
+            ).fetchall()
+        # decode_doc поднимает старые схемы (и JSON-тексты прежних версий стора) до текущей
+        doc = apply_records(decode_doc(row[0]), (json.loads(r[0]) for r in tail))
+        return doc, len(tail), len(row[0])
+
+    def _recover(self) -> int:
+        """Старт: свернуть хвосты журнала всех игроков в новые снимки. Возвращает число игроков."""
+        with self._db_lock:
+            uids = [r[0] for r in self._conn.execute("SELECT DISTINCT user_id FROM journal").fetchall()]
+        if not uids:
+            return 0
+        now = time.time()
+        snapshots = []
+        for uid in uids:
+            loaded = self._load(uid)
+            if loaded is not None:
+                snapshots.append((uid, encode_doc(loaded[0]), now))
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE players SET doc=?, updated_at=? WHERE user_id=?",
+                    [(doc, ts, uid) for uid, doc, ts in snapshots],
+                )
+                self._conn.executemany("DELETE FROM journal WHERE user_id=?", [(uid,) for uid in uids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        log.info("player journal: replayed tails of %d players into snapshots", len(snapshots))
+        return len(snapshots)
+
+    def stats(self) -> Dict[str, Any]:
+        st = {
+            "saves": self.saves,
+            "saves_skipped": self.saves_skipped,
+            "flushes": self.flushes,
+            "snapshots_written": self.snapshots_written,
+            "records_written": self.records_written,
+            "bytes_written": self.bytes_written,
+            "bytes_changed": self.bytes_changed,
+            # сколько байт пишем на байт реального изменения (снимки раздувают)
+            "write_amplification": round(self.bytes_written / self.bytes_changed, 2) if self.bytes_changed else 0.0,
+            "pending": len(self._pending),
+        }
+        st.update({f"cache_{k}": v for k, v in self.cache.stats().items()})
+        return st
@@ -1,15 +1,131 @@
 # -*- coding: utf-8 -*-
-from typing import Dict, Optional
+# app/core/storage.py
+from __future__ import annotations
+
+import atexit
+import logging
+from typing import Any, Dict, Optional, Protocol
+
+from . import config
 from .models import Player
 
-# Простое in-memory хранилище (стабильная версия до подземелья)
-_PLAYERS: Dict[int, Player] = {}
+log = logging.getLogger(__name__)
+
+
+class PlayerBackend(Protocol):
+    def save(self, p: Player) -> None: ...
+    def get(self, user_id: int) -> Optional[Player]: ...
+    def has(self, user_id: int) -> bool: ...
+    def start(self) -> None: ...
+    def flush(self) -> int: ...
+    def close(self) -> None: ...
+    def pin(self, user_id: int) -> None: ...
+    def unpin(self, user_id: int) -> None: ...
+    def stats(self) -> Dict[str, Any]: ...
+
+
+class MemoryBackend:
+    """Простое in-memory хранилище (живёт до рестарта процесса)."""
+
+    def __init__(self):
+        self.players: Dict[int, Player] = {}
+
+    def save(self, p: Player) -> None:
+        self.players[p.user_id] = p
+
+    def get(self, user_id: int) -> Optional[Player]:
+        return self.players.get(user_id)
+
+    def has(self, user_id: int) -> bool:
+        return user_id in self.players
+
+    def start(self) -> None:
+        pass
+
+    def flush(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+    def pin(self, user_id: int) -> None:
+        pass
+
+    def unpin(self, user_id: int) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cache_entries": len(self.players)}
+
+
+_backend: PlayerBackend = MemoryBackend()
+_initialized = False
+
+
+def _make_backend(kind: str) -> PlayerBackend:
+    if kind == "sqlite":
+        from .sqlite_store import SqlitePlayerStore
+        return SqlitePlayerStore(
+            config.STORAGE_PATH, config.STORAGE_FLUSH_INTERVAL,
+            cache_entries=config.PLAYER_CACHE_MAX_ENTRIES,
+            cache_bytes=config.PLAYER_CACHE_MAX_BYTES,
+            pin_ttl=config.PLAYER_PIN_TTL,
+        )
+    if kind != "memory":
+        log.warning("Unknown STORAGE_BACKEND=%r, falling back to memory", kind)
+    return MemoryBackend()
+
+
+def init_storage(backend: Optional[PlayerBackend] = None) -> PlayerBackend:
+    """
+    Выбрать бэкенд (по config.STORAGE_BACKEND, если не передан явно) и запустить фоновый сброс.
+    Вызывать из работающего event loop, до start_polling.
+    """
+    global _backend, _initialized
+    if _initialized:
+        shutdown_storage()
+    _backend = backend if backend is not None else _make_backend(config.STORAGE_BACKEND)
+    _backend.start()
+    _initialized = True
+    log.info("Player storage: %s", type(_backend).__name__)
+    return _backend
+
+
+def shutdown_storage() -> None:
+    """Хук остановки: дописать всё накопленное и закрыть бэкенд. Повторный вызов безопасен."""
+    global _initialized
+    if not _initialized:
+        return
+    _initialized = False
+    try:
+        _backend.close()
+    except Exception:
+        log.exception("Player storage shutdown failed")
+
+
+atexit.register(shutdown_storage)
+
+
+def get_backend() -> PlayerBackend:
+    return _backend
+
 
 def save_player(p: Player) -> None:
-    _PLAYERS[p.user_id] = p
+    _backend.save(p)
 
 def get_player(user_id: int) -> Optional[Player]:
-    return _PLAYERS.get(user_id)
+    return _backend.get(user_id)
 
 def has_player(user_id: int) -> bool:
-    return user_id in _PLAYERS
+    return _backend.has(user_id)
+
+def pin_player(user_id: int) -> None:
+    """Не выселять игрока из горячего кэша (идёт многошаговый сценарий, напр. FSM-создание)."""
+    _backend.pin(user_id)
+
+def unpin_player(user_id: int) -> None:
+    _backend.unpin(user_id)
+
+def storage_stats() -> Dict[str, Any]:
+    """Счётчики бэкенда: сохранения/сбросы и hit/miss/eviction горячего кэша."""
+    return _backend.stats()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# app/core/story_memory.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from typing import Any, Dict, List, Set
+
+from . import config
+from .tokens import count_tokens, trim_tokens
+
+log = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+# Фоновые сжатия сводки (держим ссылки, чтобы их не собрал GC)
+_TASKS: Set[asyncio.Task] = set()
+
+
+class StoryMemory:
+    """
+    Сюжетная память игрока для промптов LLM в фиксированном бюджете токенов.
+
+    В p.story хранится {"summary": str, "recent": [str], "rev": int}: recent — короткие
+    «вехи» последних ходов (каждая не длиннее beat_tokens), summary — сжатое прошлое.
+    Когда вехи перестают влезать в recent_tokens, старые сворачиваются в сводку:
+    сразу — детерминированно (хвост текста в пределах summary_tokens), затем в фоне
+    LLM переписывает сводку связнее, если успеет до следующей свёртки.
+
+    context() собирает блок для промпта: завязка кампании (первая фраза эпоса,
+    не весь p.world_story), сводка и свежие вехи — от новых к старым, пока хватает
+    budget. Размер промпта не растёт с длиной сессии; обрезка — по count_tokens.
+    """
+
+    def __init__(self, budget: int, recent_tokens: int, summary_tokens: int,
+                 premise_tokens: int, beat_tokens: int):
+        self.budget = int(budget)
+        self.recent_tokens = int(recent_tokens)
+        self.summary_tokens = int(summary_tokens)
+        self.premise_tokens = int(premise_tokens)
+        self.beat_tokens = int(beat_tokens)
+
+        self.beats = 0
+        self.folds = 0
+        self.refined = 0
+        self.refine_stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    # ---------- запись ----------
+
+    @staticmethod
+    def _state(p) -> Dict[str, Any]:
+        st = p.story or {}
+        return {"summary": st.get("summary", ""), "recent": list(st.get("recent") or []), "rev": int(st.get("rev", 0))}
+
+    def remember(self, p, beat: str) -> None:
+        """Добавить веху хода. Вызывающий сохраняет игрока (save_player) как обычно."""
+        if not self.enabled:
+            return
+        beat = trim_tokens(" ".join(beat.split()), self.beat_tokens)
+        if not beat:
+            return
+        st = self._state(p)
+        st["recent"].append(beat)
+        self.beats += 1
+
+        folded: List[str] = []
+        while len(st["recent"]) > 1 and sum(count_tokens(b) for b in st["recent"]) > self.recent_tokens:
+            folded.append(st["recent"].pop(0))
+        if folded:
+            self.folds += 1
+            st["rev"] += 1
+            raw = " ".join(x for x in [st["summary"]] + folded if x)
+            st["summary"] = trim_tokens(raw, self.summary_tokens, keep_tail=True)
+            self._spawn_refine(p.user_id, st["rev"], raw)
+        # присваиваем целиком — поле помечается изменённым для хранилища
+        p.story = st
+
+    # ---------- чтение ----------
+
+    def premise(self, p) -> str:
+        """Первая фраза эпоса кампании без заголовка и разметки."""
+        text = _TAG_RE.sub("", p.world_story or "")
+        lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+        body = " ".join(lines[1:] if len(lines) > 1 else lines)
+        first = re.split(r"(?<=[.!?…])\s", body, maxsplit=1)[0]
+        return trim_tokens(first, self.premise_tokens)
+
+    def context(self, p) -> str:
+        """Блок «что было раньше» для промпта; пусто — памяти нет или она выключена."""
+        if not self.enabled or not p.story or not (p.story.get("recent") or p.story.get("summary")):
+            return ""
+        left = self.budget
+        parts: List[str] = []
+
+        premise = self.premise(p)
+        if premise and count_tokens(premise) + 4 <= left:
+            parts.append(f"Мир: {premise}")
+            left -= count_tokens(parts[-1])
+
+        recent: List[str] = []
+        for beat in reversed(p.story.get("recent") or []):
+            cost = count_tokens(beat) + 1
+            if cost > left:
+                break
+            recent.append(beat)
+            left -= cost
+
+        summary = p.story.get("summary") or ""
+        if summary and left > 8:
+            summary = trim_tokens(summary, left - 4, keep_tail=True)
+            if summary:
+                parts.append(f"Ранее: {summary}")
+        if recent:
+            parts.append("Недавно: " + " ".join(reversed(recent)))
+        return "\n".join(parts)
+
+    # ---------- фоновое сжатие ----------
+
+    def _spawn_refine(self, user_id: int, rev: int, raw: str) -> None:
+        from .llm import llm
+        if not llm.enabled:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._refine(user_id, rev, raw))
+        except RuntimeError:
+            return
+        _TASKS.add(task)
+        task.add_done_callback(_TASKS.discard)
+
+    async def _refine(self, user_id: int, rev: int, raw: str) -> None:
+        from .llm import BACKGROUND, llm
+        from .storage import get_player, save_player
+
+        words = max(8, self.summary_tokens // 2)
+        text = await llm.chat(
+            [
+                {"role": "system", "content": f"Сожми хронику героя до {words} слов: только факты, прошедшее время, без оценок."},
+                {"role": "user", "content": raw},
+            ],
+            temperature=0.2, max_tokens=self.summary_tokens + 20, priority=BACKGROUND,
+            purpose="memory.summary",
+        )
+        if not text:
+            return
+        summary = trim_tokens(" ".join(text.split()), self.summary_tokens)
+        p = get_player(user_id)
+        if p is None or not p.story or int(p.story.get("rev", 0)) != rev:
+            self.refine_stale += 1      # пока LLM думал, вехи свернулись ещё раз
+            return
+        p.story = dict(p.story, summary=summary)
+        save_player(p)
+        self.refined += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"beats": self.beats, "folds": self.folds, "refined": self.refined,
+                "refine_stale": self.refine_stale, "pending": len(_TASKS)}
+
+
+# Общая сюжетная память
+story_memory = StoryMemory(
+    budget=config.MEMORY_TOKEN_BUDGET,
+    recent_tokens=config.MEMORY_RECENT_TOKENS,
+    summary_tokens=config.MEMORY_SUMMARY_TOKENS,
+    premise_tokens=config.MEMORY_PREMISE_TOKENS,
+    beat_tokens=config.MEMORY_BEAT_TOKENS,
+)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# app/core/tokens.py
+from __future__ import annotations
+
+import re
+from typing import List
+
+# Слово или отдельный знак препинания
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Локальная оценка числа токенов без токенизатора модели: латиница ~4 символа на
+    токен, кириллица ~3, каждый знак препинания — токен. Детерминирована и чуть
+    завышена для русского текста — бюджет промпта с ней не превышается.
+    """
+    n = 0
+    for m in _PIECE.finditer(text or ""):
+        piece = m.group(0)
+        n += (len(piece) + 3) // 4 if piece.isascii() else (len(piece) + 2) // 3
+    return n
+
+
+def trim_tokens(text: str, budget: int, keep_tail: bool = False) -> str:
+    """
+    Обрезать текст по словам до budget токенов (по count_tokens). keep_tail=True —
+    оставить конец (свежие события), иначе начало. Обрезанное помечается «…».
+    """
+    text = (text or "").strip()
+    if budget <= 0:
+        return ""
+    if count_tokens(text) <= budget:
+        return text
+    words = text.split()
+    if keep_tail:
+        words.reverse()
+    kept: List[str] = []
+    used = count_tokens("…")
+    for word in words:
+        cost = count_tokens(word)
+        if used + cost > budget:
+            break
+        kept.append(word)
+        used += cost
+    if keep_tail:
+        kept.reverse()
+        return "… " + " ".join(kept) if kept else ""
+    return " ".join(kept) + " …" if kept else ""
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# app/core/usage.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+# Игрок, ради которого идёт вызов LLM. Ставится middleware на весь апдейт и
+# наследуется задачами, порождёнными хендлером (дорисовка, prefetch потоков).
+_PLAYER: ContextVar[Optional[int]] = ContextVar("llm_usage_player", default=None)
+
+
+def bind_player(user_id: Optional[int]) -> None:
+    """Приписать дальнейшие вызовы LLM в текущем контексте игроку user_id."""
+    _PLAYER.set(user_id)
+
+
+def current_player() -> Optional[int]:
+    return _PLAYER.get()
+
+
+async def player_context_middleware(handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+                                    event: Any, data: Dict[str, Any]) -> Any:
+    """Outer-middleware апдейтов: расход LLM внутри хендлера пишется на его игрока."""
+    user = data.get("event_from_user")
+    token = _PLAYER.set(user.id if user is not None else None)
+    try:
+        return await handler(event, data)
+    finally:
+        _PLAYER.reset(token)
+
+
+class _Totals:
+    __slots__ = ("calls", "failed", "dropped", "estimated", "prompt_tokens", "completion_tokens",
+                 "cost", "latency_total", "latency_max")
+
+    def __init__(self):
+        self.calls = 0            # состоявшиеся вызовы API (в т.ч. с ошибкой)
+        self.failed = 0
+        self.dropped = 0          # вызова не было: дедлайн очереди, разомкнут предохранитель
+        self.estimated = 0        # API не вернул usage — токены оценены
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def add(self, prompt: int, completion: int, cost: float, latency: float, ok: bool, estimated: bool) -> None:
+        self.calls += 1
+        self.failed += 0 if ok else 1
+        self.estimated += 1 if estimated else 0
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        self.cost += cost
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "estimated": self.estimated,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost, 6),
+            "latency_avg_ms": round(self.latency_total / self.calls * 1000, 1) if self.calls else 0.0,
+            "latency_max_ms": round(self.latency_max * 1000, 1),
+        }
+
+
+class UsageMeter:
+    """
+    Учёт расхода LLM: токены (из usage ответа), задержка вызова и оценка стоимости —
+    по назначению вызова (purpose: "dungeon.search", "tavern.greet", "attributes.base_stats")
+    и по игроку. Копится в памяти процесса; раз в dump_interval секунд сводка пишется
+    в лог и (если задан dump_path) JSON-снимком в файл — видно, какие сценарии
+    съедают бюджет и время и что стоит кэшировать в первую очередь.
+    """
+
+    def __init__(self, price_input: float, price_output: float, dump_path: str = "",
+                 dump_interval: float = 300.0, max_players: int = 10000, top_players: int = 20):
+        self.price_input = float(price_input)       # $ за 1M входных токенов
+        self.price_output = float(price_output)     # $ за 1M выходных токенов
+        self.dump_path = dump_path
+        self.dump_interval = float(dump_interval)
+        self.max_players = max(1, int(max_players))
+        self.top_players = int(top_players)
+
+        self._started = time.time()
+        self._total = _Totals()
+        self._purposes: Dict[str, _Totals] = {}
+        self._players: "OrderedDict[int, _Totals]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- учёт ----------
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.price_input + completion_tokens * self.price_output) / 1_000_000
+
+    def _player(self, user_id: Optional[int]) -> Optional[_Totals]:
+        if user_id is None:
+            return None
+        t = self._players.get(user_id)
+        if t is None:
+            t = self._players[user_id] = _Totals()
+            if len(self._players) > self.max_players:
+                self._players.popitem(last=False)    # давно не игравший — сводка по назначениям остаётся
+        else:
+            self._players.move_to_end(user_id)
+        return t
+
+    def record(self, purpose: str, prompt_tokens: int, completion_tokens: int, latency: float, *,
+               ok: bool = True, estimated: bool = False) -> None:
+        cost = self.cost(prompt_tokens, completion_tokens)
+        targets = [self._total, self._purposes.setdefault(purpose, _Totals())]
+        player = self._player(current_player())
+        if player is not None:
+            targets.append(player)
+        for t in targets:
+            t.add(prompt_tokens, completion_tokens, cost, latency, ok, estimated)
+
+    def dropped(self, purpose: str) -> None:
+        self._total.dropped += 1
+        self._purposes.setdefault(purpose, _Totals()).dropped += 1
+        player = self._player(current_player())
+        if player is not None:
+            player.dropped += 1
+
+    # ---------- сводка ----------
+
+    def snapshot(self) -> Dict[str, Any]:
+        purposes = sorted(self._purposes.items(), key=lambda kv: kv[1].cost, reverse=True)
+        players = sorted(self._players.items(), key=lambda kv: kv[1].cost, reverse=True)
+        return {
+            "since": round(self._started),
+            "uptime_s": round(time.time() - self._started),
+            "total": self._total.as_dict(),
+            "purposes": {name: t.as_dict() for name, t in purposes},
+            "players_tracked": len(self._players),
+            "top_players": [[uid, t.as_dict()] for uid, t in players[:self.top_players]],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"total": self._total.as_dict(), "purposes": {k: v.as_dict() for k, v in self._purposes.items()}}
+
+    def dump(self) -> None:
+        if not self._total.calls and not self._total.dropped:
+            return
+        snap = self.snapshot()
+        total = snap["total"]
+        log.info("LLM usage: %d calls (%d failed, %d dropped), %d+%d tokens, $%.4f",
+                 total["calls"], total["failed"], total["dropped"],
+                 total["prompt_tokens"], total["completion_tokens"], total["cost_usd"])
+        for name, t in snap["purposes"].items():
+            log.info("  %-24s %5d calls  %7d+%-6d tok  $%.4f  avg %.0f ms  max %.0f ms",
+                     name, t["calls"], t["prompt_tokens"], t["completion_tokens"],
+                     t["cost_usd"], t["latency_avg_ms"], t["latency_max_ms"])
+        if not self.dump_path:
+            return
+        try:
+            d = os.path.dirname(self.dump_path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            tmp = self.dump_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snap, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.dump_path)
+        except OSError:
+            log.exception("LLM usage dump failed")
+
+    # ---------- жизненный цикл ----------
+
+    async def _dump_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.dump_interval)
+            self.dump()
+
+    def start(self) -> None:
+        if self.dump_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._dump_loop(), name="llm-usage-dump")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.dump()
+
+
+# Общий учёт для шлюза LLM
+llm_usage = UsageMeter(
+    price_input=config.LLM_PRICE_INPUT,
+    price_output=config.LLM_PRICE_OUTPUT,
+    dump_path=config.USAGE_DUMP_PATH,
+    dump_interval=config.USAGE_DUMP_INTERVAL,
+    max_players=config.USAGE_MAX_PLAYERS,
+)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# app/core/user_lock.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+# ключ в data апдейта: слот общего лимита (вебхук, воркер шарда) — см. ConcurrencySlot
+SLOT_KEY = "concurrency_slot"
+
+
+class ConcurrencySlot:
+    """
+    Слот общего лимита одновременных апдейтов (WEBHOOK_CONCURRENCY), взятый под один апдейт.
+
+    Передаётся в feed_raw_update(..., concurrency_slot=slot); UserLockMiddleware отпускает
+    его, пока апдейт ждёт замок своего игрока, и берёт снова перед хендлером. Иначе серия
+    тапов одного игрока занимает все слоты ожиданием собственного замка, а остальные
+    игроки стоят. release() идемпотентен — вызывающий отпускает слот в finally как обычно.
+    """
+
+    __slots__ = ("_sem", "held")
+
+    def __init__(self, sem: asyncio.Semaphore):
+        self._sem = sem
+        self.held = False
+
+    async def acquire(self) -> None:
+        await self._sem.acquire()
+        self.held = True
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            self._sem.release()
+
+
+class UserLockMiddleware(BaseMiddleware):
+    """
+    Апдейты одного игрока — строго по очереди, разных игроков — параллельно.
+
+    Двойной тап по «m_conf_N» иначе запускает два market_buy_confirm одновременно,
+    и оба видят одно и то же p.gold. Замки «полосатые»: stripes штук asyncio.Lock,
+    игрок попадает в полосу по user_id — память не растёт с числом игроков, а
+    случайное совпадение полосы двух игроков лишь изредка ставит их в одну очередь.
+    Вешается на dp.update.outer_middleware (после UserContextMiddleware aiogram).
+    """
+
+    def __init__(self, stripes: int = 1024):
+        self.stripes = max(1, int(stripes))
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(self.stripes)]
+
+        # метрики конкуренции
+        self.acquired = 0
+        self.contended = 0           # сколько раз пришлось ждать чужой апдейт
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waiting = 0             # ждут прямо сейчас
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        lock = self._locks[user.id % self.stripes]
+        if not lock.locked():
+            async with lock:
+                self.acquired += 1
+                return await handler(event, data)
+
+        self.contended += 1
+        self.waiting += 1
+        t0 = time.monotonic()
+        slot: Optional[ConcurrencySlot] = data.get(SLOT_KEY)
+        if slot is not None:
+            slot.release()          # пока ждём свой замок, слот нужнее другим игрокам
+        try:
+            await lock.acquire()
+        finally:
+            self.waiting -= 1
+        if slot is not None:
+            try:
+                await slot.acquire()
+            except BaseException:
+                lock.release()
+                raise
+        try:
+            waited = time.monotonic() - t0
+            self.acquired += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            return await handler(event, data)
+        finally:
+            lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "waiting": self.waiting,
+            "wait_avg_ms": round(self.wait_total / self.contended * 1000, 2) if self.contended else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+        }
@@ -5,6 +5,7 @@ from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 
 from app.core.campaign import welcome_text, campaigns_index, get_brief, get_epic
+from app.core.storage import unpin_player
 from app.ui.keyboards import campaigns_kb, campaign_confirm_kb, gender_kb
 
 UNAVAILABLE = {"plague", "dragon"}
@@ -15,6 +16,7 @@ router = Router()
 @router.message(F.text == "/start")
 async def cmd_start(message: types.Message, state: FSMContext):
     await state.clear()
+    unpin_player(message.from_user.id)
     await state.update_data(campaign_id=None)
     items = campaigns_index()
     await message.answer(welcome_text())
@@ -7,7 +7,8 @@ from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from app.core.storage import get_player, save_player, Player
+from app.core.storage import get_player, save_player, pin_player, unpin_player, Player
+from app.core.models import ability_meta_entry
 from app.ui.keyboards import gender_kb, classes_kb, confirm_kb, city_menu_kb
 from app.core.campaign import get_epic, arrival_city_name, arrival_text
 
@@ -169,6 +170,8 @@ async def pick_gender(cb: types.CallbackQuery, state: FSMContext):
     gender = "male" if cb.data == "gender_male" else "female"
     await state.update_data(gender=gender)
     await state.set_state(CreateFlow.ask_name)
+    # пока идёт создание — держим игрока (если он уже был) в горячем кэше
+    pin_player(cb.from_user.id)
     await cb.message.answer("Как тебя зовут?")
 
 # ---------- Имя ----------
@@ -264,7 +267,7 @@ async def confirm_class(cb: types.CallbackQuery, state: FSMContext):
     abil = CLASS_ABILITIES[class_key]
     start_name, start_emoji = abil["start"]
     p.abilities_known = {start_name: 1}
-    p.ability_meta = {start_name: {"emoji": start_emoji, "title": start_name, "type": "active"}}
+    p.ability_meta = {start_name: ability_meta_entry(start_name, start_emoji, "active")}
     p.ability_charges = {start_name: 3}
 
     # кампания/город
@@ -272,6 +275,7 @@ async def confirm_class(cb: types.CallbackQuery, state: FSMContext):
     city = arrival_city_name(campaign_id)
     p.city_name = city
     p.world_story = epic
+    p.campaign_id = campaign_id
 
     # ВАЖНО: заставим рынок перероллиться для НОВОГО персонажа
     p.shop_items = None
@@ -285,3 +289,4 @@ async def confirm_class(cb: types.CallbackQuery, state: FSMContext):
     await cb.message.answer("Куда отправишься?", reply_markup=city_menu_kb())
 
     await state.clear()
+    unpin_player(cb.from_user.id)
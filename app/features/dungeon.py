@@ -1,16 +1,21 @@
 # -*- coding: utf-8 -*-
 # app/features/dungeon.py
 from __future__ import annotations
+import html
 import random
 from dataclasses import dataclass
-from typing import Optional, Dict, List
+from typing import AsyncIterator, Optional, Dict, List
 
 from aiogram import Router, F, types
 
-from app.core.storage import get_player, save_player
+from app.core.storage import get_player, save_player, pin_player, unpin_player
 from app.ui.keyboards import room_actions_kb, combat_actions_kb, skills_pick_kb, dungeon_pick_kb, confirm_leave_dungeon_kb
-from app.core.config import USE_OPENAI, oai_client
+from app.core.llm import llm, prefetch
+from app.core.narration_cache import narration_cache
+from app.core.narrator import narrator
+from app.core.story_memory import story_memory
 from app.features.market import clear_market_for_player
+from app.ui.progressive import answer_progressive, answer_streaming, discard
 
 router = Router()
 _rng = random.SystemRandom()
@@ -26,28 +31,86 @@ class RoomState:
     dungeon_name: Optional[str] = None
 
 # ---------- GPT- ----------
-async def _gpt(sys: str, usr: str, max_tokens: int = 180) -> str:
-    if not USE_OPENAI or oai_client is None:
-        return usr
-    try:
-        r = await oai_client.chat.completions.create(
-            model="gpt-4o-mini", temperature=0.95, max_tokens=max_tokens,
-            messages=[{"role":"system","content":sys},{"role":"user","content":usr}],
-        )
-        return r.choices[0].message.content.strip()
-    except Exception:
-        return usr
-
-def _ensure_state(p):
-    if not hasattr(p, "dng") or p.dng is None:
-        p.dng = RoomState()
+async def _llm(sys: str, usr: str, max_tokens: int, purpose: str = "dungeon") -> Optional[str]:
+    return await llm.chat(
+        [{"role":"system","content":sys},{"role":"user","content":usr}],
+        temperature=0.95, max_tokens=max_tokens, purpose=purpose,
+    )
+
+def _with_memory(usr: str, memory: str) -> str:
+    return f"{memory}\n\nСейчас: {usr}" if memory else usr
+
+async def _prose(sys: str, usr: str, max_tokens: int = 180, subs: Optional[Dict[str, str]] = None,
+                 purpose: str = "dungeon", memory: str = "") -> Optional[str]:
+    """
+    Текст от LLM (через кэш описаний) или None. subs — имена для плейсхолдеров (player/dungeon),
+    purpose — под каким назначением вызов попадёт в учёт расхода LLM, memory — сюжетная
+    память игрока (story_memory.context): с ней текст личный и мимо общего кэша.
+    """
+    if memory:
+        return await _llm(sys, _with_memory(usr, memory), max_tokens, purpose)
+    return await narration_cache.narrate(
+        sys, usr, lambda s, u, m: _llm(s, u, m, purpose), max_tokens, subs)
+
+async def _gpt(sys: str, usr: str, max_tokens: int = 180, subs: Optional[Dict[str, str]] = None,
+               purpose: str = "dungeon", memory: str = "") -> str:
+    """Проза сразу текстом; без LLM (выключен, не успел, предохранитель) — процедурный рассказчик."""
+    if not llm.enabled:
+        return narrator.narrate(purpose, subs)
+    return await _prose(sys, usr, max_tokens, subs, purpose, memory) or narrator.narrate(purpose, subs)
+
+def _later(sys: str, usr: str, max_tokens: int = 180, subs: Optional[Dict[str, str]] = None,
+           purpose: str = "dungeon", memory: str = ""):
+    """Корутина прозы для answer_progressive; None — LLM выключен, дорисовывать нечего."""
+    return _prose(sys, usr, max_tokens, subs, purpose, memory) if llm.enabled else None
+
+async def _stream_prose(sys: str, usr: str, max_tokens: int, subs: Dict[str, str],
+                        purpose: str = "dungeon", memory: str = "") -> AsyncIterator[str]:
+    """Поток прозы: из кэша описаний — одним куском, иначе по токенам от LLM (и в кэш, если не личный)."""
+    if not memory:
+        cached = narration_cache.lookup(sys, usr, max_tokens, subs)
+        if cached is not None:
+            yield cached
+            return
+    parts: List[str] = []
+    async for delta in llm.stream(
+        [{"role":"system","content":sys},{"role":"user","content":_with_memory(usr, memory)}],
+        temperature=0.95, max_tokens=max_tokens, purpose=purpose,
+    ):
+        parts.append(delta)
+        yield delta
+    if not memory:
+        narration_cache.offer(sys, usr, max_tokens, subs, "".join(parts).strip())
+
+@dataclass
+class Narration:
+    """Один генерируемый текст хода: промпт + имена для кэша описаний + назначение для учёта + память."""
+    sys: str
+    usr: str
+    max_tokens: int = 180
+    subs: Optional[Dict[str, str]] = None
+    purpose: str = "dungeon"
+    memory: str = ""
+
+def _narrate_many(*items: Narration) -> List[Optional[AsyncIterator[str]]]:
+    """
+    Все тексты хода сразу в работу: независимые промпты идут в LLM параллельно
+    (и параллельно с отправкой сообщений), а не друг за другом. Результат — потоки
+    для answer_streaming в том же порядке; None — LLM выключен.
+    """
+    if not llm.enabled:
+        return [None] * len(items)
+    return [prefetch(_stream_prose(n.sys, n.usr, n.max_tokens, n.subs or {}, n.purpose, n.memory)) for n in items]
+
+def _esc(text: str) -> str:
+    return html.escape(text or "", quote=False)
 
 # ---------- :   ----------
 async def show_dungeon_picker(message: types.Message):
     p = get_player(message.from_user.id)
     if not p:
         await message.answer("  : /start"); return
-    names = getattr(p, "dungeon_names", None) or [" "," "," ظ"]
+    names = p.dungeon_names or [" "," "," ظ"]
     await message.answer(" :", reply_markup=dungeon_pick_kb(names))
 
 @router.message(F.text.in_([" ", ""]))
@@ -64,135 +127,174 @@ async def dng_back_city(cb: types.CallbackQuery):
 async def choose_dungeon(cb: types.CallbackQuery):
     await cb.answer()
     p = get_player(cb.from_user.id)
-    names: List[str] = getattr(p, "dungeon_names", None) or [" "," "," ظ"]
+    names: List[str] = p.dungeon_names or [" "," "," ظ"]
     idx = int(cb.data.split("_")[-1]) - 1
     if not (0 <= idx < len(names)):
         await cb.message.answer("  ."); return
     picked = names[idx]
 
-    #    
+    # Событие по дороге: механика считается сразу, проза — статичная, LLM дорисует позже
     event_type = _rng.choice(["bandits","blessing","merchants","trap","omen"])
     delta_hp = 0; delta_gold = 0; bonus_item: Optional[str] = None
 
     if event_type == "bandits":
         loss = min(p.gold, _rng.randrange(3, 10))
         delta_gold = -loss; p.gold += delta_gold
-        sys = ", 36 ,  .   ."
-        usr = f"{p.name}   {picked}       ."
+        sys = "Ты рассказчик тёмного фэнтези. До 36 слов, живо, без списков. Опиши стычку с разбойниками."
+        usr = f"{p.name} по дороге в {picked} попадает в засаду разбойников и теряет часть монет."
+        beat = f"Дорога в {picked}: засада разбойников, отдано {loss} монет."
     elif event_type == "blessing":
         heal = min(p.max_hp - p.hp, _rng.randrange(2, 6))
         delta_hp = heal; p.hp += heal
-        sys = ", 36 ,  ;    ."
-        usr = f"   {picked} -  ."
+        sys = "Ты рассказчик тёмного фэнтези. До 36 слов, тепло и таинственно. Опиши нежданное благословение."
+        usr = f"У дороги в {picked} путника благословляет странствующий отшельник."
+        beat = f"Дорога в {picked}: благословение отшельника."
     elif event_type == "merchants":
-        bonus_item = _rng.choice(["","  "])
+        bonus_item = _rng.choice(["Зелье лечения","Полевой набор"])
         p.inventory[bonus_item] = p.inventory.get(bonus_item,0)+1
-        sys = ", 36 ;       ."
-        usr = f" {picked} ,   : {bonus_item}."
+        sys = "Ты рассказчик тёмного фэнтези. До 36 слов. Опиши встречу с бродячими торговцами и их подарок."
+        usr = f"По пути в {picked} путник встречает торговый обоз, ему дарят: {bonus_item}."
+        beat = f"Дорога в {picked}: торговцы подарили {bonus_item}."
     elif event_type == "trap":
         dmg = _rng.randrange(1, 4)
         delta_hp = -min(p.hp, dmg); p.hp += delta_hp
-        sys = ", 36 .   ,   ."
-        usr = f"   {picked}  ;   ."
+        sys = "Ты рассказчик тёмного фэнтези. До 36 слов, напряжённо. Опиши сработавшую ловушку."
+        usr = f"На тропе к {picked} срабатывает старая ловушка; путник ранен, но жив."
+        beat = f"Дорога в {picked}: ранение от старой ловушки."
     else:
-        sys = ", 36 .  ,    ."
-        usr = f" {picked}    ,    ."
+        sys = "Ты рассказчик тёмного фэнтези. До 36 слов, зловеще. Опиши дурное знамение."
+        usr = f"У входа в {picked} путник видит знамение: вороны кружат, а ветер стихает."
+        beat = f"У входа в {picked}: дурное знамение, кружат вороны."
 
-    save_player(p)
-    prose = await _gpt(sys, usr, 220)
-    tail = []
-    if delta_gold: tail.append(f" : {p.gold} ({'' if delta_gold<0 else '+'}{abs(delta_gold)})")
-    if delta_hp:   tail.append(f" HP: {p.hp}/{p.max_hp} ({'' if delta_hp<0 else '+'}{abs(delta_hp)})")
-    if bonus_item: tail.append(f" : {bonus_item}")
-    tail_text = ("\n" + "\n".join(tail)) if tail else ""
-    await cb.message.answer(f" {prose}{tail_text}")
-
-    #  
-    _ensure_state(p)
+    # Вход в подземелье
     p.dng = RoomState(room_id=1, camped=False, has_exit=True, in_combat=False, dungeon_name=picked)
+    # память — до записи этого хода: сам ход и так описан в промпте
+    memory = story_memory.context(p)
+    story_memory.remember(p, beat)
+    story_memory.remember(p, f"Вход в {picked}.")
     save_player(p)
+    # пока идёт забег — держим игрока в горячем кэше
+    pin_player(p.user_id)
+
+    # оба текста независимы — генерируются одновременно и приходят потоком
+    subs = {"player": p.name, "dungeon": picked}
+    # пока LLM пишет (или если он недоступен) — процедурный текст того же события
+    fallback = narrator.narrate(f"dungeon.road.{event_type}", subs)
+    event_prose, enter_prose = _narrate_many(
+        Narration(sys, usr, 220, subs, purpose=f"dungeon.road.{event_type}"),
+        Narration(
+            "Ты рассказчик тёмного фэнтези. До 36 слов: первая комната подземелья, атмосфера, без действий за героя.",
+            f"{p.name} входит в {picked}. Опиши первую комнату и то, что бросается в глаза.",
+            subs=subs, purpose="dungeon.enter", memory=memory,
+        ),
+    )
 
-    enter = await _gpt(
-        "  . 36 :     .",
-        f"{p.name}   {picked}. ,     ."
+    tail = []
+    if delta_gold: tail.append(f"🪙 Золото: {p.gold} ({'−' if delta_gold<0 else '+'}{abs(delta_gold)})")
+    if delta_hp:   tail.append(f"❤️ HP: {p.hp}/{p.max_hp} ({'−' if delta_hp<0 else '+'}{abs(delta_hp)})")
+    if bonus_item: tail.append(f"🎁 Получено: {bonus_item}")
+    tail_text = ("\n" + "\n".join(tail)) if tail else ""
+    try:
+        await answer_streaming(cb.message, lambda prose: f"🛤 {_esc(prose)}{tail_text}", fallback, event_prose)
+    except BaseException:
+        await discard(enter_prose)      # второй поток уже в работе — не оставлять его висеть
+        raise
+    await answer_streaming(
+        cb.message, lambda prose: f"🕯 Ты входишь в {_esc(picked)}.\n{_esc(prose)}",
+        narrator.narrate("dungeon.enter", subs),
+        enter_prose,
+        reply_markup=room_actions_kb(can_camp=True, has_exit=True),
     )
-    await cb.message.answer(f"    {picked}.\n{enter}",
-                            reply_markup=room_actions_kb(can_camp=True, has_exit=True))
 
-# ----------    ----------
+# ---------- Комната: обыск ----------
 @router.callback_query(F.data == "dng_search")
 async def dng_search(cb: types.CallbackQuery):
     await cb.answer()
     p = get_player(cb.from_user.id)
-    st: RoomState = getattr(p, "dng", RoomState())
-    desc = await _gpt(
-        "  . 24 ,   ,      .",
-        f"{p.name}   {st.dungeon_name or ''}."
-    )
-    # 50% , 30% , 20% 
+    st: RoomState = p.dng or RoomState()
+    # 50% пусто, 30% расходник, 20% находка
     roll = _rng.random()
     found = ""
     if roll < 0.5:
-        found = "   ."
+        found = "Ничего ценного не нашлось."
     elif roll < 0.8:
-        pick = _rng.choice(["", "", "", "  "])
+        pick = _rng.choice(["Зелье лечения", "Факел", "Верёвка", "Полевой набор"])
         p.inventory[pick] = p.inventory.get(pick, 0) + 1
-        save_player(p)
-        found = f": {pick} (1)."
+        found = f"Найдено: {pick} (1)."
     else:
-        pick = _rng.choice(["", "  ", "", " "])
+        pick = _rng.choice(["Старая монета", "Кольцо без камня", "Свиток", "Обломок амулета"])
         p.inventory[pick] = p.inventory.get(pick, 0) + 1
-        save_player(p)
-        found = f", : {pick}."
-    await cb.message.answer(f" {desc}\n\n{found}",
-                            reply_markup=room_actions_kb(can_camp=not st.camped, has_exit=True))
+        found = f"Под камнем что-то блеснуло: {pick}."
+    story_memory.remember(p, f"Комната {st.room_id}: обыск — {found}")
+    save_player(p)
+    await answer_progressive(
+        cb.message, lambda prose: f"🔎 {_esc(prose)}\n\n{found}",
+        narrator.narrate("dungeon.search", {"player": p.name}),
+        _later(
+            "Ты рассказчик тёмного фэнтези. До 24 слов: как герой обыскивает комнату, без исхода поиска.",
+            f"{p.name} обыскивает комнату в {st.dungeon_name or 'подземелье'}.",
+            subs={"player": p.name, "dungeon": st.dungeon_name or ""}, purpose="dungeon.search",
+        ),
+        reply_markup=room_actions_kb(can_camp=not st.camped, has_exit=True),
+    )
 
 @router.callback_query(F.data == "dng_camp")
 async def dng_camp(cb: types.CallbackQuery):
     await cb.answer()
     p = get_player(cb.from_user.id)
-    st: RoomState = getattr(p, "dng", RoomState())
+    st: RoomState = p.dng or RoomState()
     if st.camped:
-        await cb.message.answer("   .", reply_markup=room_actions_kb(can_camp=False, has_exit=True)); return
-    if p.inventory.get("  ", 0) <= 0:
-        await cb.message.answer("     .", reply_markup=room_actions_kb(can_camp=False, has_exit=True)); return
+        await cb.message.answer("🔥 В этой комнате привал уже был.", reply_markup=room_actions_kb(can_camp=False, has_exit=True)); return
+    if p.inventory.get("Полевой набор", 0) <= 0:
+        await cb.message.answer("🎒 Для привала нужен Полевой набор.", reply_markup=room_actions_kb(can_camp=False, has_exit=True)); return
 
-    p.inventory["  "] -= 1
-    if p.inventory["  "] <= 0:
-        del p.inventory["  "]
+    p.inventory["Полевой набор"] -= 1
+    if p.inventory["Полевой набор"] <= 0:
+        del p.inventory["Полевой набор"]
 
     heal = min(p.max_hp - p.hp, _rng.randrange(3, 7))
     p.hp += heal
-    #   : +1     ,    5
+    # Заряды умений восполняются до уровня умения + 2, но не больше 5
     for k, lvl in (p.ability_charges or {}).items():
         mx = min(5, (p.abilities_known.get(k,1) + 2))
         p.ability_charges[k] = mx
     st.camped = True
+    memory = story_memory.context(p)
+    story_memory.remember(p, f"Комната {st.room_id}: привал.")
     save_player(p)
 
     prose = await _gpt(
-        "  . 24       ;    .",
-        f"{p.name}     ,      ."
+        "Ты рассказчик тёмного фэнтези. До 24 слов: короткий привал в подземелье, огонь и тишина, без новых событий.",
+        f"{p.name} разводит костёр в {st.dungeon_name or 'подземелье'} и переводит дух.",
+        subs={"player": p.name, "dungeon": st.dungeon_name or ""}, purpose="dungeon.camp", memory=memory,
     )
-    charges_line = " ".join([f"{k}: {p.ability_charges.get(k,0)}/{p.ability_charges.get(k,0)} (+1)" for k in (p.ability_charges or {})]) or ""
-    await cb.message.answer(f" {prose}\n\n : {p.hp}/{p.max_hp} (+{heal})\n{charges_line}",
+    charges_line = " ".join([f"{k}: {v}" for k, v in (p.ability_charges or {}).items()])
+    charges_line = f"\n✨ Заряды: {charges_line}" if charges_line else ""
+    await cb.message.answer(f"🔥 {_esc(prose)}\n\n❤️ HP: {p.hp}/{p.max_hp} (+{heal}){charges_line}",
                             reply_markup=room_actions_kb(can_camp=False, has_exit=True))
 
 @router.callback_query(F.data == "dng_next")
 async def dng_next(cb: types.CallbackQuery):
     await cb.answer()
     p = get_player(cb.from_user.id)
-    st: RoomState = getattr(p, "dng", RoomState())
+    st: RoomState = p.dng or RoomState()
     st.room_id += 1
     st.camped = False
+    memory = story_memory.context(p)
+    story_memory.remember(p, f"Переход в комнату {st.room_id}.")
     save_player(p)
 
-    prose = await _gpt(
-        "  . 24 :      ; .",
-        f"{p.name}   {st.dungeon_name or ''},  ,  ."
+    await answer_progressive(
+        cb.message, lambda prose: f"🚪 Комната {st.room_id}. {_esc(prose)}",
+        narrator.narrate("dungeon.next", {"player": p.name}),
+        _later(
+            "Ты рассказчик тёмного фэнтези. До 24 слов: новая комната подземелья, одна яркая деталь.",
+            f"{p.name} идёт дальше по {st.dungeon_name or 'подземелью'}, открывает дверь в следующую комнату.",
+            subs={"player": p.name, "dungeon": st.dungeon_name or ""}, purpose="dungeon.next",
+            memory=memory,
+        ),
+        reply_markup=room_actions_kb(can_camp=True, has_exit=True),
     )
-    await cb.message.answer(f" {prose}",
-                            reply_markup=room_actions_kb(can_camp=True, has_exit=True))
 
 # ----------  ----------
 @router.callback_query(F.data == "dng_escape")
@@ -206,7 +308,11 @@ async def dng_leave_yes(cb: types.CallbackQuery):
     p = get_player(cb.from_user.id)
     #    
     clear_market_for_player(cb.from_user.id)
-    picked = getattr(p, "dng", RoomState()).dungeon_name or ""
+    picked = (p.dng or RoomState()).dungeon_name or ""
+    story_memory.remember(p, f"Уход из {picked or 'подземелья'}.")
+    p.dng = None
+    save_player(p)
+    unpin_player(p.user_id)
     await cb.message.answer(f"   {picked}.")
     from app.features.city import go_city
     await go_city(cb.message)
@@ -215,6 +321,6 @@ async def dng_leave_yes(cb: types.CallbackQuery):
 async def dng_leave_no(cb: types.CallbackQuery):
     await cb.answer()
     p = get_player(cb.from_user.id)
-    st: RoomState = getattr(p, "dng", RoomState())
+    st: RoomState = p.dng or RoomState()
     await cb.message.answer("  .",
                             reply_markup=room_actions_kb(can_camp=not st.camped, has_exit=True))
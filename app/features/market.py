@@ -9,6 +9,7 @@ from aiogram import Router, F, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from app.core.storage import get_player, save_player
+from app.core.scratch import scratch
 from app.core.campaign_items import pick_campaign_items, find_campaign_item_by_name
 from app.core.items_lore_repo import sample_random_items
 
@@ -22,7 +23,8 @@ except Exception:
         return r or ""
 
 router = Router(name="market")
-_SALE_CACHE: Dict[int, List[Tuple[str, int]]] = {}
+# user_id -> [(name, sell_price)] — что показали в скупке
+_SALE_CACHE = scratch.namespace("market.sale")
 
 # ---------- БАЗОВЫЕ ВСЕГДА ДОСТУПНЫЕ ----------
 def _base_pool() -> List[Dict]:
@@ -60,8 +62,8 @@ def _roll_shop_items_for_player(p) -> List[Dict]:
     items: List[Dict] = must.copy()
     rest_slots = 5 - len(items)
 
-    camp_id: Optional[str] = getattr(p, "campaign_id", None)
-    class_key: Optional[str] = getattr(p, "class_key", None)
+    camp_id: Optional[str] = p.campaign_id
+    class_key: Optional[str] = p.class_key
 
     # до 2 — из кампании
     k_camp = min(2, rest_slots)
@@ -137,13 +139,21 @@ def format_item_line(entry: Dict, index: Optional[int] = None) -> str:
     body = desc.strip() if desc else ""
     return f"{head}\n{body}{meta_line}".strip()
 
+def clear_market_for_player(user_id: int) -> None:
+    """Сбросить состояние рынка игрока: список скупки и витрину (перероллится при входе)."""
+    _SALE_CACHE.delete(user_id)
+    p = get_player(user_id)
+    if p is not None:
+        p.shop_dirty = True
+        save_player(p)
+
 # ---------- ВХОД В РЫНОК ----------
 @router.message(F.text.contains("Рынок"))
 async def open_market(message: types.Message):
     p = get_player(message.from_user.id)
 
-    shop = getattr(p, "shop_items", None)
-    if not shop or getattr(p, "shop_dirty", False):
+    shop = p.shop_items
+    if not shop or p.shop_dirty:
         shop = _roll_shop_items_for_player(p)
         p.shop_items = shop
         p.shop_dirty = False
@@ -160,7 +170,7 @@ async def open_market(message: types.Message):
 async def market_buy_menu(cb: types.CallbackQuery):
     await cb.answer()
     p = get_player(cb.from_user.id)
-    shop = getattr(p, "shop_items", [])
+    shop = p.shop_items or []
     if not shop:
         await cb.message.answer("Пока пусто. Зайди позже.", reply_markup=_market_menu_kb()); return
     await cb.message.answer("Что берёшь? Выбери номер товара:", reply_markup=_buy_pick_kb(min(9, len(shop))))
@@ -169,7 +179,7 @@ async def market_buy_menu(cb: types.CallbackQuery):
 async def market_buy_pick(cb: types.CallbackQuery):
     await cb.answer()
     p = get_player(cb.from_user.id)
-    shop = getattr(p, "shop_items", [])
+    shop = p.shop_items or []
     idx = int(cb.data.split("_")[-1]) - 1
     if not (0 <= idx < len(shop)):
         await cb.message.answer("Нет такого товара.", reply_markup=_market_menu_kb()); return
@@ -181,7 +191,7 @@ async def market_buy_pick(cb: types.CallbackQuery):
 async def market_buy_confirm(cb: types.CallbackQuery):
     await cb.answer()
     p = get_player(cb.from_user.id)
-    shop: List[Dict] = getattr(p, "shop_items", [])
+    shop: List[Dict] = p.shop_items or []
     idx = int(cb.data.split("_")[-1]) - 1
     if not (0 <= idx < len(shop)):
         await cb.message.answer("Нет такого товара.", reply_markup=_market_menu_kb()); return
@@ -211,7 +221,7 @@ async def market_back(cb: types.CallbackQuery):
 
 # ---------- ПРОДАЖА ----------
 def _lookup_price_for_sell(p, name: str) -> int:
-    shop = getattr(p, "shop_items", []) or []
+    shop = p.shop_items or []
     base = next((it for it in shop if it.get("name") == name), None)
     if base is not None:
         return int(base.get("price", 8))
@@ -239,7 +249,7 @@ async def market_sell_menu(cb: types.CallbackQuery):
         lines.append(f"{i}. {name} — {sell_price} зол. (в сумке: {cnt})")
         numbered.append((name, sell_price))
 
-    _SALE_CACHE[user_id] = numbered
+    _SALE_CACHE.set(user_id, numbered)
     await cb.message.answer("\n".join(lines), reply_markup=_sell_pick_kb(len(numbered)))
 
 @router.callback_query(F.data.regexp(r"^m_s_(\d+)$"))
@@ -247,7 +257,7 @@ async def market_sell_pick(cb: types.CallbackQuery):
     await cb.answer()
     user_id = cb.from_user.id
     p = get_player(user_id)
-    sale = _SALE_CACHE.get(user_id, [])
+    sale: List[Tuple[str, int]] = _SALE_CACHE.get(user_id, [])
     idx = int(cb.data.split("_")[-1]) - 1
     if not (0 <= idx < len(sale)):
         await cb.message.answer("Нет такого номера.", reply_markup=_market_menu_kb()); return
@@ -2,13 +2,16 @@
 # app/features/tavern.py
 from __future__ import annotations
 
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Optional
 
 from aiogram import Router, F, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from app.core.storage import get_player, save_player
-from app.core.config import USE_OPENAI, oai_client
+from app.core.scratch import scratch
+from app.core.llm import BACKGROUND, llm
+from app.core.line_pools import line_pools
+from app.core.narrator import narrator
 
 # ИНИЦИАЛИЗАЦИЯ РОУТЕРА
 router = Router(name="tavern")
@@ -16,8 +19,8 @@ router = Router(name="tavern")
 REST_FEE = 10  # стоимость отдыха
 
 # Кэши выбора экипировки: user_id -> ...
-_EQUIP_IDX_MAP: Dict[int, List[str]] = {}
-_EQUIP_CHOICE: Dict[int, Tuple[str, str]] = {}  # (name, kind: 'weapon'|'armor')
+_EQUIP_IDX_MAP = scratch.namespace("tavern.equip_idx")     # [name, ...]
+_EQUIP_CHOICE = scratch.namespace("tavern.equip_choice")   # (name, kind: 'weapon'|'armor')
 
 # ---------- КЛАВИАТУРЫ ----------
 
@@ -62,50 +65,52 @@ def _wrap_barkeeper(text: str) -> str:
         text = f'«{text}»'
     return f'👴 <i>Трактирщик: {text}</i>'
 
-async def _npc_line() -> str:
-    if USE_OPENAI and oai_client is not None:
-        try:
-            resp = await oai_client.chat.completions.create(
-                model="gpt-4o-mini", temperature=0.9, max_tokens=80,
-                messages=[
-                    {"role": "system", "content": "Короткая атмосферная реплика трактирщика (до 12 слов). Без разметки."},
-                    {"role": "user", "content": "Темно в городе, ходят слухи о ночных визитёрах."},
-                ],
-            )
-            return _wrap_barkeeper(resp.choices[0].message.content)
-        except Exception:
-            pass
-    return _wrap_barkeeper("Раз уж занесло — грейся у огня и держи свечу под рукой.")
-
-async def _npc_no_money_line(fee: int) -> str:
-    if USE_OPENAI and oai_client is not None:
-        try:
-            resp = await oai_client.chat.completions.create(
-                model="gpt-4o-mini", temperature=0.9, max_tokens=50,
-                messages=[
-                    {"role": "system", "content": "Короткая реплика трактирщика с отказом из-за нехватки денег. Без разметки."},
-                    {"role": "user", "content": f"Гость не может оплатить постой ({fee} монет)."},
-                ],
-            )
-            return _wrap_barkeeper(resp.choices[0].message.content)
-        except Exception:
-            pass
-    return _wrap_barkeeper("Эх, дружище, без монет и постель не согреет.")
-
-async def _npc_rest_success_line() -> str:
-    if USE_OPENAI and oai_client is not None:
-        try:
-            resp = await oai_client.chat.completions.create(
-                model="gpt-4o-mini", temperature=0.8, max_tokens=60,
-                messages=[
-                    {"role": "system", "content": "Короткая ободряющая реплика трактирщика после хорошего отдыха. Без разметки."},
-                    {"role": "user", "content": "Гость выспался и готов к дороге."},
-                ],
-            )
-            return _wrap_barkeeper(resp.choices[0].message.content)
-        except Exception:
-            pass
-    return _wrap_barkeeper("Лицо посвежело — значит, кровать честно отработала!")
+async def _ask_barkeeper(system: str, user: str, temperature: float, max_tokens: int,
+                         purpose: str) -> Optional[str]:
+    # пулы наполняются в фоне — уступаем дорогу интерактивным запросам
+    return await llm.chat(
+        [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        temperature=temperature, max_tokens=max_tokens, priority=BACKGROUND, purpose=purpose,
+    )
+
+async def _gen_greet_line() -> Optional[str]:
+    return await _ask_barkeeper(
+        "Короткая атмосферная реплика трактирщика (до 12 слов). Без разметки.",
+        "Темно в городе, ходят слухи о ночных визитёрах.",
+        0.9, 80, "tavern.greet",
+    )
+
+async def _gen_no_money_line() -> Optional[str]:
+    return await _ask_barkeeper(
+        "Короткая реплика трактирщика с отказом из-за нехватки денег. Без разметки.",
+        f"Гость не может оплатить постой ({REST_FEE} монет).",
+        0.9, 50, "tavern.no_money",
+    )
+
+async def _gen_rest_success_line() -> Optional[str]:
+    return await _ask_barkeeper(
+        "Короткая ободряющая реплика трактирщика после хорошего отдыха. Без разметки.",
+        "Гость выспался и готов к дороге.",
+        0.8, 60, "tavern.rest_success",
+    )
+
+# Реплики готовятся в фоне — экран таверны не ждёт LLM; пул пуст — сочиняет процедурный рассказчик
+line_pools.register("tavern.greet", _gen_greet_line, lambda: narrator.narrate("tavern.greet"))
+line_pools.register("tavern.no_money", _gen_no_money_line, lambda: narrator.narrate("tavern.no_money"))
+line_pools.register("tavern.rest_success", _gen_rest_success_line,
+                    lambda: narrator.narrate("tavern.rest_success"))
+
+def _npc_line() -> str:
+    return _wrap_barkeeper(line_pools.pop("tavern.greet"))
+
+def _npc_no_money_line() -> str:
+    return _wrap_barkeeper(line_pools.pop("tavern.no_money"))
+
+def _npc_rest_success_line() -> str:
+    return _wrap_barkeeper(line_pools.pop("tavern.rest_success"))
 
 # ---------- ВСПОМОГАТЕЛЬНОЕ ----------
 
@@ -176,7 +181,7 @@ async def _show_tavern(message: types.Message, user_id: int) -> None:
         await message.answer("Нет персонажа: набери /start")
         return
 
-    line = await _npc_line()
+    line = _npc_line()
     await message.answer(
         f"🍺 <b>Таверна</b>\n{line}\n\n"
         f"❤️ Здоровье: {p.hp}/{p.max_hp}\n"
@@ -202,7 +207,7 @@ async def tavern_rest(cb: types.CallbackQuery):
         return
 
     if p.gold < REST_FEE:
-        await cb.message.answer(await _npc_no_money_line(REST_FEE))
+        await cb.message.answer(_npc_no_money_line())
         await _show_tavern(cb.message, user_id)
         return
 
@@ -212,7 +217,7 @@ async def tavern_rest(cb: types.CallbackQuery):
     p.ability_charges = _recharge_all_abilities(p)
     save_player(p)
 
-    success_line = await _npc_rest_success_line()
+    success_line = _npc_rest_success_line()
     await cb.message.answer(
         f"Ты отдохнул(-а).\n"
         f"{success_line}\n\n"
@@ -250,7 +255,7 @@ async def tavern_equip(cb: types.CallbackQuery):
         return
 
     lines.append("\nВыбери номер предмета (сначала надеть, ниже — можно снять текущее).")
-    _EQUIP_IDX_MAP[user_id] = idx_map
+    _EQUIP_IDX_MAP.set(user_id, idx_map)
 
     cur_w = (p.equipment or {}).get("weapon") if p.equipment else None
     cur_a = (p.equipment or {}).get("armor") if p.equipment else None
@@ -284,7 +289,7 @@ async def tavern_equip_pick(cb: types.CallbackQuery):
         await cb.message.answer("Твой класс не может использовать этот предмет.", reply_markup=tavern_menu_kb())
         return
 
-    _EQUIP_CHOICE[user_id] = (name, kind)
+    _EQUIP_CHOICE.set(user_id, (name, kind))
     await cb.message.answer(f"Надеть: {name}?", reply_markup=equip_confirm_kb(idx+1))
 
 @router.callback_query(F.data.regexp(r"^t_econf_(\d+)$"))
@@ -14,6 +14,13 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart
 
+from app.core.config import BOT_MODE, SHARD_WORKERS, USER_LOCK_STRIPES
+from app.core.fsm_storage import make_fsm_storage
+from app.core.line_pools import line_pools
+from app.core.llm import llm
+from app.core.usage import llm_usage, player_context_middleware
+from app.core.storage import init_storage, shutdown_storage, unpin_player
+from app.core.user_lock import UserLockMiddleware
 from app.features import creation, market, tavern
 from app.ui.keyboards import gender_kb
 
@@ -22,12 +29,38 @@ load_dotenv(override=True)
 
 
 async def on_start(message: types.Message):
+    # брошенное ранее создание персонажа больше не держит игрока в кэше
+    unpin_player(message.from_user.id)
     await message.answer(
         "Добро пожаловать в <b>Ragnarok</b>!\nВыбери пол, чтобы начать:",
         reply_markup=gender_kb()
     )
 
 
+def build_dispatcher(fsm_storage) -> Dispatcher:
+    """Диспетчер со всеми роутерами и middleware (общий для обычного запуска и шард-воркеров)."""
+    dp = Dispatcher(storage=fsm_storage)
+    # апдейты одного игрока — последовательно, разных — параллельно (handle_as_tasks)
+    dp.update.outer_middleware(UserLockMiddleware(USER_LOCK_STRIPES))
+    # расход LLM внутри апдейта пишется на его игрока (app/core/usage.py)
+    dp.update.outer_middleware(player_context_middleware)
+    # реплики NPC начинают готовиться сразу, а не при первом заходе в таверну
+    dp.startup.register(line_pools.prime)
+    dp.startup.register(llm.start)
+    dp.startup.register(llm_usage.start)
+    dp.shutdown.register(llm.close)
+    dp.shutdown.register(llm_usage.close)
+
+    # /start
+    dp.message.register(on_start, CommandStart())
+
+    # Роутеры
+    dp.include_router(creation.router)
+    dp.include_router(market.router)
+    dp.include_router(tavern.router)
+    return dp
+
+
 def setup_logging():
     level = os.environ.get("LOG_LEVEL", "INFO").upper()
     logging.basicConfig(
@@ -62,32 +95,44 @@ async def main():
     if not token or ":" not in token:
         raise RuntimeError("BOT_TOKEN пуст или неверного формата (ожидается 123456789:AA...).")
 
-    # Анти-дубль на время работы процесса
-    lock_fd, lock_path = acquire_single_instance_lock(token)
+    # Анти-дубль на время работы процесса — только для long polling
+    # (вебхук-инстансов за балансировщиком может быть сколько угодно)
+    polling = BOT_MODE != "webhook"
+    lock_fd, lock_path = acquire_single_instance_lock(token) if polling else (None, None)
 
+    fsm_storage = None
     try:
-        bot = Bot(token=token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-        dp = Dispatcher()
-
-        # /start
-        dp.message.register(on_start, CommandStart())
+        if SHARD_WORKERS > 1:
+            # этот процесс — только фронт, игроки живут в воркерах (у каждого свой шард хранилищ)
+            from app.sharding import run_sharded
+            await run_sharded(token, SHARD_WORKERS)
+            return
 
-        # Роутеры
-        dp.include_router(creation.router)
-        dp.include_router(market.router)
-        dp.include_router(tavern.router)
-
-        await dp.start_polling(bot)
+        fsm_storage = make_fsm_storage()
+        bot = Bot(token=token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        dp = build_dispatcher(fsm_storage)
+
+        init_storage()
+        if polling:
+            await dp.start_polling(bot)
+        else:
+            from app.webhook import run_webhook
+            await run_webhook(bot, dp)
     finally:
+        # дописываем отложенные сохранения игроков
+        shutdown_storage()
+        if fsm_storage is not None:
+            await fsm_storage.close()
         # снимаем лок
-        try:
-            os.close(lock_fd)
-        except Exception:
-            pass
-        try:
-            os.remove(lock_path)
-        except Exception:
-            pass
+        if lock_fd is not None:
+            try:
+                os.close(lock_fd)
+            except Exception:
+                pass
+            try:
+                os.remove(lock_path)
+            except Exception:
+                pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# app/sharding.py
+"""
+Многопроцессный режим: фронт принимает апдейты (long polling или вебхук) и раздаёт их
+N воркер-процессам по user_id. Каждый воркер — свой event loop, свой Dispatcher и свой
+шард хранилища игроков/FSM (saves/players.shard{i}.db), так что игрок всегда попадает
+в один и тот же процесс и его данные не делятся между процессами.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.core import config
+
+log = logging.getLogger(__name__)
+
+API_URL = "https://api.telegram.org"
+
+# Где в Update лежит автор события
+_FROM_KEYS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "my_chat_member", "chat_member", "chat_join_request",
+    "business_message", "edited_business_message",
+)
+
+
+def update_user_id(update: Dict[str, Any]) -> Optional[int]:
+    """user_id автора апдейта (как в сыром JSON от Telegram), иначе id чата, иначе None."""
+    for key in _FROM_KEYS:
+        ev = update.get(key)
+        if not ev:
+            continue
+        user = ev.get("from")
+        if user and "id" in user:
+            return int(user["id"])
+        chat = ev.get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+    ans = update.get("poll_answer")
+    if ans and ans.get("user"):
+        return int(ans["user"]["id"])
+    return None
+
+
+def shard_for(user_id: Optional[int], workers: int) -> int:
+    return (user_id or 0) % workers
+
+
+def shard_path(path: str, index: int) -> str:
+    """saves/players.db -> saves/players.shard2.db"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{index}{ext}"
+
+
+class ShardRouter:
+    """N процессов с target(index, workers, queue, *args); route() кладёт апдейт в очередь нужного."""
+
+    def __init__(self, target: Callable[..., None], workers: int, args: Sequence[Any] = ()):
+        self.workers = max(1, int(workers))
+        ctx = mp.get_context("spawn")
+        self.queues: List[Any] = [ctx.Queue() for _ in range(self.workers)]
+        self.procs = [
+            ctx.Process(target=target, args=(i, self.workers, self.queues[i], *args),
+                        name=f"shard-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        self.routed = [0] * self.workers
+
+    def start(self) -> None:
+        for p in self.procs:
+            p.start()
+
+    def route(self, update: Dict[str, Any]) -> int:
+        idx = shard_for(update_user_id(update), self.workers)
+        self.queues[idx].put(update)
+        self.routed[idx] += 1
+        return idx
+
+    def stop(self, timeout: float = 30.0) -> None:
+        for q in self.queues:
+            q.put(None)
+        for p in self.procs:
+            p.join(timeout)
+            if p.is_alive():
+                log.warning("%s did not stop in %.0fs, terminating", p.name, timeout)
+                p.terminate()
+
+
+# ---------- воркер ----------
+
+def _bot_worker(index: int, workers: int, queue: Any, token: str) -> None:
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL, logging.INFO),
+                        format=f"%(asctime)s %(levelname)s [shard{index}:%(name)s] %(message)s")
+    # свой шард хранилищ: config читается бэкендами в момент создания
+    config.STORAGE_PATH = shard_path(config.STORAGE_PATH, index)
+    config.FSM_STORAGE_PATH = shard_path(config.FSM_STORAGE_PATH, index)
+    if config.USAGE_DUMP_PATH:
+        config.USAGE_DUMP_PATH = shard_path(config.USAGE_DUMP_PATH, index)
+        # под spawn точка входа (main.py / app.main) уже импортирована как __mp_main__,
+        # а с ней и app.core.usage — общий счётчик успел запомнить путь без шарда
+        from app.core.usage import llm_usage
+        llm_usage.dump_path = config.USAGE_DUMP_PATH
+    asyncio.run(_bot_worker_async(index, queue, token))
+
+
+async def _bot_worker_async(index: int, queue: Any, token: str) -> None:
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+
+    from app.core.fsm_storage import make_fsm_storage
+    from app.core.storage import init_storage, shutdown_storage
+    from app.core.user_lock import SLOT_KEY, ConcurrencySlot
+    from app.main import build_dispatcher
+
+    fsm_storage = make_fsm_storage()
+    bot = Bot(token=token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp = build_dispatcher(fsm_storage)
+    init_storage()
+
+    slots = asyncio.Semaphore(max(1, config.WEBHOOK_CONCURRENCY))
+    tasks: set = set()
+    loop = asyncio.get_running_loop()
+
+    async def feed(update: Dict[str, Any], slot: ConcurrencySlot) -> None:
+        try:
+            # слот отдаётся на время ожидания замка игрока (UserLockMiddleware)
+            await dp.feed_raw_update(bot, update, **{SLOT_KEY: slot})
+        except Exception:
+            log.exception("update %s failed", update.get("update_id"))
+        finally:
+            slot.release()
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    log.info("shard %d ready", index)
+    try:
+        while True:
+            update = await loop.run_in_executor(None, queue.get)
+            if update is None:
+                break
+            slot = ConcurrencySlot(slots)
+            await slot.acquire()
+            t = asyncio.create_task(feed(update, slot))
+            tasks.add(t)
+            t.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        shutdown_storage()
+        await fsm_storage.close()
+        await bot.session.close()
+
+
+# ---------- фронт ----------
+
+async def _polling_front(token: str, router: ShardRouter) -> None:
+    import aiohttp
+
+    url = f"{API_URL}/bot{token}/getUpdates"
+    offset: Optional[int] = None
+    timeout = aiohttp.ClientTimeout(total=50)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while True:
+            params: Dict[str, Any] = {"timeout": 30}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                async with session.get(url, params=params) as resp:
+                    data = await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            if not data.get("ok"):
+                log.warning("getUpdates error: %s", data.get("description"))
+                await asyncio.sleep(1)
+                continue
+            for update in data.get("result", []):
+                router.route(update)
+                offset = update["update_id"] + 1
+
+
+async def _webhook_front(router: ShardRouter) -> None:
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        if config.WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != config.WEBHOOK_SECRET:
+            return web.Response(status=401, text="Unauthorized")
+        router.route(await request.json())
+        return web.Response(text="ok")
+
+    async def healthz(_: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post(config.WEBHOOK_PATH, handle)
+    app.router.add_get("/healthz", healthz)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT).start()
+    log.info("Sharded webhook front on %s:%s%s", config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_sharded(token: str, workers: int) -> None:
+    """Поднять воркеры и фронт по config.BOT_MODE; при остановке — дождаться воркеров."""
+    router = ShardRouter(_bot_worker, workers, args=(token,))
+    router.start()
+    log.info("Started %d shard workers (%s front)", workers, config.BOT_MODE)
+    try:
+        if config.BOT_MODE == "webhook":
+            await _webhook_front(router)
+        else:
+            await _polling_front(token, router)
+    finally:
+        await asyncio.to_thread(router.stop)
+        log.info("Shard routing totals: %s", router.routed)
@@ -2,6 +2,8 @@
 # app/ui/keyboards.py
 from __future__ import annotations
 
+from typing import List
+
 from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton,
     ReplyKeyboardMarkup, KeyboardButton
@@ -53,3 +55,44 @@ def city_menu_kb() -> ReplyKeyboardMarkup:
         resize_keyboard=True,
         one_time_keyboard=False
     )
+
+# ---------- Подземелье (INLINE) ----------
+def dungeon_pick_kb(names: List[str]) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text=f"🕳 {name}", callback_data=f"dng_pick_{i}")]
+            for i, name in enumerate(names, start=1)]
+    rows.append([InlineKeyboardButton(text="↩️ В город", callback_data="dng_back_city")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def room_actions_kb(can_camp: bool, has_exit: bool) -> InlineKeyboardMarkup:
+    rows = [[
+        InlineKeyboardButton(text="🔎 Обыскать", callback_data="dng_search"),
+        InlineKeyboardButton(text="🚪 Дальше",   callback_data="dng_next"),
+    ]]
+    if can_camp:
+        rows.append([InlineKeyboardButton(text="🏕 Привал", callback_data="dng_camp")])
+    if has_exit:
+        rows.append([InlineKeyboardButton(text="🏃 Покинуть подземелье", callback_data="dng_escape")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def combat_actions_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="⚔️ Атаковать", callback_data="dng_attack"),
+            InlineKeyboardButton(text="✨ Умения",     callback_data="dng_skills"),
+        ],
+        [InlineKeyboardButton(text="🏃 Бежать", callback_data="dng_flee")],
+    ])
+
+def skills_pick_kb(skills: List[str]) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text=name, callback_data=f"dng_skill_{i}")]
+            for i, name in enumerate(skills, start=1)]
+    rows.append([InlineKeyboardButton(text="↩️ Назад", callback_data="dng_skills_back")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def confirm_leave_dungeon_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="✅ Да, уйти",  callback_data="dng_leave_yes"),
+            InlineKeyboardButton(text="↩️ Остаться", callback_data="dng_leave_no"),
+        ],
+    ])
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# app/ui/progressive.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import types
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from app.core import config
+
+log = logging.getLogger(__name__)
+
+# Фоновые задачи дорисовки (держим ссылки, чтобы их не собрал GC)
+_TASKS: Set[asyncio.Task] = set()
+
+_STATS: Dict[str, int] = {"sent": 0, "edited": 0, "dropped": 0, "failed": 0, "stream_edits": 0, "throttled": 0}
+
+
+async def answer_progressive(
+    message: types.Message,
+    render: Callable[[str], str],
+    fallback: str,
+    prose: Optional[Awaitable[Optional[str]]],
+    *,
+    reply_markup: Any = None,
+    deadline: Optional[float] = None,
+) -> types.Message:
+    """
+    Сразу отправить render(fallback) — механика хода видна через один round-trip
+    Telegram, — а когда придёт текст от LLM, отредактировать это же сообщение в
+    render(prose). Не успел к дедлайну (или вернул None) — правка не делается.
+    """
+    try:
+        sent = await message.answer(render(fallback), reply_markup=reply_markup)
+    except BaseException:
+        await discard(prose)
+        raise
+    _STATS["sent"] += 1
+    if prose is None:
+        return sent
+    _spawn(_finish(sent, render, fallback, prose, reply_markup,
+                   config.PROGRESSIVE_DEADLINE if deadline is None else deadline))
+    return sent
+
+
+async def _finish(sent: types.Message, render: Callable[[str], str], fallback: str,
+                  prose: Awaitable[Optional[str]], reply_markup: Any, deadline: float) -> None:
+    try:
+        text = await asyncio.wait_for(prose, deadline)
+    except asyncio.TimeoutError:
+        _STATS["dropped"] += 1
+        return
+    except Exception:
+        log.exception("progressive prose failed")
+        _STATS["failed"] += 1
+        return
+    if not text or text == fallback:
+        _STATS["dropped"] += 1
+        return
+    try:
+        # reply_markup передаём заново — иначе правка текста снимет клавиатуру
+        await sent.edit_text(render(text), reply_markup=reply_markup)
+        _STATS["edited"] += 1
+    except TelegramAPIError as e:
+        # сообщение удалили / текст не изменился — игроку и так видна механика
+        log.debug("progressive edit failed: %s", e)
+        _STATS["failed"] += 1
+
+
+async def discard(source: Any) -> None:
+    """
+    Бросить неиспользованную прозу: закрыть поток (aclose освобождает слот шлюза LLM),
+    отменить задачу или закрыть корутину — иначе «coroutine was never awaited».
+    """
+    if source is None:
+        return
+    if asyncio.isfuture(source):
+        source.cancel()
+    elif asyncio.iscoroutine(source):
+        source.close()
+    else:
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                log.debug("progressive source close failed", exc_info=True)
+
+
+def _spawn(coro: Awaitable[None]) -> None:
+    task = asyncio.ensure_future(coro)
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
+
+
+# ---------- потоковая дорисовка ----------
+
+def _partial(text: str) -> str:
+    """Обрезать недописанное слово: на экране только целые слова + «…»."""
+    cut = text.rstrip()
+    if cut and not text[-1].isspace():
+        space = cut.rfind(" ")
+        cut = cut[:space].rstrip() if space > 0 else ""
+    return cut + " …" if cut else ""
+
+
+async def answer_streaming(
+    message: types.Message,
+    render: Callable[[str], str],
+    fallback: str,
+    chunks: Optional[AsyncIterator[str]],
+    *,
+    reply_markup: Any = None,
+    interval: Optional[float] = None,
+    deadline: Optional[float] = None,
+) -> types.Message:
+    """
+    Как answer_progressive, но проза приходит потоком: сообщение правится по мере
+    генерации, не чаще раза в interval секунд (лимит Telegram на правки), и финально —
+    полным текстом. render получает обычный текст и сам его экранирует, поэтому
+    промежуточный HTML всегда валиден (обрезка идёт по словам до экранирования).
+    Первый кусок не пришёл за deadline или поток замолк на deadline — дорисовка
+    заканчивается тем, что успели показать (или не начинается вовсе).
+    """
+    try:
+        sent = await message.answer(render(fallback), reply_markup=reply_markup)
+    except BaseException:
+        await discard(chunks)
+        raise
+    _STATS["sent"] += 1
+    if chunks is None:
+        return sent
+    _spawn(_stream(sent, render, chunks, reply_markup,
+                   config.STREAM_EDIT_INTERVAL if interval is None else interval,
+                   config.PROGRESSIVE_DEADLINE if deadline is None else deadline))
+    return sent
+
+
+async def _stream(sent: types.Message, render: Callable[[str], str], chunks: AsyncIterator[str],
+                  reply_markup: Any, interval: float, deadline: float) -> None:
+    loop = asyncio.get_running_loop()
+    text = ""
+    shown = ""
+    cut = False                            # поток оборван (замолк/упал) — текст не полный
+    next_edit = loop.time() + interval     # первая правка — когда наберётся хоть немного текста
+    it = chunks.__aiter__()
+    try:
+        while True:
+            try:
+                delta = await asyncio.wait_for(it.__anext__(), deadline)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                if not text:
+                    _STATS["dropped"] += 1
+                    return
+                cut = True
+                break
+            text += delta
+            if loop.time() < next_edit:
+                continue
+            partial = _partial(text)
+            if partial and partial != shown:
+                pause = await _edit(sent, render(partial), reply_markup)
+                if pause is None:
+                    shown = partial
+                    _STATS["stream_edits"] += 1
+                next_edit = loop.time() + max(interval, pause or 0.0)
+    except Exception:
+        log.exception("progressive stream failed")
+        cut = True
+    finally:
+        aclose = getattr(it, "aclose", None)
+        if aclose is not None:
+            await aclose()          # освободить слот шлюза LLM, если поток брошен
+
+    # оборванный ответ не должен выглядеть законченным: целые слова + «…», как в правках по ходу
+    final = _partial(text) if cut else text.strip()
+    if not final:
+        _STATS["dropped"] += 1
+        return
+    if final == shown:
+        return
+    # финальная правка обязательна: если Telegram просит подождать — ждём один раз
+    pause = await _edit(sent, render(final), reply_markup)
+    if pause:
+        await asyncio.sleep(pause)
+        pause = await _edit(sent, render(final), reply_markup)
+    if pause is None:
+        _STATS["edited"] += 1
+    else:
+        _STATS["failed"] += 1
+
+
+async def _edit(sent: types.Message, text: str, reply_markup: Any) -> Optional[float]:
+    """None — правка прошла; иначе сколько секунд подождать (0 — не повторять)."""
+    try:
+        await sent.edit_text(text, reply_markup=reply_markup)
+        return None
+    except TelegramRetryAfter as e:
+        _STATS["throttled"] += 1
+        return float(e.retry_after)
+    except TelegramAPIError as e:
+        log.debug("progressive edit failed: %s", e)
+        return 0.0
+
+
+def progressive_stats() -> Dict[str, int]:
+    return dict(_STATS, pending=len(_TASKS))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# app/webhook.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from app.core import config
+from app.core.user_lock import SLOT_KEY, ConcurrencySlot
+
+log = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Вебхук-хендлер aiogram: отвечает Telegram 200 сразу, а апдейт обрабатывает в фоне,
+    но не больше concurrency апдейтов одновременно — остальные ждут своей очереди.
+    Апдейт, ждущий замок своего игрока (UserLockMiddleware), слот на это время отдаёт.
+    Секрет (X-Telegram-Bot-Api-Secret-Token) проверяет базовый класс.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int, **kwargs: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._slots = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        slot = ConcurrencySlot(self._slots)
+        await slot.acquire()
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data,
+                                                           **{SLOT_KEY: slot})
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+        finally:
+            slot.release()
+
+
+async def _healthz(_: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+def build_webhook_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """aiohttp-приложение: POST config.WEBHOOK_PATH принимает Update JSON, GET /healthz — для балансировщика."""
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp, bot,
+        concurrency=config.WEBHOOK_CONCURRENCY,
+        secret_token=config.WEBHOOK_SECRET or None,
+    )
+    handler.register(app, path=config.WEBHOOK_PATH)
+    app.router.add_get("/healthz", _healthz)
+    # startup/shutdown диспетчера привязываются к жизненному циклу приложения
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Поднять вебхук-сервер и (если задан WEBHOOK_BASE_URL) зарегистрировать вебхук у Telegram."""
+    if not config.WEBHOOK_SECRET:
+        log.warning("WEBHOOK_SECRET не задан — вебхук примет запрос от кого угодно")
+
+    app = build_webhook_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT)
+    await site.start()
+    log.info("Webhook server on %s:%s%s (concurrency=%s)",
+             config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH, config.WEBHOOK_CONCURRENCY)
+
+    if config.WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -1,38 +1,43 @@
-import os, time
-import httpx
+import asyncio
+import os
+
 from dotenv import load_dotenv
-from openai import OpenAI
 
 load_dotenv()
+
+from app.core.proxy_pool import ProxyPool, load_proxies  # noqa: E402
+
 API_KEY = os.getenv("OPENAI_API_KEY")
 assert API_KEY, "Нет OPENAI_API_KEY в .env"
 
-def test_proxy(proxy: str) -> tuple[bool, str]:
+PROXIES_FILE = os.getenv("OPENAI_PROXIES_FILE") or "proxies.txt"
+
+
+async def main():
+    # та же проверка, что делает бот на старте: все прокси параллельно
+    pool = ProxyPool(load_proxies(PROXIES_FILE, os.getenv("OPENAI_PROXY", "")),
+                     api_key=API_KEY, probe_timeout=12.0)
+    print(f"Протестируем {len(pool.proxies)} прокси (параллельно)...")
     try:
-        client = OpenAI(
-            api_key=API_KEY,
-            http_client=httpx.Client(proxy=proxy, timeout=12.0)
-        )
-        t0 = time.time()
-        _ = client.models.list()     # лёгкий запрос
-        dt = time.time() - t0
-        return True, f"OK ({dt:.2f}s)"
-    except Exception as e:
-        return False, f"{type(e).__name__}: {e}"
-
-with open("proxies.txt", "r", encoding="utf-8") as f:
-    candidates = [line.strip() for line in f if line.strip() and not line.startswith("#")]
-
-print(f"Протестируем {len(candidates)} прокси...")
-best = None
-for p in candidates:
-    ok, msg = test_proxy(p)
-    print(f"{p}  ->  {msg}")
-    if ok and best is None:
-        best = p
-
-if best:
-    print("\n✅ Нашли рабочий прокси!")
-    print("Поставь в .env строку:\nOPENAI_PROXY=" + best)
-else:
-    print("\n❌ Ни один из прокси не прошёл. Возьми другой список или платный SOCKS5/HTTPS.")
+        results = await pool.probe_all()
+    finally:
+        await pool.close()
+
+    stats = pool.stats()
+    for p in pool.proxies:
+        dt = results.get(p)
+        msg = f"OK ({dt:.2f}s)" if dt is not None else stats["down"].get(p, "пропущен")
+        print(f"{p}  ->  {msg}")
+
+    if stats["healthy"]:
+        print("\n✅ Рабочие прокси (от быстрого к медленному):")
+        for p, ms in stats["healthy"]:
+            print(f"  {p}  {ms} ms")
+        print(f"\nБот сам выбирает быстрейший и переключается при сбое — достаточно строки в .env:\n"
+              f"OPENAI_PROXIES_FILE={PROXIES_FILE}")
+    else:
+        print("\n❌ Ни один из прокси не прошёл. Возьми другой список или платный SOCKS5/HTTPS.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
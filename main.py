@@ -6,19 +6,21 @@ import os
 import asyncio
 import logging
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.filters import CommandStart
 
-# Наши роутеры
-from app.features import creation, market, tavern
+# Роутеры и middleware — общие с app.main и шард-воркерами
+from app.main import build_dispatcher
+from app.core.fsm_storage import make_fsm_storage
+from app.core.config import BOT_MODE, SHARD_WORKERS
 
 # (опционально) инициализация стораджа, если есть
 try:
-    from app.core.storage import init_storage  # type: ignore
+    from app.core.storage import init_storage, shutdown_storage  # type: ignore
 except Exception:
     init_storage = None
+    shutdown_storage = None
 
 
 async def main() -> None:
@@ -26,29 +28,34 @@ async def main() -> None:
     if not token:
         raise RuntimeError("Переменная окружения BOT_TOKEN не задана")
 
+    if SHARD_WORKERS > 1:
+        # фронт раздаёт апдейты воркер-процессам по user_id (см. app/sharding.py)
+        from app.sharding import run_sharded
+        await run_sharded(token, SHARD_WORKERS)
+        return
+
     # ✅ aiogram 3.7+: parse_mode задаём через default=DefaultBotProperties
     bot = Bot(
         token=token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher()
-
-    @dp.message(CommandStart())
-    async def start_cmd(m: types.Message):
-        await m.answer(
-            "Привет! Я запущен.\n"
-            "Жми «Город» в меню или создавай персонажа."
-        )
-
-    # Подключаем фичи
-    dp.include_router(creation.router)
-    dp.include_router(market.router)
-    dp.include_router(tavern.router)
+    fsm_storage = make_fsm_storage()
+    dp = build_dispatcher(fsm_storage)
 
     if init_storage:
         init_storage()
 
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            from app.webhook import run_webhook
+            await run_webhook(bot, dp)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        # дописываем отложенные сохранения игроков
+        if shutdown_storage:
+            shutdown_storage()
+        await fsm_storage.close()
 
 
 if __name__ == "__main__":
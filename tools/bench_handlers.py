@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# tools/bench_handlers.py
+"""
+Задержка хендлеров под LLM-заглушкой (tools/llm_stub.py) — без сети и без ключа.
+
+Каждый виртуальный игрок проходит confirm_class -> choose_dungeon -> tavern_rest
+(несколько раундов), все игроки одновременно. Бот настроен как в бою
+(OAI_ENABLED=1, шлюз, прокси-пул/прямой клиент), только OPENAI_BASE_URL смотрит
+на заглушку, а Telegram заменён фейковыми Message/CallbackQuery, которые
+запоминают время каждой отправки и правки.
+
+Две метрики на хендлер:
+  handler — пока хендлер не вернул управление (игрок увидел первый ответ);
+  e2e     — до последней правки сообщения (проза от LLM дорисована).
+
+Запуск:  python tools/bench_handlers.py [--users 20] [--rounds 5]
+                                        [--latency lognormal:0.8,0.5] [--error-rate 0.05] ...
+         python tools/bench_handlers.py --url http://127.0.0.1:8765/v1   (внешняя заглушка)
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import llm_stub  # noqa: E402
+
+_HANDLERS = ("confirm_class", "choose_dungeon", "tavern_rest")
+
+
+class FakeMessage:
+    """Сообщение Telegram: answer/edit_text только отмечают время в общий журнал вызова."""
+
+    def __init__(self, user_id: int, marks: List[float], text: str = ""):
+        self.chat = SimpleNamespace(id=user_id)
+        self.from_user = SimpleNamespace(id=user_id)
+        self.text = text
+        self._marks = marks
+
+    async def answer(self, text: str, **_: Any) -> "FakeMessage":
+        await asyncio.sleep(0)              # точка переключения, как у настоящего запроса
+        self._marks.append(time.perf_counter())
+        return FakeMessage(self.chat.id, self._marks, text)
+
+    async def edit_text(self, text: str, **_: Any) -> "FakeMessage":
+        await asyncio.sleep(0)
+        self._marks.append(time.perf_counter())
+        self.text = text
+        return self
+
+
+class FakeCallback:
+    def __init__(self, user_id: int, data: str, marks: List[float]):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.data = data
+        self.message = FakeMessage(user_id, marks)
+
+    async def answer(self, *_: Any, **__: Any) -> None:
+        return None
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+async def _measure(results: Dict[str, Dict[str, List[float]]], name: str,
+                   call: Callable[[List[float]], Awaitable[Any]]) -> None:
+    from app.ui import progressive
+
+    marks: List[float] = []
+    before = set(progressive._TASKS)
+    t0 = time.perf_counter()
+    await call(marks)
+    t1 = time.perf_counter()
+    # дождаться фоновой дорисовки, запущенной этим вызовом
+    mine = [t for t in progressive._TASKS if t not in before]
+    if mine:
+        await asyncio.gather(*mine, return_exceptions=True)
+    results[name]["handler"].append(t1 - t0)
+    results[name]["e2e"].append(max([t1] + marks) - t0)
+
+
+async def _player(uid: int, rounds: int, results: Dict[str, Dict[str, List[float]]]) -> None:
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    from app.core.storage import get_player, save_player
+    from app.core.usage import bind_player
+    from app.features.creation import CLASS_LABELS, confirm_class
+    from app.features.dungeon import choose_dungeon
+    from app.features.tavern import tavern_rest
+
+    bind_player(uid)                    # как player_context_middleware в боте
+    storage = MemoryStorage()
+    classes = list(CLASS_LABELS)
+    for r in range(rounds):
+        class_key = classes[(uid + r) % len(classes)]
+        state = FSMContext(storage=storage, key=StorageKey(bot_id=0, chat_id=uid, user_id=uid))
+        await state.update_data(name=f"Игрок{uid}", gender="male", class_key=class_key,
+                                class_label=CLASS_LABELS[class_key], campaign_id=None)
+        await _measure(results, "confirm_class",
+                       lambda marks: confirm_class(FakeCallback(uid, "confirm_class", marks), state))
+
+        p = get_player(uid)
+        p.dungeon_names = ["Склеп Забытых", "Пещера Эха", "Чёрная Шахта"]
+        save_player(p)
+        await _measure(results, "choose_dungeon",
+                       lambda marks: choose_dungeon(FakeCallback(uid, f"dng_pick_{r % 3 + 1}", marks)))
+
+        p = get_player(uid)
+        p.hp = max(1, p.hp - 5)
+        p.gold = max(p.gold, 100)
+        save_player(p)
+        await _measure(results, "tavern_rest",
+                       lambda marks: tavern_rest(FakeCallback(uid, "t_rest", marks)))
+
+
+def _report(results: Dict[str, Dict[str, List[float]]]) -> None:
+    print(f"\n{'хендлер':<16}{'метрика':<9}{'n':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (мс)")
+    for name in _HANDLERS:
+        for metric in ("handler", "e2e"):
+            v = results[name][metric]
+            print(f"{name:<16}{metric:<9}{len(v):>5}"
+                  f"{percentile(v, 0.50) * 1000:>9.1f}{percentile(v, 0.95) * 1000:>9.1f}"
+                  f"{percentile(v, 0.99) * 1000:>9.1f}{(max(v) if v else 0) * 1000:>9.1f}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    stub = None
+    url = args.url
+    if not url:
+        stub = await llm_stub.from_args(args).start()
+        url = stub.base_url
+    # конфиг читается при импорте — окружение выставляем до первого импорта app.*
+    tmp = tempfile.mkdtemp(prefix="bench_handlers_")
+    os.environ.update({
+        "OAI_ENABLED": "1",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "stub",
+        "OPENAI_BASE_URL": url,
+        "STORAGE_PATH": os.path.join(tmp, "players.db"),
+        "LLM_CACHE_PATH": os.path.join(tmp, "llm_cache.db"),
+        "USAGE_DUMP_PATH": "",
+    })
+
+    from app.core.line_pools import line_pools
+    from app.core.llm import llm
+    from app.core.narration_cache import narration_cache
+    from app.core.storage import init_storage, shutdown_storage
+    from app.core.usage import llm_usage
+    from app.ui.progressive import progressive_stats
+
+    init_storage()
+    llm.start()
+    line_pools.prime()
+    results: Dict[str, Dict[str, List[float]]] = {n: {"handler": [], "e2e": []} for n in _HANDLERS}
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(*(_player(100000 + i, args.rounds, results) for i in range(args.users)))
+    finally:
+        wall = time.perf_counter() - t0
+        await llm.close()
+        shutdown_storage()
+        if stub is not None:
+            await stub.close()
+
+    print(f"LLM: {url}  игроков: {args.users}  раундов: {args.rounds}  за {wall:.1f} с")
+    _report(results)
+    print(f"\nшлюз LLM:     {llm.stats()}")
+    print(f"кэш описаний: {narration_cache.stats()}")
+    print(f"дорисовка:    {progressive_stats()}")
+    if stub is not None:
+        print(f"заглушка:     {stub.stats()}")
+
+    snap = llm_usage.snapshot()
+    print(f"\n{'назначение':<26}{'вызовов':>8}{'сброшено':>9}{'токены вх+вых':>16}{'$':>10}{'avg мс':>8}")
+    for name, t in snap["purposes"].items():
+        print(f"{name:<26}{t['calls']:>8}{t['dropped']:>9}"
+              f"{t['prompt_tokens']:>9}+{t['completion_tokens']:<6}{t['cost_usd']:>10.5f}{t['latency_avg_ms']:>8.0f}")
+    for uid, t in snap["top_players"][:3]:
+        print(f"игрок {uid}: {t['calls']} вызовов, ${t['cost_usd']:.5f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="p50/p95/p99 хендлеров под LLM-заглушкой")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--url", default="", help="внешняя заглушка; по умолчанию поднимается своя")
+    llm_stub.add_arguments(ap)
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# tools/bench_player_memory.py
+"""
+Сколько памяти занимает один игрок в процессе — для выбора размера хоста.
+
+Сравнивает компактный app.core.models.Player (slots, интернированные строки, общий
+ability_meta) с прежним представлением (обычный dataclass с __dict__, динамические
+атрибуты, копия ability_meta у каждого игрока).
+
+Запуск:  python tools/bench_player_memory.py [10000 100000 1000000]
+"""
+
+from __future__ import annotations
+import gc
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.campaign import arrival_city_name, get_epic  # noqa: E402
+from app.core.models import Player, ability_meta_entry  # noqa: E402
+
+CLASSES = [("swordsman", "🗡️ Мечник", "Мощный удар", "🗡️"),
+           ("mage", "🔮 Маг", "Огненный шар", "🔮🔥"),
+           ("archer", "🏹 Лучник", "Точный выстрел", "🏹")]
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+@dataclass
+class LegacyPlayer:
+    """Player до компактизации: __dict__ на экземпляр + атрибуты, навешенные хендлерами."""
+    user_id: int
+    gender: str = "male"
+    name: str = "Герой"
+    class_key: str = "swordsman"
+    class_label: str = "🗡️ Мечник"
+    level: int = 1
+    exp: int = 0
+    gold: int = 50
+    strength: int = 5
+    dexterity: int = 5
+    intellect: int = 3
+    endurance: int = 3
+    max_hp: int = 8
+    hp: int = 8
+    city_name: str = "Златоград"
+    world_story: str = ""
+    inventory: Dict[str, int] = field(default_factory=dict)
+    equipment: Dict[str, Optional[str]] = field(default_factory=lambda: {"weapon": None, "armor": None})
+    abilities_known: Dict[str, int] = field(default_factory=dict)
+    ability_meta: Dict[str, Dict] = field(default_factory=dict)
+    ability_charges: Dict[str, int] = field(default_factory=dict)
+
+
+def _fresh(s: str) -> str:
+    # как после json.loads: новый объект строки на каждого игрока
+    return s.encode("utf-8").decode("utf-8")
+
+
+def make_legacy(i: int) -> LegacyPlayer:
+    ck, label, ab, emo = CLASSES[i % len(CLASSES)]
+    p = LegacyPlayer(user_id=i, name=f"Герой{i}", class_key=_fresh(ck), class_label=_fresh(label),
+                     city_name=_fresh(arrival_city_name(None)), world_story=_fresh(get_epic(None)))
+    p.inventory = {"Зелье лечения": 2, "Полевой набор": 1}
+    p.abilities_known = {ab: 1}
+    p.ability_meta = {ab: {"emoji": emo, "title": ab, "type": "active"}}
+    p.ability_charges = {ab: 3}
+    p.shop_items = None
+    p.shop_dirty = False
+    p.campaign_id = _fresh("eclipse")
+    return p
+
+
+def make_compact(i: int) -> Player:
+    ck, label, ab, emo = CLASSES[i % len(CLASSES)]
+    p = Player(user_id=i, name=f"Герой{i}", class_key=_fresh(ck), class_label=_fresh(label),
+               city_name=_fresh(arrival_city_name(None)), world_story=_fresh(get_epic(None)),
+               campaign_id=_fresh("eclipse"))
+    p.inventory = {"Зелье лечения": 2, "Полевой набор": 1}
+    p.abilities_known = {ab: 1}
+    p.ability_meta = {ab: ability_meta_entry(ab, emo, "active")}
+    p.ability_charges = {ab: 3}
+    return p
+
+
+def measure(factory: Callable[[int], object], n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    players: List[object] = [factory(i) for i in range(n)]
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    # сам список-контейнер к игрокам не относится
+    used -= sys.getsizeof(players)
+    del players
+    gc.collect()
+    return used / n
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    print(f"{'players':>10} | {'legacy B/player':>16} | {'compact B/player':>17} | {'compact total':>14}")
+    print("-" * 68)
+    for n in sizes:
+        legacy = measure(make_legacy, n)
+        compact = measure(make_compact, n)
+        total_mb = compact * n / (1024 * 1024)
+        print(f"{n:>10} | {legacy:>16.0f} | {compact:>17.0f} | {total_mb:>11.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
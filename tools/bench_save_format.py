@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# tools/bench_save_format.py
+"""
+Сравнение формата сохранений: старый pretty-JSON (indent=2) против версионированного
+бинарного контейнера из app.core.persistence — размер и время encode/decode на документ.
+
+Запуск:  python tools/bench_save_format.py [итераций]
+"""
+
+from __future__ import annotations
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.campaign import arrival_city_name, get_epic  # noqa: E402
+from app.core.models import Player, ability_meta_entry  # noqa: E402
+from app.core.persistence import decode_doc, encode_doc, player_to_doc  # noqa: E402
+
+
+def sample_player() -> Player:
+    p = Player(user_id=123456789, name="Арвен", class_key="mage", class_label="🔮 Маг",
+               city_name=arrival_city_name(None), world_story=get_epic(None), campaign_id="eclipse")
+    p.inventory = {"Зелье лечения": 3, "Полевой набор": 1, "Посох ученика": 1, "Мантия послушника": 1}
+    p.equipment = {"weapon": "Посох ученика", "armor": "Мантия послушника"}
+    p.abilities_known = {"Огненный шар": 1}
+    p.ability_meta = {"Огненный шар": ability_meta_entry("Огненный шар", "🔮🔥", "active")}
+    p.ability_charges = {"Огненный шар": 3}
+    p.shop_items = [
+        {"name": "Зелье лечения", "kind": "consumable", "price": 8, "desc": "Восстанавливает часть здоровья.", "max_stack": 3},
+        {"name": "Полевой набор", "kind": "camp", "price": 15, "desc": "Набор для отдыха в дороге.", "max_stack": 3},
+    ]
+    return p
+
+
+def bench(name: str, enc, dec, doc, n: int) -> None:
+    blob = enc(doc)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        enc(doc)
+    t_enc = (time.perf_counter() - t0) / n * 1e6
+    t0 = time.perf_counter()
+    for _ in range(n):
+        dec(blob)
+    t_dec = (time.perf_counter() - t0) / n * 1e6
+    assert dec(blob) == doc, f"{name}: round-trip mismatch"
+    print(f"{name:<22} | {len(blob):>8} B | {t_enc:>9.1f} us | {t_dec:>9.1f} us")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    doc = player_to_doc(sample_player())
+
+    def json_enc(d):
+        return json.dumps(d, ensure_ascii=False, indent=2).encode("utf-8")
+
+    def json_dec(b):
+        return json.loads(b.decode("utf-8"))
+
+    print(f"{'format':<22} | {'size':>10} | {'encode':>12} | {'decode':>12}")
+    print("-" * 66)
+    bench("json indent=2 (old)", json_enc, json_dec, doc, n)
+    bench("RGSV v2 binary (new)", encode_doc, decode_doc, doc, n)
+
+
+if __name__ == "__main__":
+    main()
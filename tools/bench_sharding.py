@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# tools/bench_sharding.py
+"""
+Пропускная способность шардирования по user_id: синтетические апдейты от множества
+игроков раздаются через ShardRouter на 1/2/4/8 воркер-процессов. Каждый воркер держит
+свой SqlitePlayerStore (как боевой шард) и на каждый апдейт делает «работу хендлера»:
+загрузка игрока, CPU-часть (сборка текста экрана) и сохранение.
+
+Запуск:  python tools/bench_sharding.py [апдейтов] [игроков]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.sharding import ShardRouter  # noqa: E402
+
+
+def _handler_work(p) -> str:
+    # имитация CPU-части хендлера: список товаров + экран инвентаря
+    lines = []
+    for i in range(200):
+        lines.append(f"{i}. Товар {i} — {(i * 7 + p.gold) % 97} зол. <i>описание {i}</i>")
+    lines.extend(f"{k} ×{v}" for k, v in sorted(p.inventory.items()))
+    return "\n".join(lines)
+
+
+def _bench_worker(index: int, workers: int, queue, results, db_dir: str) -> None:
+    from app.core.models import Player
+    from app.core.sqlite_store import SqlitePlayerStore
+
+    store = SqlitePlayerStore(os.path.join(db_dir, f"players.shard{index}.db"),
+                              flush_interval=0.5, cache_entries=5000, cache_bytes=64 << 20)
+    done = 0
+    last_flush = time.monotonic()
+    while True:
+        update = queue.get()
+        if update is None:
+            break
+        uid = update["message"]["from"]["id"]
+        p = store.get(uid) or Player(user_id=uid, name=f"p{uid}")
+        _handler_work(p)
+        p.gold += 1
+        p.inventory["Зелье лечения"] = p.inventory.get("Зелье лечения", 0) + 1
+        store.save(p)
+        done += 1
+        # без event loop — сбрасываем write-behind очередь вручную с тем же интервалом
+        if time.monotonic() - last_flush >= store.flush_interval:
+            store.flush()
+            last_flush = time.monotonic()
+    store.close()
+    results.put(done)
+
+
+def run(workers: int, updates: int, players: int) -> float:
+    import multiprocessing as mp
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        results = mp.get_context("spawn").Queue()
+        router = ShardRouter(_bench_worker, workers, args=(results, db_dir))
+        router.start()
+        time.sleep(1.0)    # дать воркерам подняться (spawn + импорты)
+        t0 = time.perf_counter()
+        for i in range(updates):
+            uid = 100000 + (i * 7919) % players
+            router.route({"update_id": i, "message": {"message_id": i, "from": {"id": uid},
+                                                       "chat": {"id": uid}, "text": "Рынок"}})
+        router.stop(timeout=120)
+        total = sum(results.get() for _ in range(workers))
+        dt = time.perf_counter() - t0
+    assert total == updates, (total, updates)
+    print(f"workers={workers}: {updates} апдейтов за {dt:.2f}s -> {updates / dt:,.0f} upd/s "
+          f"(по шардам: {router.routed})")
+    return updates / dt
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    base = None
+    for workers in (1, 2, 4, 8):
+        rate = run(workers, updates, players)
+        base = base or rate
+        print(f"  ускорение x{rate / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
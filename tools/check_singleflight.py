@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# tools/check_singleflight.py
+"""
+Проверка склейки одновременных запросов (app.core.singleflight) под конкуренцией:
+50 одновременных get_base_stats_for_class("mage") -> один вызов LLM; исключение
+доходит до всех ждущих; отмена одного ждущего не отменяет вызов для остальных;
+промахи кэша описаний по одному шаблону склеиваются.
+
+Запуск:  python tools/check_singleflight.py
+"""
+
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+# постоянный кэш LLM — во временный файл, иначе второй прогон возьмёт статы с диска
+os.environ["LLM_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+
+from app.core import attributes  # noqa: E402
+from app.core.llm import llm  # noqa: E402
+from app.core.narration_cache import NarrationCache  # noqa: E402
+from app.core.singleflight import SingleFlight  # noqa: E402
+
+
+class FakeCompletions:
+    """Имитация oai_client.chat.completions: считает вызовы, отвечает с задержкой."""
+
+    def __init__(self, content: str, delay: float = 0.05):
+        self.calls = 0
+        self.content = content
+        self.delay = delay
+
+    async def create(self, **_):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+async def check_base_stats() -> None:
+    fake = FakeCompletions('{"str":2,"dex":3,"int":8,"end":4}')
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=fake))
+    attributes._BASE_STATS_CACHE.clear()
+
+    results = await asyncio.gather(*(attributes.get_base_stats_for_class("mage") for _ in range(50)))
+    assert fake.calls == 1, fake.calls
+    assert all(r == {"str": 2, "dex": 3, "int": 8, "end": 4} for r in results)
+    await attributes.get_base_stats_for_class("mage")
+    assert fake.calls == 1, "второй заход должен брать из кэша"
+    print(f"base stats: 50 callers -> {fake.calls} LLM call, {attributes._FLIGHTS.stats()}")
+
+
+async def check_errors_and_cancel() -> None:
+    sf = SingleFlight()
+    calls = 0
+
+    async def boom():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        raise ValueError("llm down")
+
+    res = await asyncio.gather(*(sf.do("k", boom) for _ in range(10)), return_exceptions=True)
+    assert calls == 1 and all(isinstance(r, ValueError) for r in res)
+    assert not sf.in_flight("k")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return 42
+
+    waiters = [asyncio.ensure_future(sf.do("s", slow)) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    waiters[0].cancel()
+    res = await asyncio.gather(*waiters, return_exceptions=True)
+    assert isinstance(res[0], asyncio.CancelledError)
+    assert res[1:] == [42] * 4, res
+    print(f"errors/cancel: ok, {sf.stats()}")
+
+
+async def check_narration() -> None:
+    cache = NarrationCache(variants=4)
+    calls = 0
+
+    async def fill(_sys, usr, _mt):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return usr.replace("заходит", "осторожно заходит")
+
+    names = [f"Игрок{i:02d}" for i in range(20)]
+    res = await asyncio.gather(*(
+        cache.narrate("sys", f"{n} заходит в Склеп.", fill, 100, {"player": n, "dungeon": "Склеп"})
+        for n in names))
+    assert calls == 1, calls
+    assert all(r == f"{n} осторожно заходит в Склеп." for r, n in zip(res, names)), res
+    print(f"narration: 20 callers -> {calls} LLM call, {cache.stats()}")
+
+
+async def main() -> None:
+    await check_base_stats()
+    await check_errors_and_cancel()
+    await check_narration()
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
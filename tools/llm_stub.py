@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+# tools/llm_stub.py
+"""
+Локальный OpenAI-совместимый сервер-заглушка для замеров без сети и без ключа.
+
+Понимает POST /v1/chat/completions (обычный ответ и SSE-поток при "stream": true)
+и GET /v1/models (им ProxyPool проверяет живость). Задержка ответа берётся из
+распределения, часть запросов можно завалить 500 или 429 (с Retry-After).
+На промпт с JSON статов ("str"/"dex"/...) отвечает JSON, на остальное — прозой.
+
+Бот направляется сюда через .env:
+    OAI_ENABLED=1
+    OPENAI_API_KEY=stub
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+
+Запуск:  python tools/llm_stub.py [--port 8765] [--latency lognormal:0.8,0.5]
+                                  [--error-rate 0.05] [--rate-limit-rate 0.05]
+                                  [--ttft 0.3] [--tokens-per-sec 40]
+Распределения задержки: fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA (секунды).
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_PROSE = [
+    "Сырой камень под ногами блестит от влаги, а в глубине коридора мерцает чужой огонёк.",
+    "Где-то за стеной капает вода, и каждый удар капли отдаётся эхом, будто шаги невидимого стража.",
+    "Воздух пахнет ржавчиной и старым воском; на стенах темнеют следы когтей.",
+    "Тени у свода шевелятся, хотя ветра нет, и тишина кажется слишком внимательной.",
+    "Трактирщик хмыкает, вытирает кружку и кивает на лавку у очага: отдыхай, путник.",
+    "Над дорогой кружат вороны, а в кустах мелькает блеск чьей-то стали.",
+]
+
+
+def parse_latency(spec: str, rng: Optional[random.Random] = None) -> Callable[[], float]:
+    """'fixed:0.5' | 'uniform:0.2,1.0' | 'lognormal:0.8,0.5' -> генератор задержки в секундах."""
+    rng = rng or random.Random()
+    kind, _, args = spec.partition(":")
+    nums = [float(x) for x in args.split(",") if x.strip()] if args else []
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        value = nums[0] if nums else 0.0
+        return lambda: value
+    if kind == "uniform":
+        lo = nums[0] if nums else 0.0
+        hi = nums[1] if len(nums) > 1 else lo + 1.0
+        return lambda: rng.uniform(lo, hi)
+    if kind == "lognormal":
+        median = nums[0] if nums else 0.8
+        sigma = nums[1] if len(nums) > 1 else 0.5
+        mu = math.log(max(median, 1e-6))
+        return lambda: rng.lognormvariate(mu, sigma)
+    raise ValueError(f"unknown latency distribution: {spec!r}")
+
+
+class StubServer:
+    """
+    HTTP/1.1 с keep-alive на голом asyncio (без aiohttp), чтобы его можно было поднять
+    в том же процессе, что и замер (tools/bench_handlers.py), или отдельно из консоли.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, latency: str = "lognormal:0.8,0.5",
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 ttft: Optional[float] = None, tokens_per_sec: float = 40.0, seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.error_rate = float(error_rate)
+        self.rate_limit_rate = float(rate_limit_rate)
+        self.retry_after = float(retry_after)
+        self.ttft = ttft                    # None — первый токен через latency()
+        self.tokens_per_sec = max(1.0, float(tokens_per_sec))
+        self._rng = random.Random(seed)
+        self.latency = parse_latency(latency, self._rng)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+        self.requests = 0
+        self.streams = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    # ---------- жизненный цикл ----------
+
+    async def start(self) -> "StubServer":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]      # port=0 — выбрать свободный
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "streams": self.streams,
+                "errors": self.errors, "rate_limited": self.rate_limited}
+
+    # ---------- HTTP ----------
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, body = request
+                await self._dispatch(writer, method, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass                # клиент ушёл или сервер останавливается посреди ответа
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+        length = 0
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value.strip())
+        body = await reader.readexactly(length) if length else b""
+        return method, path.split("?", 1)[0], body
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: str, payload: Dict[str, Any],
+                    headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status}", "Content-Type: application/json",
+                f"Content-Length: {len(data)}", "Connection: keep-alive"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def _dispatch(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes) -> None:
+        if method == "GET" and path.endswith("/models"):
+            await self._send(writer, "200 OK", {"object": "list",
+                                                "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+            return
+        if method != "POST" or not path.endswith("/chat/completions"):
+            await self._send(writer, "404 Not Found", {"error": {"message": "not found"}})
+            return
+
+        self.requests += 1
+        req = json.loads(body or b"{}")
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            self.rate_limited += 1
+            await self._send(writer, "429 Too Many Requests",
+                             {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                             {"Retry-After": f"{self.retry_after:g}"})
+            return
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self.latency())
+            await self._send(writer, "500 Internal Server Error",
+                             {"error": {"message": "stub failure", "type": "server_error"}})
+            return
+
+        text = self._reply(req)
+        if req.get("stream"):
+            self.streams += 1
+            await self._stream(writer, req, text)
+        else:
+            await asyncio.sleep(self.latency())
+            await self._send(writer, "200 OK", self._completion(req, text))
+
+    # ---------- ответы ----------
+
+    def _reply(self, req: Dict[str, Any]) -> str:
+        messages: List[Dict[str, str]] = req.get("messages") or []
+        prompt = " ".join(str(m.get("content", "")) for m in messages)
+        if '"str"' in prompt:
+            points = [self._rng.randint(2, 6) for _ in range(4)]
+            return json.dumps(dict(zip(("str", "dex", "int", "end"), points)))
+        words = max(8, int(req.get("max_tokens") or 120) // 3)
+        out: List[str] = []
+        while sum(len(s.split()) for s in out) < min(words, 36):
+            out.append(self._rng.choice(_PROSE))
+        return " ".join(out)
+
+    @staticmethod
+    def _completion(req: Dict[str, Any], text: str) -> Dict[str, Any]:
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in req.get("messages") or []) // 3
+        return {
+            "id": f"chatcmpl-stub-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 3,
+                      "total_tokens": prompt_tokens + len(text) // 3},
+        }
+
+    async def _stream(self, writer: asyncio.StreamWriter, req: Dict[str, Any], text: str) -> None:
+        head = ["HTTP/1.1 200 OK", "Content-Type: text/event-stream",
+                "Transfer-Encoding: chunked", "Connection: keep-alive"]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        await asyncio.sleep(self.ttft if self.ttft is not None else self.latency())
+
+        base = {"id": f"chatcmpl-stub-{time.monotonic_ns()}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": req.get("model", "gpt-4o-mini")}
+
+        async def event(delta: Dict[str, Any], finish: Optional[str] = None) -> None:
+            chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish}])
+            data = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+
+        await event({"role": "assistant", "content": ""})
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            await event({"content": word if i == 0 else " " + word})
+            await asyncio.sleep(1.0 / self.tokens_per_sec)
+        await event({}, "stop")
+        if (req.get("stream_options") or {}).get("include_usage"):
+            usage = self._completion(req, text)["usage"]
+            data = f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n".encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        done = b"data: [DONE]\n\n"
+        writer.write(f"{len(done):x}\r\n".encode("latin-1") + done + b"\r\n0\r\n\r\n")
+        await writer.drain()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="lognormal:0.8,0.5",
+                        help="fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA (секунды)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After для 429, с")
+    parser.add_argument("--ttft", type=float, default=None, help="задержка первого токена потока, с")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0, help="скорость потока")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> StubServer:
+    return StubServer(host=host, port=port, latency=args.latency, error_rate=args.error_rate,
+                      rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                      ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, seed=args.seed)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    server = await from_args(args, args.host, args.port).start()
+    print(f"LLM stub: {server.base_url}  (Ctrl+C — стоп)")
+    try:
+        while True:
+            await asyncio.sleep(30)
+            print(f"stats: {server.stats()}")
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="OpenAI-совместимая заглушка для замеров")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    add_arguments(ap)
+    try:
+        asyncio.run(_main(ap.parse_args()))
+    except KeyboardInterrupt:
+        pass
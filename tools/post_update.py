@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# tools/post_update.py
+"""
+Локальная проверка вебхук-режима: отправить записанные Update JSON на сервер бота.
+
+    BOT_MODE=webhook WEBHOOK_SECRET=s3cret python main.py
+    python tools/post_update.py --text /start --secret s3cret
+    python tools/post_update.py --text /start --callback gender_male --user 42 --repeat 50
+    python tools/post_update.py my_updates.json --secret s3cret
+    cat my_updates.json | python tools/post_update.py - --secret s3cret
+
+--text / --callback собирают минимальные Update (сообщение / нажатие кнопки) от
+игрока --user прямо в команде. Файл ("-" — stdin) может содержать один Update
+(объект) или список Update'ов. Флаг --repeat N повторяет пачку N раз (с новыми
+update_id) — грубая нагрузка для проверки concurrency.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List
+
+
+def load_updates(paths: List[str]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for path in paths:
+        if path == "-":
+            data = json.load(sys.stdin)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        out.extend(data if isinstance(data, list) else [data])
+    return out
+
+
+def build_updates(texts: List[str], callbacks: List[str], user_id: int) -> List[Dict[str, Any]]:
+    """Минимальные Update: сообщения с текстом и нажатия inline-кнопок от одного игрока."""
+    user = {"id": user_id, "is_bot": False, "first_name": f"Test{user_id}"}
+    chat = {"id": user_id, "type": "private", "first_name": user["first_name"]}
+    now = int(time.time())
+    out: List[Dict[str, Any]] = []
+    for text in texts:
+        n = len(out) + 1
+        msg: Dict[str, Any] = {"message_id": n, "date": now, "chat": chat, "from": user, "text": text}
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        out.append({"update_id": n, "message": msg})
+    for data in callbacks:
+        n = len(out) + 1
+        out.append({"update_id": n, "callback_query": {
+            "id": str(n), "from": user, "chat_instance": str(user_id), "data": data,
+            "message": {"message_id": n, "date": now, "chat": chat, "text": "…"},
+        }})
+    return out
+
+
+def post(url: str, update: Dict[str, Any], secret: str) -> int:
+    body = json.dumps(update, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(url, data=body, method="POST",
+                                 headers={"Content-Type": "application/json"})
+    if secret:
+        req.add_header("X-Telegram-Bot-Api-Secret-Token", secret)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("files", nargs="*", help="JSON с Update или списком Update'ов; \"-\" — stdin")
+    ap.add_argument("--text", action="append", default=[], help="сообщение игрока (можно несколько)")
+    ap.add_argument("--callback", action="append", default=[], help="callback_data кнопки (можно несколько)")
+    ap.add_argument("--user", type=int, default=1000001, help="user_id для --text/--callback")
+    ap.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    ap.add_argument("--secret", default="")
+    ap.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args()
+
+    updates = build_updates(args.text, args.callback, args.user) + load_updates(args.files)
+    if not updates:
+        ap.error("нужен файл с Update'ами или --text/--callback")
+    next_id = max((u.get("update_id", 0) for u in updates), default=0) + 1
+    sent = 0
+    t0 = time.perf_counter()
+    for r in range(args.repeat):
+        for u in updates:
+            if r:
+                u = dict(u, update_id=next_id)
+                next_id += 1
+            status = post(args.url, u, args.secret)
+            sent += 1
+            if status != 200:
+                print(f"update_id={u.get('update_id')}: HTTP {status}")
+    dt = time.perf_counter() - t0
+    print(f"Отправлено {sent} апдейтов за {dt:.2f}s ({sent / dt if dt else 0:.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()